@@ -0,0 +1,54 @@
+import hashlib
+import json
+import random
+import time
+
+from utils.hash import ObjectHasher, generate_object_hash_id
+
+
+def legacy_object_hash_id(**kwargs) -> str:
+    payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=True, default=str)
+    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    return digest[:16]
+
+
+def make_face(index: int, dim: int = 64) -> dict:
+    return {
+        "face_type": index % 5,
+        "face_type_name": "Plane",
+        "area": random.random() * 100,
+        "normal": [random.random() for _ in range(3)],
+        "center": [random.random() for _ in range(3)],
+        "embedding": [random.random() for _ in range(dim)],
+        "__fileId__": "3DA2607A",
+        "__index__": str(index),
+    }
+
+
+def timed(name: str, func, count: int) -> float:
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    print(f"{name:<24} {seconds * 1000:9.1f} ms  {count / seconds:12.0f} obj/s")
+    return seconds
+
+
+if __name__ == '__main__':
+    random.seed(0)
+    count = 20000
+    faces = [make_face(i) for i in range(count)]
+
+    compat = ObjectHasher("compat")
+    fast = ObjectHasher("fast")
+    assert all(legacy_object_hash_id(**face) == compat.hash(face) for face in faces[:1000])
+    assert all(generate_object_hash_id(**face) == compat.hash(face) for face in faces[:1000])
+    # 混合类型的列表不能和纯浮点列表撞 ID
+    mixed = [[1.0, 2.0], [1.0, 2], [1, 2.0], [1, 2], [1.0, True], [1.0, 1.0], [True, 1.0], [1.0, None]]
+    for hasher in (compat, fast):
+        mixed_ids = [hasher.hash({"a": value}) for value in mixed]
+        assert len(set(mixed_ids)) == len(mixed), (hasher.mode, mixed_ids)
+
+    baseline = timed("legacy json+sha256", lambda: [legacy_object_hash_id(**face) for face in faces], count)
+    timed("compat", lambda: [compat.hash(face) for face in faces], count)
+    fast_seconds = timed("fast (blake2b)", lambda: [fast.hash(face) for face in faces], count)
+    print(f"fast speedup: {baseline / fast_seconds:.1f}x")
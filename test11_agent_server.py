@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+import traceback
+import uuid
+from contextlib import redirect_stdout
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from test8_agent_demo import KnowledgeGraphAgent
+from tools.execute_cypher import get_query_cache
+from utils.agent_runtime import LatencyRecorder
+from utils.neo4j import close_async_drivers, pool_metrics
+
+# JSON-RPC 2.0 错误码
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+SERVER_BUSY = -32001
+UNKNOWN_SESSION = -32002
+DUPLICATE_SESSION = -32003
+
+
+class RpcError(Exception):
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+@dataclass
+class AgentSession:
+    session_id: str
+    task: str
+    propertys: dict
+    max_loop: int
+    status: str = "queued"
+    results: List[dict] = field(default_factory=list)
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def to_dict(self, with_results: bool = True) -> Dict[str, Any]:
+        data = {
+            "session_id": self.session_id,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if with_results:
+            data["results"] = self.results
+        return data
+
+
+class AgentServer:
+    """Serves many KnowledgeGraphAgent sessions from one warm Assistant and one driver pool.
+
+    At most ``max_sessions`` sessions run at once and at most ``max_queue`` wait
+    for a slot; further requests are rejected with SERVER_BUSY.
+    """
+
+    def __init__(self, max_sessions: int = 8, max_queue: int = 64, session_ttl: float = 3600) -> None:
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self.session_ttl = session_ttl
+        self.sessions: Dict[str, AgentSession] = {}
+        self.latency = LatencyRecorder()
+        self.rejected = 0
+        self._running = 0
+        self._waiting = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # 构造一次 Assistant 与工具，所有会话共享
+        self.bot = KnowledgeGraphAgent(task="", propertys={}, max_loop=0).bot
+        self.methods = {
+            "run": self.rpc_run,
+            "submit": self.rpc_submit,
+            "session": self.rpc_session,
+            "close_session": self.rpc_close_session,
+            "metrics": self.rpc_metrics,
+        }
+
+    def _prune(self) -> None:
+        expired = time.time() - self.session_ttl
+        for session_id, session in list(self.sessions.items()):
+            if session.finished_at is not None and session.finished_at < expired:
+                del self.sessions[session_id]
+
+    def _admit(self, params: Dict[str, Any]) -> AgentSession:
+        if "task" not in params:
+            raise RpcError(INVALID_PARAMS, "'task' is required")
+        if self._running + self._waiting >= self.max_sessions + self.max_queue:
+            self.rejected += 1
+            raise RpcError(SERVER_BUSY, "Too many agent sessions, retry later")
+        self._prune()
+        session_id = params.get("session_id") or uuid.uuid4().hex
+        if session_id in self.sessions:
+            # 不能顶掉同名会话，否则旧任务结束时会清掉新会话的任务
+            raise RpcError(DUPLICATE_SESSION, f"Session {session_id!r} already exists")
+        session = AgentSession(
+            session_id=session_id,
+            task=params["task"],
+            propertys=params.get("propertys", {}),
+            max_loop=int(params.get("max_loop", 10)),
+        )
+        self.sessions[session.session_id] = session
+        self._waiting += 1
+        return session
+
+    async def _execute(self, session: AgentSession) -> AgentSession:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_sessions)
+        try:
+            async with self._slots:
+                self._waiting -= 1
+                self._running += 1
+                session.started_at = time.time()
+                session.status = "running"
+                self.latency.record("queue", session.started_at - session.created_at)
+                try:
+                    agent = KnowledgeGraphAgent(
+                        session.task, session.propertys, max_loop=session.max_loop,
+                        bot=self.bot, step_callback=self.latency.record,
+                    )
+                    session.results = await agent.run(loop=True)
+                    session.status = "done"
+                except Exception as e:
+                    traceback.print_exc()
+                    session.error = str(e)
+                    session.status = "failed"
+                finally:
+                    self._running -= 1
+                    session.finished_at = time.time()
+                    self.latency.record("session", session.finished_at - session.started_at)
+        except asyncio.CancelledError:
+            if session.started_at is None:
+                self._waiting -= 1
+            session.status = "cancelled"
+            raise
+        return session
+
+    async def rpc_run(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        session = await self._execute(self._admit(params))
+        return session.to_dict()
+
+    async def rpc_submit(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        session = self._admit(params)
+        task = asyncio.create_task(self._execute(session))
+        self._tasks[session.session_id] = task
+        task.add_done_callback(lambda done: self._tasks.pop(session.session_id, None)
+                               if self._tasks.get(session.session_id) is done else None)
+        return session.to_dict(with_results=False)
+
+    def _get_session(self, params: Dict[str, Any]) -> AgentSession:
+        session = self.sessions.get(params.get("session_id"))
+        if session is None:
+            raise RpcError(UNKNOWN_SESSION, f"Unknown session {params.get('session_id')!r}")
+        return session
+
+    async def rpc_session(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return self._get_session(params).to_dict()
+
+    async def rpc_close_session(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        session = self._get_session(params)
+        task = self._tasks.get(session.session_id)
+        if task is not None:
+            task.cancel()
+        del self.sessions[session.session_id]
+        return {"session_id": session.session_id, "closed": True}
+
+    async def rpc_metrics(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "running": self._running,
+            "waiting": self._waiting,
+            "rejected": self.rejected,
+            "sessions": len(self.sessions),
+            "latency": self.latency.report(),
+            "pool": pool_metrics(),
+            "query_cache": get_query_cache().stats(),
+        }
+
+    async def dispatch(self, line: str) -> Optional[Dict[str, Any]]:
+        """Handle one JSON-RPC request line; notifications (no id) get no response."""
+        request_id = None
+        try:
+            try:
+                message = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise RpcError(PARSE_ERROR, str(e))
+            if not isinstance(message, dict) or "method" not in message:
+                raise RpcError(INVALID_REQUEST, "Expected a JSON-RPC request object")
+            request_id = message.get("id")
+            method = self.methods.get(message["method"])
+            if method is None:
+                raise RpcError(METHOD_NOT_FOUND, f"Unknown method {message['method']!r}")
+            params = message.get("params") or {}
+            if not isinstance(params, dict):
+                raise RpcError(INVALID_PARAMS, "params must be an object")
+            result = await method(params)
+            if "id" not in message:
+                return None
+            return {"jsonrpc": "2.0", "id": request_id, "result": result}
+        except RpcError as e:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": e.code, "message": e.message}}
+        except Exception as e:
+            traceback.print_exc()
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": INTERNAL_ERROR, "message": str(e)}}
+
+
+async def _serve_lines(server: AgentServer, reader: asyncio.StreamReader, write) -> None:
+    """Read request lines and answer each one as soon as it finishes, out of order."""
+    write_lock = asyncio.Lock()
+    pending = set()
+
+    async def handle(line: str) -> None:
+        response = await server.dispatch(line)
+        if response is not None:
+            async with write_lock:
+                await write(json.dumps(response, ensure_ascii=False, default=str) + "\n")
+
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+        task = asyncio.create_task(handle(line.decode("utf-8")))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
+
+
+async def serve_stdio(server: AgentServer) -> None:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    stdout = sys.__stdout__
+
+    async def write(text: str) -> None:
+        stdout.write(text)
+        stdout.flush()
+
+    # 智能体与工具的 print 改写到 stderr，stdout 只留给 JSON-RPC 响应
+    with redirect_stdout(sys.stderr):
+        await _serve_lines(server, reader, write)
+
+
+async def serve_tcp(server: AgentServer, host: str, port: int) -> None:
+    async def on_connect(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        async def write(text: str) -> None:
+            writer.write(text.encode("utf-8"))
+            await writer.drain()
+
+        try:
+            await _serve_lines(server, reader, write)
+        finally:
+            writer.close()
+
+    tcp_server = await asyncio.start_server(on_connect, host, port)
+    print(f"agent server listening on {host}:{port}", file=sys.stderr)
+    async with tcp_server:
+        await tcp_server.serve_forever()
+
+
+async def serve(args) -> None:
+    server = AgentServer(max_sessions=args.max_sessions, max_queue=args.max_queue, session_ttl=args.session_ttl)
+    try:
+        if args.transport == "stdio":
+            await serve_stdio(server)
+        else:
+            await serve_tcp(server, args.host, args.port)
+    finally:
+        await close_async_drivers()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Line-delimited JSON-RPC server for KnowledgeGraphAgent sessions.")
+    parser.add_argument("--transport", choices=("stdio", "tcp"), default="stdio")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-sessions", type=int, default=8, help="Sessions running at the same time")
+    parser.add_argument("--max-queue", type=int, default=64, help="Sessions waiting for a slot before rejecting")
+    parser.add_argument("--session-ttl", type=float, default=3600, help="Seconds a finished session is kept")
+    args = parser.parse_args()
+
+    asyncio.run(serve(args))
@@ -0,0 +1,45 @@
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+
+from utils.neo4j import close_async_drivers
+
+
+async def replay_once(module, task: str, propertys: dict, max_loop: int):
+    agent = module.KnowledgeGraphAgent(task, propertys, max_loop=max_loop)
+    try:
+        return await agent.run(loop=True)
+    finally:
+        await close_async_drivers()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Record an agent session once (--mode record), then replay it at local speed (--mode replay)."
+    )
+    parser.add_argument("--agent", default="test8_agent_demov2", help="Module that defines KnowledgeGraphAgent")
+    parser.add_argument("--input", required=True, help='JSON file with {"task": ..., "propertys": ..., "max_loop": ...}')
+    parser.add_argument("--mode", choices=("record", "replay", "cache"), default="replay")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # 缓存模式在 get_llm_cache() 首次调用时读取
+    os.environ["LLM_CACHE_MODE"] = args.mode
+    module = importlib.import_module(args.agent)
+    with open(args.input, "r", encoding="utf-8") as f:
+        case = json.load(f)
+
+    timings = []
+    for _ in range(1 if args.mode == "record" else args.repeat):
+        start = time.perf_counter()
+        results = asyncio.run(replay_once(module, case["task"], case["propertys"], case.get("max_loop", 10)))
+        timings.append(time.perf_counter() - start)
+        print(f"{len(results)} steps in {timings[-1]:.3f}s")
+    print(f"{args.mode}: best {min(timings):.3f}s, mean {sum(timings) / len(timings):.3f}s")
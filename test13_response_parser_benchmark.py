@@ -0,0 +1,150 @@
+import ast
+import json
+import random
+import re
+import time
+
+from utils.agent_runtime import STEP_KEYS
+from utils.jsonhelper import response2json
+
+
+def legacy_response2json(response):
+    """The previous replace/regex/literal_eval cascade, kept for comparison."""
+    normalized = (
+        response.replace("None", "null")
+        .replace("True", "true")
+        .replace("False", "false")
+        .replace("{{", "{")
+        .replace("}}", "}")
+    )
+    match = re.search(r"```json(.*?)```", normalized, re.S)
+    if match:
+        return json.loads(match.group(1).strip())
+    try:
+        return json.loads(normalized)
+    except json.JSONDecodeError:
+        try:
+            return ast.literal_eval(normalized)
+        except (ValueError, SyntaxError, MemoryError):
+            trimmed = normalized.strip()
+            if trimmed.startswith("{{") and trimmed.endswith("}}"):
+                trimmed = trimmed[1:-1]
+            if trimmed.startswith('"') and trimmed.endswith('"'):
+                trimmed = trimmed[1:-1]
+            try:
+                return json.loads(trimmed.replace('\'"', '"'))
+            except Exception as final_err:
+                raise ValueError("无法解析响应为 JSON") from final_err
+
+
+def load_steps(path: str = "data.json") -> list:
+    """Agent step objects rebuilt from a recorded session: reason, tool call and the echoed tool result."""
+    with open(path, "r", encoding="utf-8") as f:
+        messages = json.load(f)
+    steps = []
+    reason = ""
+    for index, message in enumerate(messages):
+        if message.get("function_call"):
+            call = message["function_call"]
+            following = messages[index + 1] if index + 1 < len(messages) else {}
+            steps.append({
+                "reason": reason,
+                "tool_name": call["name"],
+                "call_paras": json.loads(call["arguments"] or "{}"),
+                "status_update": "IN_PROGRESS",
+                "observation": following.get("content", ""),
+            })
+        elif message.get("role") == "assistant":
+            reason = message.get("content") or ""
+    return steps
+
+
+def _python_repr(step: dict) -> str:
+    return repr({**step, "done": False, "next": None})
+
+
+_STRING_OR_BRACE = re.compile(r'"(?:\\.|[^"\\])*"|[{}]')
+
+
+def _doubled(text: str) -> str:
+    """Double the structural braces only, as an echo of the prompt template does."""
+    return _STRING_OR_BRACE.sub(lambda m: m.group() * 2 if m.group() in "{}" else m.group(), text)
+
+
+def build_corpus(steps: list) -> list:
+    """(shape, response text, expected object) triples in the shapes models actually return."""
+    corpus = []
+    for step in steps:
+        plain = json.dumps(step, ensure_ascii=False, indent=2)
+        corpus.append(("plain", plain, step))
+        corpus.append(("markdown", f"好的，下面是下一步：\n```json\n{plain}\n```\n以上。", step))
+        corpus.append(("echo+json", f"{step['observation'][:2000]}\n\n{plain}", step))
+        corpus.append(("doubled", _doubled(plain), step))
+        corpus.append(("python", _python_repr(step), {**step, "done": False, "next": None}))
+        with_literals = {**step, "reason": f"None of the results are True matches: {step['reason']}"}
+        corpus.append(("literal text", json.dumps(with_literals, ensure_ascii=False), with_literals))
+        # 模板里的尾逗号
+        trailing = plain[:plain.rindex("}")].rstrip() + ",\n}"
+        corpus.append(("trailing comma", trailing, step))
+        # 整段被再编码成 JSON 字符串；内层转义过的 {} 不能当成结果
+        corpus.append(("re-encoded", json.dumps(json.dumps(step, ensure_ascii=False), ensure_ascii=False), step))
+    return corpus
+
+
+def fuzz(corpus: list, rounds: int = 2000, seed: int = 0) -> None:
+    """Random cuts and insertions must either parse or raise ValueError, never anything else."""
+    rng = random.Random(seed)
+    noise = ['{', '}', '[', ']', '"', "'", '\\', ',', '{{', '}}', 'None', '```', '\n']
+    parsed = rejected = 0
+    for _ in range(rounds):
+        _, text, _ = rng.choice(corpus)
+        for _ in range(rng.randint(1, 4)):
+            position = rng.randrange(len(text) + 1)
+            if rng.random() < 0.5:
+                text = text[:position] + rng.choice(noise) + text[position:]
+            else:
+                text = text[:position]
+        try:
+            response2json(text, expect_keys=STEP_KEYS)
+            parsed += 1
+        except ValueError:
+            rejected += 1
+    print(f"fuzz: {rounds} mutated responses, {parsed} parsed, {rejected} rejected with ValueError")
+
+
+def timed(func, samples: list, repeat: int = 20):
+    """Total seconds for ``repeat`` passes and the number of wrong or failed parses per pass."""
+    wrong = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text, expected in samples:
+            try:
+                wrong += func(text) != expected
+            except ValueError:
+                wrong += 1
+    return time.perf_counter() - start, wrong // repeat
+
+
+def parse_step(text: str):
+    return response2json(text, expect_keys=STEP_KEYS)
+
+
+if __name__ == '__main__':
+    corpus = build_corpus(load_steps())
+
+    wrong = [text for _, text, expected in corpus if parse_step(text) != expected]
+    print(f"corpus: {len(corpus)} responses, {len(wrong)} mismatches")
+    assert not wrong, wrong[0][:200]
+
+    fuzz(corpus)
+
+    print(f"{'shape':<16} {'legacy ms':>10} {'wrong':>6} {'single-pass ms':>15} {'wrong':>6}")
+    totals = [0.0, 0.0]
+    for shape in dict.fromkeys(shape for shape, _, _ in corpus):
+        samples = [(text, expected) for name, text, expected in corpus if name == shape]
+        legacy_seconds, legacy_wrong = timed(legacy_response2json, samples)
+        seconds, wrong = timed(parse_step, samples)
+        totals[0] += legacy_seconds
+        totals[1] += seconds
+        print(f"{shape:<16} {legacy_seconds * 1000:10.1f} {legacy_wrong:6d} {seconds * 1000:15.1f} {wrong:6d}")
+    print(f"overall speedup: {totals[0] / totals[1]:.1f}x")
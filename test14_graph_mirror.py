@@ -0,0 +1,158 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from test9_ingest_dir import _prepare_part, find_part_sources
+from utils.graph_mirror import SNAPSHOT_NODE_QUERY, GraphMirror
+from utils.manifest import INGEST_SOURCE, IngestManifest, PartRecord
+from utils.multi_graph import build_multi_graph_rows
+from utils.neo4j import connect_neo4j
+
+CHAIN = ["BELONGS_TO_FEATURE", "ASSIGNED_TO_PROCESS", "INCLUDES_OPERATION", "USES_TOOL"]
+
+CHAIN_QUERY = """
+MATCH (s:Surface) WHERE s.__id__ IN $ids
+MATCH (s)-[:BELONGS_TO_FEATURE]->(mf:MachiningFeature)-[:ASSIGNED_TO_PROCESS]->(p:ProcessUnit)
+      -[:INCLUDES_OPERATION]->(o:Operation)
+RETURN s.__id__, mf.__id__, p.__id__, o.__id__
+"""
+
+
+def synthetic_part(faces: int = 2000, features: int = 200, processes: int = 40) -> dict:
+    """A multi-graph payload with the same sections as the ingestion JSON."""
+    return {
+        "face_dict": {str(i): {"face_type": i % 5, "face_type_name": "Plane", "area": random.random()}
+                      for i in range(faces)},
+        "edge_dict": {str(i): {"curve_type": 1, "curve_type_name": "Line",
+                               "edge_idx": [random.randrange(faces), random.randrange(faces)]}
+                      for i in range(faces * 2)},
+        "features": [{"featureType": "Hole", "index": i} for i in range(features)],
+        "feature_index": [[i, (i + 1) % features] for i in range(features)],
+        "face_feature_map": {str(i): random.randrange(features) for i in range(faces)},
+        "processes": [{"index": i, "typeName": "Drill", "operationNames": [f"OP{i}"]} for i in range(processes)],
+        "process_index": [[i, i + 1] for i in range(processes - 1)],
+        "feature_process": {str(i): random.randrange(processes) for i in range(features)},
+    }
+
+
+class _FakeGraph:
+    """Just enough of a driver for ``GraphMirror.sync``: a version node and per-file Surface nodes."""
+
+    def __init__(self) -> None:
+        self.version = 0
+        self.source = None
+        self.files = {}
+
+    def session(self, **kwargs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def run(self, query: str, params=None, **kwargs):
+        if "updatedBy" in query:
+            return _FakeResult([{"version": self.version, "source": self.source}])
+        file_ids = (params or {}).get("file_ids")
+        wanted = [file_id for file_id in self.files if file_ids is None or file_id in file_ids]
+        if query != SNAPSHOT_NODE_QUERY:
+            return _FakeResult([])
+        return _FakeResult([{"key": key, "label": "Surface", "file_id": file_id, "props": {}}
+                            for file_id in wanted for key in self.files[file_id]])
+
+
+class _FakeResult(list):
+    def single(self):
+        return self[0] if self else None
+
+
+def check_replaced_part() -> None:
+    """A part whose STP changed is written under a new file_id; the incremental sync must drop the old one."""
+    graph = _FakeGraph()
+    path = os.path.join(tempfile.mkdtemp(), "manifest.sqlite")
+    manifest = IngestManifest(path)
+    graph.files = {"F1": ["s1"]}
+    manifest.record(PartRecord("part", "F1", "P1", "h1", "v"), {})
+    graph.version, graph.source = 1, INGEST_SOURCE
+    mirror = GraphMirror()
+    mirror.sync(graph, manifest)
+    assert mirror.nodes() == ["s1"], mirror.nodes()
+
+    time.sleep(0.01)
+    graph.files = {"F2": ["s2"]}
+    manifest.record(PartRecord("part", "F2", "P1", "h2", "v"), {})
+    graph.version += 1
+    refreshed = mirror.sync(graph, manifest)
+    assert refreshed == ["F1", "F2"], refreshed
+    assert mirror.nodes() == ["s2"], mirror.nodes()
+    os.remove(path)
+    print("incremental sync drops replaced parts: ok")
+
+
+def timed(name: str, func, repeat: int = 200):
+    result = func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    print(f"{name:<28} {(time.perf_counter() - start) / repeat * 1000:8.3f} ms")
+    return result
+
+
+if __name__ == '__main__':
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Load the in-process graph mirror and time neighbourhood queries.")
+    parser.add_argument("--source", choices=("synthetic", "json", "neo4j"), default="synthetic")
+    parser.add_argument("--source-dir", default=r"E:\dataset\cam\251225test\process_graph")
+    parser.add_argument("--json-dir", default=r"E:\dataset\cam\251225test\mynet_multi_kgv2")
+    parser.add_argument("--parts", type=int, default=20, help="Synthetic parts to generate")
+    args = parser.parse_args()
+
+    check_replaced_part()
+
+    random.seed(0)
+    mirror = GraphMirror()
+    driver = None
+    start = time.perf_counter()
+    if args.source == "synthetic":
+        for part in range(args.parts):
+            file_id = f"{part:08X}"
+            mirror.load_rows(file_id, build_multi_graph_rows(file_id, synthetic_part()), prt_file_id=f"P{file_id}")
+    elif args.source == "json":
+        for source in find_part_sources(Path(args.source_dir), Path(args.json_dir)):
+            part = _prepare_part(source)
+            mirror.load_rows(part.file_id, part.rows, prt_file_id=part.record.prt_file_id)
+    else:
+        driver = connect_neo4j(init=False)
+        mirror.sync(driver)
+    print(f"Loaded in {time.perf_counter() - start:.2f}s: {mirror.stats()}")
+
+    surfaces = mirror.nodes(label="Surface")
+    seeds = random.sample(surfaces, min(3, len(surfaces)))
+    timed("1-hop neighbors", lambda: mirror.neighbors(seeds[0], direction="both"))
+    hops = timed("3-hop (Surface seeds)", lambda: mirror.k_hop(seeds, 3))
+    print(f"  reached {len(hops)} nodes")
+    paths = timed("chain paths", lambda: mirror.paths(seeds, CHAIN[:3]))
+    print(f"  {len(paths)} Surface->MachiningFeature->ProcessUnit->Operation paths")
+    timed("feature adjacency 2-hop", lambda: mirror.k_hop(
+        [paths[0][1]] if paths else [], 2, ["ADJACENT_MFEATURE"], direction="both"))
+    part_surfaces = [node for node in surfaces if mirror.node(node).get("__fileId__") == mirror.node(seeds[0]).get("__fileId__")]
+    if len(part_surfaces) > 1:
+        route = timed("shortest path", lambda: mirror.shortest_path(part_surfaces[0], part_surfaces[-1], max_hops=10))
+        print(f"  {len(route or []) - 1} hops")
+    timed("label filter", lambda: mirror.nodes(label="ProcessUnit"), repeat=20)
+
+    if driver is not None:
+        def neo4j_chain():
+            with driver.session() as session:
+                return session.run(CHAIN_QUERY, ids=seeds).values()
+
+        timed("chain paths (Neo4j)", neo4j_chain, repeat=20)
+        driver.close()
@@ -0,0 +1,64 @@
+import json
+import os
+import random
+import tempfile
+
+from utils.json_stream import STREAM_SECTIONS, iter_sections
+
+CASES = [
+    {"features": 0.1, "x": 1},
+    {"face_dict": {"0": 0.1}},
+    {"face_dict": {"0": -2.5e10, "1": 1e-7, "2": 12345678901234567890}},
+    {"edge_dict": [{"edge_idx": [1, 2]}, -0.0, 3.25E+2], "feature_index": [[0, 1]]},
+    {"face_dict": {}, "edge_dict": [], "flag": True, "empty": None, "name": "面\"1\""},
+]
+
+
+def random_case(rng: random.Random, faces: int = 12) -> dict:
+    def number():
+        return rng.choice([rng.randint(-10 ** 6, 10 ** 6), rng.uniform(-1e3, 1e3), rng.random() * 10 ** rng.randint(-12, 12)])
+
+    return {
+        "face_dict": {str(i): {"area": number(), "normal": [number() for _ in range(3)]} for i in range(faces)},
+        "edge_dict": {str(i): {"edge_idx": [rng.randrange(faces), rng.randrange(faces)], "length": number()}
+                      for i in range(faces)},
+        "features": [{"index": i, "depth": number()} for i in range(3)],
+        "scale": number(),
+    }
+
+
+def collect(path: str, chunk_size: int) -> dict:
+    """Rebuild the document from ``iter_sections`` so it can be compared with ``json.load``."""
+    document = {}
+    for section, key, value in iter_sections(path, chunk_size=chunk_size):
+        if key is None:
+            document[section] = value
+        elif isinstance(key, int):
+            document.setdefault(section, []).append(value)
+        else:
+            document.setdefault(section, {})[key] = value
+    return document
+
+
+def check(case: dict, indent=None) -> int:
+    """Split the serialized case at every chunk size; returns how many splits were checked."""
+    text = json.dumps(case, ensure_ascii=False, indent=indent)
+    # 空的流式段不产生任何条目
+    expected = {section: value for section, value in json.loads(text).items()
+                if value or section not in STREAM_SECTIONS}
+    with tempfile.NamedTemporaryFile("w", suffix=".json", encoding="utf-8", delete=False) as f:
+        f.write(text)
+    try:
+        for chunk_size in range(1, len(text) + 2):
+            got = collect(f.name, chunk_size)
+            assert got == expected, f"chunk_size={chunk_size}: {got} != {expected}"
+    finally:
+        os.remove(f.name)
+    return len(text) + 1
+
+
+if __name__ == '__main__':
+    rng = random.Random(0)
+    checked = sum(check(case) + check(case, indent=2) for case in CASES)
+    checked += sum(check(random_case(rng)) for _ in range(5))
+    print(f"json stream: {checked} chunk splits match json.loads")
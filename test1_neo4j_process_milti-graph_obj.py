@@ -8,7 +8,9 @@ from entity.part import Part
 from entity.process import Process
 
 from utils.hash import generate_unique_id, file_hash
+from utils.graph_version import bump_graph_version
 from utils.neo4j import connect_neo4j
+from utils.schema import ensure_schema
 
 
 
@@ -206,7 +208,7 @@ if __name__ == "__main__":
     # init = False
     init = True
     driver = connect_neo4j(init=init)
-    # _ensure_unique_constraints(driver)
+    ensure_schema(driver)
 
     hashfile=r"E:\dataset\cam\251225test\step\3DA2607A.stp"
     hash_value = file_hash(hashfile)
@@ -386,6 +388,7 @@ if __name__ == "__main__":
             if feature_id and process_id:
                 session.execute_write(_link_feature_process, part.part_id, feature_id, process_id)
 
+    bump_graph_version(driver, source="test1_neo4j_process_milti-graph_obj")
     driver.close()
 
 
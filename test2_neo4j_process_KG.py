@@ -4,7 +4,9 @@ import pathlib
 from typing import List
 
 from utils.hash import generate_unique_id, file_hash
+from utils.graph_version import bump_graph_version
 from utils.neo4j import connect_neo4j
+from utils.schema import ensure_schema
 from entity.part import Part
 
 
@@ -258,7 +260,7 @@ if __name__ == "__main__":
     # init = False
     init = False
     driver = connect_neo4j(init=init)
-    # _ensure_unique_constraints(driver)
+    ensure_schema(driver)
     hashfile = pathlib.Path(r"E:\dataset\cam\251225test\step\3DA2607A.stp")
     hash_value = file_hash(str(hashfile))
     print(f"File hash for {hashfile}: {hash_value}")
@@ -467,4 +469,5 @@ if __name__ == "__main__":
         nCGroups = para_dict.get('nCGroups', {})
 
 
+    bump_graph_version(driver, source="test2_neo4j_process_KG")
     driver.close()
\ No newline at end of file
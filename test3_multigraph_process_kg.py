@@ -1,7 +1,9 @@
 import json
 import pathlib
 from utils.hash import  file_hash
+from utils.graph_version import bump_graph_version
 from utils.neo4j import connect_neo4j
+from utils.schema import ensure_schema
 
 from entity.part import Part
 
@@ -58,7 +60,7 @@ if __name__ == "__main__":
     # init = False
     init = False
     driver = connect_neo4j(init=init)
-    # _ensure_unique_constraints(driver)
+    ensure_schema(driver)
 
     hashfile=r"E:\dataset\cam\251225test\step\3DA2607A.stp"
     hash_value = file_hash(hashfile)
@@ -112,5 +114,6 @@ if __name__ == "__main__":
 
 
 
+    bump_graph_version(driver, source="test3_multigraph_process_kg")
     driver.close()
 
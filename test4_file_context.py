@@ -5,8 +5,10 @@ from typing import Dict, Optional
 
 from dotenv import load_dotenv
 
-from utils.hash import file_hash
+from utils.hash import cached_file_hash, hash_files
+from utils.graph_version import bump_graph_version
 from utils.neo4j import connect_neo4j
+from utils.schema import ensure_schema
 
 
 def _collect_file_info(file_path: Path) -> Optional[Dict[str, object]]:
@@ -16,7 +18,7 @@ def _collect_file_info(file_path: Path) -> Optional[Dict[str, object]]:
         return None
 
     try:
-        file_digest = file_hash(str(file_path))
+        file_digest = cached_file_hash(file_path)
     except OSError:
         return None
 
@@ -75,6 +77,7 @@ if __name__ == "__main__":
     load_dotenv()
     init = False
     driver = connect_neo4j(init=init)
+    ensure_schema(driver)
 
     file_dir = Path(r"E:\dataset\cam\260108test\process_graph")
     file_stem = "cs1"
@@ -82,10 +85,11 @@ if __name__ == "__main__":
     file_stem = "3DA2607A"
 
     candidate_suffixes = [".pdf", ".stp", ".prt"]
+    candidates = [file_dir / f"{file_stem}{suffix}" for suffix in candidate_suffixes]
+    hash_files(candidate for candidate in candidates if candidate.exists())
     file_infos = []
 
-    for suffix in candidate_suffixes:
-        candidate = file_dir / f"{file_stem}{suffix}"
+    for candidate in candidates:
         info = _collect_file_info(candidate)
         if info:
             file_infos.append(info)
@@ -95,4 +99,5 @@ if __name__ == "__main__":
         for info in file_infos:
             session.execute_write(_upsert_file_variant, file_stem, info)
 
+    bump_graph_version(driver, source="test4_file_context")
     driver.close()
\ No newline at end of file
@@ -5,8 +5,10 @@ from typing import List
 
 from dotenv import load_dotenv
 
-from utils.hash import generate_unique_id, file_hash,generate_object_hash_id
+from utils.hash import cached_file_hash, generate_unique_id, file_hash,generate_object_hash_id
+from utils.graph_version import bump_graph_version
 from utils.neo4j import connect_neo4j
+from utils.schema import ensure_schema
 from entity.part import Part
 from entity.operation_type import OperationType
 
@@ -242,10 +244,10 @@ if __name__ == "__main__":
     # init = False
     init = False
     driver = connect_neo4j(init=init)
-    # _ensure_unique_constraints(driver)
+    ensure_schema(driver)
 
     hashfile = pathlib.Path(r"E:\dataset\cam\251225test\process_graph\3DA2607A.prt")
-    hash_value = file_hash(str(hashfile))
+    hash_value = cached_file_hash(hashfile)
     print(f"File hash for {hashfile}: {hash_value}")
 
     json_file = pathlib.Path(r"E:\dataset\cam\251225test\prt_kg_json\3DA2607A.json")
@@ -452,4 +454,5 @@ if __name__ == "__main__":
         nCGroups = para_dict.get('nCGroups', {})
 
 
+    bump_graph_version(driver, source="test5_neo4j_process_KG_type")
     driver.close()
\ No newline at end of file
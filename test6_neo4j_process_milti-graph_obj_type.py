@@ -9,22 +9,19 @@ from entity.feature import MachiningFeature
 from entity.part import Part
 from entity.process import Process
 
-from utils.hash import generate_unique_id, file_hash,generate_object_hash_id
+from utils.bulk_writer import BulkWriter, DEFAULT_BATCH_SIZE
+from utils.hash import cached_file_hash, generate_unique_id, file_hash,generate_object_hash_id
+from utils.multi_graph import (curve_row, face_row, feature_row, process_row, write_multi_graph,
+                               write_multi_graph_stream)
+from utils.graph_version import bump_graph_version
 from utils.neo4j import connect_neo4j
+from utils.schema import ensure_schema
 
 
 
 def _insert_face(tx, file_id: str, face_index: str, face_payload: dict) -> str:
     """Create or update a face node with a random hash identifier."""
-    props = dict(face_payload)
-    props["__fileId__"] = file_id
-    props["__index__"] = face_index
-    hash_value = generate_object_hash_id(**props)
-    props["__hash__"] = hash_value
-    identifier = f"Surface_{hash_value}"
-
-    type_idx = props.get("face_type")
-    type_name = props.get("face_type_name")
+    row = face_row(file_id, face_index, face_payload)
     tx.run(
         """
         MATCH (f:File {Hash: $file_id})
@@ -35,29 +32,18 @@ def _insert_face(tx, file_id: str, face_index: str, face_payload: dict) -> str:
         MERGE (s)-[:OF_SURFACE_TYPE]->(st)
         """,
         file_id=file_id,
-        type_idx=type_idx,
-        type_name=type_name,
+        type_idx=row["type_idx"],
+        type_name=row["type_name"],
         part_id=file_id,
-        identifier=identifier,
-        props=props,
+        identifier=row["identifier"],
+        props=row["props"],
     )
-    return identifier
+    return row["identifier"]
 
 
 def _insert_curve(tx, file_id: str, curve_key: str, curve_payload: dict) -> str:
     """Create or update a curve node with a random hash identifier."""
-    props = dict(curve_payload)
-    props["__fileId__"] = file_id
-    props["__index__"] = curve_key
-    # if "edge_idx" in props:
-    #     del props["edge_idx"]
-
-    hash_value = generate_object_hash_id(**props)
-    props["__hash__"] = hash_value
-    identifier= f"Curve_{hash_value}"
-    type_idx= props.get("curve_type")
-    type_name = props.get("curve_type_name")
-
+    row = curve_row(file_id, curve_key, curve_payload)
     tx.run(
         """
         MATCH (f:File {Hash: $file_id})
@@ -68,12 +54,12 @@ def _insert_curve(tx, file_id: str, curve_key: str, curve_payload: dict) -> str:
         MERGE (c)-[:OF_CURVE_TYPE]->(ct)
         """,
         file_id=file_id,
-        type_idx=type_idx,
-        type_name=type_name,
-        identifier=identifier,
-        props=props,
+        type_idx=row["type_idx"],
+        type_name=row["type_name"],
+        identifier=row["identifier"],
+        props=row["props"],
     )
-    return identifier
+    return row["identifier"]
 
 
 def _link_curve_surface(tx, file_id: str, curve_id: str, surface_id: str) -> None:
@@ -90,20 +76,7 @@ def _link_curve_surface(tx, file_id: str, curve_id: str, surface_id: str) -> Non
 
 
 def _insert_machining_features(tx, file_id: str, feature, feature_index) -> str:
-
-    props =feature
-    # if 'faceTags' in props:
-    #     del props['faceTags']
-    if 'index' in props:
-        del props['index']
-
-    props['__fileId__']=file_id
-    props['__index__']=feature_index
-    hash_value = generate_object_hash_id(**props)
-    props['__hash__']=hash_value
-    identifier = f"MachiningFeature_{hash_value}"
-    type_name = props.get("featureType")
-
+    row = feature_row(file_id, feature, feature_index)
     tx.run(
         """
         MERGE (mft:MachiningFeatureType {name: $type_name})
@@ -112,11 +85,11 @@ def _insert_machining_features(tx, file_id: str, feature, feature_index) -> str:
         MERGE (mf)-[:OF_FEATURE_TYPE]->(mft)
         """,
         file_id=file_id,
-        type_name=type_name,
-        identifier=identifier,
-        props=props,
+        type_name=row["type_name"],
+        identifier=row["identifier"],
+        props=row["props"],
     )
-    return identifier
+    return row["identifier"]
 
 
 def _link_adjacent_features(tx, file_id: str, src_id: str, tar_id: str) -> None:
@@ -145,18 +118,7 @@ def _link_surface_feature(tx, file_id: str, surface_id: str, feature_id: str) ->
     )
 
 def _insert_process(tx, file_id: str, process) -> str:
-    props=process
-    type_name= props['typeName']
-    p_indx=0
-    if 'index' in props:
-        p_indx= props['index']
-        del props['index']
-    props['__index__']=p_indx
-    props['__fileId__']=file_id
-    hash_value = generate_object_hash_id(**props)
-    props['__hash__']=hash_value
-    identifier = f"ProcessUnit_{hash_value}"
-
+    row, p_indx = process_row(file_id, process)
     tx.run(
         """
         MERGE (pt:ProcessUnitType {name: $type_name})
@@ -165,11 +127,11 @@ def _insert_process(tx, file_id: str, process) -> str:
         MERGE (p)-[:OF_PROCESS_UNIT_TYPE]->(pt)
         """,
         file_id=file_id,
-        type_name=type_name,
-        identifier=identifier,
-        props=props,
+        type_name=row["type_name"],
+        identifier=row["identifier"],
+        props=row["props"],
     )
-    return identifier,p_indx
+    return row["identifier"],p_indx
 
 
 def _link_process_adjacent(tx, file_id: str, left_id: str, right_id: str) -> None:
@@ -220,206 +182,222 @@ if __name__ == "__main__":
 
     init = False
     # init = True
+    use_bulk = True
+    # 超大 JSON：面/边逐条读取并分批写入，不整体载入内存
+    use_stream = False
+    batch_size = DEFAULT_BATCH_SIZE
     driver = connect_neo4j(init=init)
-    # _ensure_unique_constraints(driver)
+    ensure_schema(driver)
     # file_dir = Path(r"E:\dataset\cam\251225test\process_graph")
     # file_stem = "3DA2607A"
 
 
     hashfile=r"E:\dataset\cam\251225test\process_graph\3DA2607A.stp"
-    hash_value = file_hash(hashfile)
+    hash_value = cached_file_hash(hashfile)
 
     prtfile=r"E:\dataset\cam\251225test\process_graph\3DA2607A.prt"
-    prt_file_id = file_hash(prtfile)
+    prt_file_id = cached_file_hash(prtfile)
 
     json_file = pathlib.Path(r"E:\dataset\cam\251225test\mynet_multi_kgv2\3DA2607A.json")
     para_dict = 0
-    with open(json_file, 'r',encoding='utf-8') as file:
-        para_dict = json.load(file)
+    if not use_stream:
+        with open(json_file, 'r',encoding='utf-8') as file:
+            para_dict = json.load(file)
 
     with driver.session() as session:
         file_id=hash_value
 
-        surfaces = para_dict['face_dict']
-        surface_ids = {}
-
-        for face_key, face_payload in surfaces.items():
+        if use_stream:
+            writer = BulkWriter(session, batch_size=batch_size)
+            write_multi_graph_stream(writer, file_id, prt_file_id, json_file)
+            writer.report()
+        elif use_bulk:
+            # 按节点/关系类型分组，UNWIND 分批写入
+            writer = BulkWriter(session, batch_size=batch_size)
+            write_multi_graph(writer, file_id, prt_file_id, para_dict)
+            writer.report()
+        else:
+            surfaces = para_dict['face_dict']
+            surface_ids = {}
+
+            for face_key, face_payload in surfaces.items():
+                '''
+                  "face_dict": {
+                    "0": {
+                        "face_vector": [
+                            -0.0,
+                            -0.0,
+                            -1.0
+                        ],
+                        "face_type": "plane",
+                        "face_dimless": "CONVEX",
+                        "area": 4789.049,
+                        "closed_u": false,
+                        "closed_v": false,
+                        "feature_type": 0
+                    },
+                '''
+                identifier = session.execute_write(_insert_face, file_id, face_key, face_payload)
+                print(f"Upsert face {face_key} succeed with Id {identifier}!")
+                surface_ids[face_key] = identifier
+
+            curves = para_dict.get('edge_dict', {})
+            for curve_key, curve_payload in curves.items():
+                '''
+                "edge_dict": {
+                    "0": {
+                        "edge_idx": [
+                            0,
+                            7
+                        ],
+                        "edge_vector": [
+                            -1.0,
+                            0.0,
+                            0.0
+                        ],
+                        "edge_dimless": "CONVEX",
+                        "length": 60.0,
+                        "closed": false,
+                        "edge_type": "line"
+                    },
+                '''
+                curve_id = session.execute_write(_insert_curve, file_id, curve_key, curve_payload)
+                print(f"Upsert curve {curve_key} succeed with Id {curve_id}!")
+
+                linked_surfaces = curve_payload.get('edge_idx', [])
+                if isinstance(linked_surfaces, list):
+                    for surface_index in linked_surfaces:
+                        surface_key = str(surface_index)
+                        surface_id = surface_ids.get(surface_key)
+                        if surface_id is None:
+                            surface_id = surface_ids.get(surface_index)
+                        if surface_id:
+                            session.execute_write(_link_curve_surface, file_id, curve_id, surface_id)
+
+            mf_idx_map={}
+            machining_features=para_dict.get('features', [])
             '''
-              "face_dict": {
-                "0": {
-                    "face_vector": [
-                        -0.0,
-                        -0.0,
-                        -1.0
+             "features": [
+                {
+                    "index": 0,
+                    "faceTags": [ # drop face indices
+                        27108
                     ],
-                    "face_type": "plane",
-                    "face_dimless": "CONVEX",
-                    "area": 4789.049,
-                    "closed_u": false,
-                    "closed_v": false,
-                    "feature_type": 0
+                    "directionsCode": 3,
+                    "featureType": "OpenPocket"
                 },
+        
             '''
-            identifier = session.execute_write(_insert_face, file_id, face_key, face_payload)
-            print(f"Upsert face {face_key} succeed with Id {identifier}!")
-            surface_ids[face_key] = identifier
+            for fe_id, feature in enumerate(machining_features):
+                feature_identifier = session.execute_write(_insert_machining_features, file_id, feature,fe_id)
+                mf_idx_map[fe_id]= feature_identifier
 
-        curves = para_dict.get('edge_dict', {})
-        for curve_key, curve_payload in curves.items():
-            '''
-            "edge_dict": {
-                "0": {
-                    "edge_idx": [
-                        0,
-                        7
-                    ],
-                    "edge_vector": [
-                        -1.0,
-                        0.0,
-                        0.0
-                    ],
-                    "edge_dimless": "CONVEX",
-                    "length": 60.0,
-                    "closed": false,
-                    "edge_type": "line"
-                },
+
+            machining_feature_edges = para_dict.get('feature_index', [])
+            surface_feature_map = para_dict.get('face_feature_map', {})
             '''
-            curve_id = session.execute_write(_insert_curve, file_id, curve_key, curve_payload)
-            print(f"Upsert curve {curve_key} succeed with Id {curve_id}!")
-
-            linked_surfaces = curve_payload.get('edge_idx', [])
-            if isinstance(linked_surfaces, list):
-                for surface_index in linked_surfaces:
-                    surface_key = str(surface_index)
-                    surface_id = surface_ids.get(surface_key)
-                    if surface_id is None:
-                        surface_id = surface_ids.get(surface_index)
-                    if surface_id:
-                        session.execute_write(_link_curve_surface, file_id, curve_id, surface_id)
-
-        mf_idx_map={}
-        machining_features=para_dict.get('features', [])
-        '''
-         "features": [
-            {
-                "index": 0,
-                "faceTags": [ # drop face indices
-                    27108
+            "feature_index": [
+                [
+                    1,
+                    10
                 ],
-                "directionsCode": 3,
-                "featureType": "OpenPocket"
-            },
-        
-        '''
-        for fe_id, feature in enumerate(machining_features):
-            feature_identifier = session.execute_write(_insert_machining_features, file_id, feature,fe_id)
-            mf_idx_map[fe_id]= feature_identifier
-
-
-        machining_feature_edges = para_dict.get('feature_index', [])
-        surface_feature_map = para_dict.get('face_feature_map', {})
-        '''
-        "feature_index": [
-            [
-                1,
-                10
-            ],
-
-        "face_feature_map": {
-            "0": 1,
-            "1": 12,
-            "2": 2,
-        '''
-        for src_feature,tar_fe in machining_feature_edges:
-            if src_feature == tar_fe:
-                continue
-            session.execute_write(_link_adjacent_features, file_id, mf_idx_map[src_feature], mf_idx_map[tar_fe])
-
-        for surface_key, feature_idx in surface_feature_map.items():
-            feature_id = mf_idx_map.get(feature_idx)
-            surface_id = surface_ids.get(surface_key)
-            if surface_id is None:
-                surface_id = surface_ids.get(int(surface_key))
-            if surface_id and feature_id:
-                session.execute_write(_link_surface_feature, file_id, surface_id, feature_id)
-
-        processes = para_dict.get('processes', [])
-        process_index_map = {}
-        process_operation_map = {}
+
+            "face_feature_map": {
+                "0": 1,
+                "1": 12,
+                "2": 2,
+            '''
+            for src_feature,tar_fe in machining_feature_edges:
+                if src_feature == tar_fe:
+                    continue
+                session.execute_write(_link_adjacent_features, file_id, mf_idx_map[src_feature], mf_idx_map[tar_fe])
+
+            for surface_key, feature_idx in surface_feature_map.items():
+                feature_id = mf_idx_map.get(feature_idx)
+                surface_id = surface_ids.get(surface_key)
+                if surface_id is None:
+                    surface_id = surface_ids.get(int(surface_key))
+                if surface_id and feature_id:
+                    session.execute_write(_link_surface_feature, file_id, surface_id, feature_id)
+
+            processes = para_dict.get('processes', [])
+            process_index_map = {}
+            process_operation_map = {}
         
-        for process in processes:
+            for process in processes:
+                '''
+                "processes": [
+                    {
+                        "index": 1,
+                        "operationNames": [
+                            "F1_ROUGHTOPFACE_P1",
+                            "F1_FINISHTOPFACE_P2"
+                        ],
+                        "featureUnitList": [
+                            7
+                        ],
+                        "volume": 0.0,
+                        "typeName": "TopFace",
+                        "featureDepth": 0.0
+                    },
+                '''
+                process_identifier,p_index = session.execute_write(_insert_process, file_id, process)
+                process_index_map[p_index]= process_identifier
+                process_operation_map[process_identifier]= process.get('operationNames', [])
+
+
+            process_index = para_dict.get('process_index', [])
             '''
-            "processes": [
-                {
-                    "index": 1,
-                    "operationNames": [
-                        "F1_ROUGHTOPFACE_P1",
-                        "F1_FINISHTOPFACE_P2"
-                    ],
-                    "featureUnitList": [
-                        7
-                    ],
-                    "volume": 0.0,
-                    "typeName": "TopFace",
-                    "featureDepth": 0.0
-                },
+             "process_index": [
+                [
+                    6,
+                    4
+                ],
             '''
-            process_identifier,p_index = session.execute_write(_insert_process, file_id, process)
-            process_index_map[p_index]= process_identifier
-            process_operation_map[process_identifier]= process.get('operationNames', [])
-
-
-        process_index = para_dict.get('process_index', [])
-        '''
-         "process_index": [
-            [
-                6,
-                4
-            ],
-        '''
-        for left_idx, right_idx in process_index:
-            left_id = process_index_map.get(left_idx)
-            right_id = process_index_map.get(right_idx)
-            if left_id and right_id:
-                if left_id == right_id:
-                    continue
-                session.execute_write(_link_process_adjacent, file_id, left_id, right_id)
-
-        raw_feature_process_map = para_dict.get('feature_process', {})
-        '''
-        "feature_process": {
-            "0": 4,
-            "1": 6,
-            "2": 5,
-        },
-        '''
-        for fe_id, proc_idx in raw_feature_process_map.items():
-            try:
-                feature_index = int(fe_id)
-                process_index_value = int(proc_idx)
-            except (TypeError, ValueError):
-                continue
-
-            feature_id = mf_idx_map.get(feature_index)
-            process_id = process_index_map.get(process_index_value)
-            if feature_id and process_id:
-                session.execute_write(_link_feature_process, file_id, feature_id, process_id)
-
-
-
-        for process_id, operation_names in process_operation_map.items():
-            for operation_name in operation_names:
-                operation_name = operation_name.strip()
-                if not operation_name:
+            for left_idx, right_idx in process_index:
+                left_id = process_index_map.get(left_idx)
+                right_id = process_index_map.get(right_idx)
+                if left_id and right_id:
+                    if left_id == right_id:
+                        continue
+                    session.execute_write(_link_process_adjacent, file_id, left_id, right_id)
+
+            raw_feature_process_map = para_dict.get('feature_process', {})
+            '''
+            "feature_process": {
+                "0": 4,
+                "1": 6,
+                "2": 5,
+            },
+            '''
+            for fe_id, proc_idx in raw_feature_process_map.items():
+                try:
+                    feature_index = int(fe_id)
+                    process_index_value = int(proc_idx)
+                except (TypeError, ValueError):
                     continue
-                session.execute_write(
-                    _link_process_operation,
-                    file_id,
-                    prt_file_id,
-                    process_id,
-                    operation_name,
-                )
 
+                feature_id = mf_idx_map.get(feature_index)
+                process_id = process_index_map.get(process_index_value)
+                if feature_id and process_id:
+                    session.execute_write(_link_feature_process, file_id, feature_id, process_id)
+
+
+
+            for process_id, operation_names in process_operation_map.items():
+                for operation_name in operation_names:
+                    operation_name = operation_name.strip()
+                    if not operation_name:
+                        continue
+                    session.execute_write(
+                        _link_process_operation,
+                        file_id,
+                        prt_file_id,
+                        process_id,
+                        operation_name,
+                    )
+
+    bump_graph_version(driver, source="test6_neo4j_process_milti-graph_obj_type")
     driver.close()
 
 
@@ -1,13 +1,54 @@
-
 import json
 import pathlib
 from collections.abc import Iterable
 from typing import Any, Dict, List, Tuple
 
+import numpy as np
 from dotenv import load_dotenv
 
-from utils.hash import file_hash
+from utils.bulk_writer import BulkWriter, DEFAULT_BATCH_SIZE
+from utils.hash import cached_file_hash
+from utils.graph_version import bump_graph_version
 from utils.neo4j import connect_neo4j
+from utils.vector_index import ensure_vector_indexes
+
+
+SURFACE_EMBEDDING_QUERY = """
+UNWIND $rows AS row
+MATCH (surface:Surface {__fileId__: $file_id, __index__: row.surface_index})
+SET surface.embedding = row.embedding,
+    surface.predict = row.predict,
+    surface.embeddingDim = size(row.embedding)
+RETURN row.surface_index AS surface_index
+"""
+
+# db.create.setNodeVectorProperty 以 float32 数组存储向量（Neo4j 5.13+）
+SURFACE_EMBEDDING_FLOAT32_QUERY = """
+UNWIND $rows AS row
+MATCH (surface:Surface {__fileId__: $file_id, __index__: row.surface_index})
+CALL db.create.setNodeVectorProperty(surface, 'embedding', row.embedding)
+SET surface.predict = row.predict,
+    surface.embeddingDim = size(row.embedding)
+RETURN row.surface_index AS surface_index
+"""
+
+FEATURE_EMBEDDING_QUERY = """
+UNWIND $rows AS row
+MATCH (feature:MachiningFeature {__fileId__: $file_id, __index__: row.feature_index})
+SET feature.embedding = row.embedding,
+    feature.embeddingDim = size(row.embedding),
+    feature.embeddingSurfaceCount = row.contributing_surfaces
+RETURN row.feature_index AS feature_index
+"""
+
+FEATURE_EMBEDDING_FLOAT32_QUERY = """
+UNWIND $rows AS row
+MATCH (feature:MachiningFeature {__fileId__: $file_id, __index__: row.feature_index})
+CALL db.create.setNodeVectorProperty(feature, 'embedding', row.embedding)
+SET feature.embeddingDim = size(row.embedding),
+    feature.embeddingSurfaceCount = row.contributing_surfaces
+RETURN row.feature_index AS feature_index
+"""
 
 
 def _as_float_list(raw_values: Iterable[Any]) -> List[float]:
@@ -22,30 +63,6 @@ def _as_float_list(raw_values: Iterable[Any]) -> List[float]:
     return result
 
 
-def _write_surface_embedding(
-    tx,
-    file_id: str,
-    surface_index: str,
-    embedding: List[float],
-    predict_value: Any,
-) -> int:
-    result = tx.run(
-        """
-        MATCH (surface:Surface {__fileId__: $file_id, __index__: $surface_index})
-        SET surface.embedding = $embedding,
-            surface.predict = $predict_value,
-            surface.embeddingDim = size($embedding)
-        RETURN count(surface) AS updated
-        """,
-        file_id=file_id,
-        surface_index=surface_index,
-        embedding=embedding,
-        predict_value=predict_value,
-    )
-    record = result.single()
-    return int(record["updated"]) if record else 0
-
-
 def _iter_embedding_payloads(raw_payload: Dict[str, Any]) -> Iterable[Tuple[str, Dict[str, Any]]]:
     for key, value in raw_payload.items():
         if not isinstance(value, dict):
@@ -53,53 +70,77 @@ def _iter_embedding_payloads(raw_payload: Dict[str, Any]) -> Iterable[Tuple[str,
         yield str(key), value
 
 
-def _average_vectors(vectors: List[List[float]]) -> List[float]:
-    if not vectors:
-        raise ValueError("Cannot average empty vector collection.")
-
-    dimension = len(vectors[0])
-    if not dimension:
-        raise ValueError("Vectors must not be empty.")
-
-    for vector in vectors:
-        if len(vector) != dimension:
-            raise ValueError("Vectors must share the same dimension.")
-
-    return [sum(values) / len(vectors) for values in zip(*vectors)]
-
-
-def _write_feature_embedding(
-    tx,
-    file_id: str,
-    feature_index: int,
-    embedding: List[float],
-    contributing_surfaces: int,
-) -> int:
-    result = tx.run(
-        """
-        MATCH (feature:MachiningFeature {__fileId__: $file_id, __index__: $feature_index})
-        SET feature.embedding = $embedding,
-            feature.embeddingDim = size($embedding),
-            feature.embeddingSurfaceCount = $contributing_surfaces
-        RETURN count(feature) AS updated
-        """,
-        file_id=file_id,
-        feature_index=feature_index,
-        embedding=embedding,
-        contributing_surfaces=contributing_surfaces,
-    )
-    record = result.single()
-    return int(record["updated"]) if record else 0
+def _load_surface_matrix(payload: Dict[str, Any]) -> Tuple[List[str], List[Any], np.ndarray]:
+    """Validate every surface embedding and stack them into one (surfaces, dim) matrix."""
+    surface_keys: List[str] = []
+    predicts: List[Any] = []
+    vectors: List[List[float]] = []
+    dimension = 0
+    for surface_index, data in _iter_embedding_payloads(payload):
+        embedding_raw = data.get("embedding")
+        if not isinstance(embedding_raw, Iterable) or isinstance(embedding_raw, (str, bytes)):
+            print(f"Skip surface {surface_index}: embedding must be a sequence of numbers.")
+            continue
+
+        try:
+            embedding = _as_float_list(embedding_raw)
+        except ValueError as exc:
+            print(f"Skip surface {surface_index}: {exc}")
+            continue
+
+        if not dimension:
+            dimension = len(embedding)
+        elif len(embedding) != dimension:
+            print(f"Skip surface {surface_index}: expected {dimension} values, got {len(embedding)}.")
+            continue
+
+        surface_keys.append(surface_index)
+        predicts.append(data.get("predict"))
+        vectors.append(embedding)
+
+    matrix = np.asarray(vectors, dtype=np.float64).reshape(len(vectors), dimension)
+    return surface_keys, predicts, matrix
+
+
+def _pool_feature_embeddings(
+    surface_keys: List[str],
+    matrix: np.ndarray,
+    surface_feature_map: Dict[str, Any],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Mean-pool surface rows per machining feature; returns (feature ids, means, counts)."""
+    row_of_surface = {key: row for row, key in enumerate(surface_keys)}
+    rows: List[int] = []
+    feature_ids: List[int] = []
+    for surface_key, feature_idx in surface_feature_map.items():
+        row = row_of_surface.get(str(surface_key))
+        if row is None:
+            continue
+        try:
+            feature_ids.append(int(feature_idx))
+        except (TypeError, ValueError):
+            continue
+        rows.append(row)
+
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, matrix.shape[1])), np.empty(0, dtype=np.int64)
+
+    features, group = np.unique(np.asarray(feature_ids), return_inverse=True)
+    sums = np.zeros((len(features), matrix.shape[1]), dtype=np.float64)
+    np.add.at(sums, group, matrix[np.asarray(rows)])
+    counts = np.bincount(group, minlength=len(features))
+    return features, sums / counts[:, None], counts
 
 
 if __name__ == "__main__":
     load_dotenv()
 
     init = False
+    use_float32 = False
+    batch_size = DEFAULT_BATCH_SIZE
     driver = connect_neo4j(init=init)
 
     hashfile = r"E:\dataset\cam\251225test\process_graph\3DA2607A.stp"
-    hash_value = file_hash(hashfile)
+    hash_value = cached_file_hash(hashfile)
 
     json_file = pathlib.Path(r"E:\dataset\cam\251225test\embedding\3DA2607A.json")
     with open(json_file, "r", encoding="utf-8") as file:
@@ -109,81 +150,43 @@ if __name__ == "__main__":
     with open(pyg_json_file, "r", encoding="utf-8") as file:
         pyg_payload = json.load(file)
 
-    surface_embeddings: Dict[str, List[float]] = {}
-    with driver.session() as session:
-        total = 0
-        missing = 0
-        for surface_index, data in _iter_embedding_payloads(payload):
-            embedding_raw = data.get("embedding")
-            if not isinstance(embedding_raw, Iterable) or isinstance(embedding_raw, (str, bytes)):
-                print(f"Skip surface {surface_index}: embedding must be a sequence of numbers.")
-                continue
-
-            try:
-                embedding = _as_float_list(embedding_raw)
-            except ValueError as exc:
-                print(f"Skip surface {surface_index}: {exc}")
-                continue
-
-            predict_value = data.get("predict")
-            updated = session.execute_write(
-                _write_surface_embedding,
-                hash_value,
-                surface_index,
-                embedding,
-                predict_value,
-            )
-
-            if updated:
-                total += 1
-                surface_embeddings[surface_index] = embedding
-            else:
-                missing += 1
-
-    print(f"Applied embeddings to {total} surfaces. Missing nodes: {missing}.")
-
-    surface_feature_map = pyg_payload.get("face_feature_map", {})
-    feature_vectors: Dict[int, List[List[float]]] = {}
+    dtype = np.float32 if use_float32 else np.float64
+    surface_query = SURFACE_EMBEDDING_FLOAT32_QUERY if use_float32 else SURFACE_EMBEDDING_QUERY
+    feature_query = FEATURE_EMBEDDING_FLOAT32_QUERY if use_float32 else FEATURE_EMBEDDING_QUERY
 
-    for surface_key, feature_idx in surface_feature_map.items():
-        surface_key_str = str(surface_key)
-        embedding = surface_embeddings.get(surface_key_str)
-        if embedding is None:
-            continue
+    surface_keys, predicts, matrix = _load_surface_matrix(payload)
+    surface_rows = [
+        {"surface_index": key, "embedding": vector, "predict": predict}
+        for key, vector, predict in zip(surface_keys, matrix.astype(dtype).tolist(), predicts)
+    ]
 
-        try:
-            feature_idx_int = int(feature_idx)
-        except (TypeError, ValueError):
-            continue
-
-        feature_vectors.setdefault(feature_idx_int, []).append(embedding)
-
-    feature_updates = 0
-    missing_features: List[int] = []
     with driver.session() as session:
-        for feature_index, vectors in feature_vectors.items():
-            try:
-                averaged = _average_vectors(vectors)
-            except ValueError as exc:
-                print(f"Skip feature {feature_index}: {exc}")
-                continue
-
-            updated = session.execute_write(
-                _write_feature_embedding,
-                hash_value,
-                feature_index,
-                averaged,
-                len(vectors),
-            )
-
-            if updated:
-                feature_updates += 1
-            else:
-                missing_features.append(feature_index)
-
-    print(f"Applied pooled embeddings to {feature_updates} machining features.")
+        writer = BulkWriter(session, batch_size=batch_size)
+        updated = writer.write_returning("surface_embedding", surface_query, surface_rows, file_id=hash_value)
+        matched = {record["surface_index"] for record in updated}
+        print(f"Applied embeddings to {len(matched)} surfaces. Missing nodes: {len(surface_keys) - len(matched)}.")
+
+        # 只用成功写入的 Surface 参与特征池化
+        keep = [row for row, key in enumerate(surface_keys) if key in matched]
+        kept_keys = [surface_keys[row] for row in keep]
+        features, means, counts = _pool_feature_embeddings(
+            kept_keys, matrix[keep], pyg_payload.get("face_feature_map", {})
+        )
+        feature_rows = [
+            {"feature_index": int(feature), "embedding": vector, "contributing_surfaces": int(count)}
+            for feature, vector, count in zip(features, means.astype(dtype).tolist(), counts)
+        ]
+        updated = writer.write_returning("feature_embedding", feature_query, feature_rows, file_id=hash_value)
+        matched_features = {record["feature_index"] for record in updated}
+        writer.report()
+
+    missing_features = sorted(int(feature) for feature in features if int(feature) not in matched_features)
+    print(f"Applied pooled embeddings to {len(matched_features)} machining features.")
     if missing_features:
-        print(f"Missing machining features for indices: {sorted(missing_features)}")
+        print(f"Missing machining features for indices: {missing_features}")
 
-    driver.close()
+    if matrix.size:
+        print(f"Vector indexes: {ensure_vector_indexes(driver, dimensions=matrix.shape[1])}")
 
+    bump_graph_version(driver, source="test7_neo4j_embedding")
+    driver.close()
@@ -3,18 +3,28 @@ import json
 import os
 import pathlib
 import re
+import time
 import traceback
 import asyncio
 
 from dotenv import load_dotenv
 from qwen_agent.agents import Assistant
-from tools.execute_cypher import ExecuteCypherTool
+from tools.execute_cypher import ExecuteCypherTool, QueryCypherEmbeddingTool
+from tools.expand_nodes import ExpandNodesTool, NextHopPrefetcher
+from utils.agent_runtime import STEP_KEYS, call_llm, run_tool, run_tool_calls, stream_llm, tool_calls_of
 from utils.jsonhelper import load_sub_agent_result, response2json, save_item_in_json
+from utils.llm_cache import get_llm_cache, open_recorder, session_schema_summary
+from utils.memory import HistoryManager
+from utils.schema_snapshot import load_schema_summary
+from utils.vector_handles import with_vector_handles
+from utils.neo4j import close_async_drivers
 
 # from utils.memory import HybridMemory
 SYSTEM_PROMPT = '''
 你是一个 Neo4j 图数据库智能体（Text2Cypher Agent）。
 你拥有一个 Cypher 执行工具：execute_cypher(cypher: string) -> result。
+以及一跳扩展工具：expand_nodes(ids: array, relationship_types: array, mode: "neighbors" | "label_counts") -> result，ids 为节点的 __id__。
+以及带参数的 Cypher 工具：query_cypher_embedding(cypher: string, embedding: object) -> result，参数里的向量句柄在服务端换成向量。
 你的任务是：把用户自然语言需求自动转成 Cypher 查询并执行，通过“模式层检索 → 类型分析 → embedding 相似检索 Top3 → 扩展推理 → 迭代补全 → 汇总输出相关所有节点”的流程完成任务。
 
 0. 核心硬规则（必须遵守）
@@ -44,6 +54,8 @@ R0.1 输出必须分步，并且每步只能输出 JSON
 }}
 ```
 
+同一步有多个互不依赖的查询时，可输出 {{"reason": "...", "tool_calls": [{{"tool_name": "...", "call_paras": {{...}}}}, ...]}}，这些调用会并发执行
+
 ⚠️禁止输出任何非 JSON 文本
 ⚠️禁止 Markdown
 ⚠️禁止代码块
@@ -104,7 +116,9 @@ Step1：检索 Schema（模式层）
 
 目的：确定 Labels / Relationship Types / Properties / Indexes
 
-优先执行：
+若下方“已缓存的 Schema”不为空，直接引用它完成 Step1 和 Step2，cypher 填空字符串，不要再执行下列查询。
+
+否则优先执行：
 
 CALL db.schema.visualization()
 
@@ -116,7 +130,7 @@ CALL db.relationshipTypes()
 
 CALL db.propertyKeys()
 
-CALL db.indexes()
+索引不用单独查询，向量索引见 Step3。
 
 Step1 输出 JSON，状态为“进行中”。
 
@@ -140,9 +154,12 @@ Step3：embedding 相似度检索 Top3 样本节点
 
 你必须优先使用向量索引（如存在）：
 
-先 CALL db.indexes() 找 VECTOR index
+Surface 和 MachiningFeature 的 embedding 上已建有余弦向量索引 surface_embedding_idx、machiningfeature_embedding_idx（也列在“已缓存的 Schema”的 indexes 里），不要再查询索引列表
+
+直接执行 CALL db.index.vector.queryNodes(indexName, 3, queryEmbedding) ...
 
-再执行 CALL db.index.vector.queryNodes(indexName, 3, queryEmbedding) ...
+输入结构里的 embedding 是向量句柄（形如 vec_1a2b3c4d5e6f7a8b），调用 query_cypher_embedding 时原样传句柄，Cypher 里用 $embedding，不要展开成数值：
+{{"tool_name": "query_cypher_embedding", "call_paras": {{"cypher": "CALL db.index.vector.queryNodes('surface_embedding_idx', 3, $embedding) YIELD node, score RETURN node, score", "embedding": {{"embedding": "vec_..."}}}}}}
 
 若不存在向量索引或 embedding 字段，则使用文本兜底检索：
 
@@ -164,6 +181,12 @@ Step4：基于 Top3 扩展推理相关节点（核心召回）
 
 1-hop（必须做）：
 
+优先调用 expand_nodes，ids 填 Step3 Top3 节点的 __id__（这类扩展已在后台预取，几乎不耗时）：
+{{"tool_name": "expand_nodes", "call_paras": {{"ids": ["Surface_..."], "relationship_types": ["BELONGS_TO_FEATURE"]}}}}
+链路方向：Surface-[:BELONGS_TO_FEATURE]->MachiningFeature-[:ASSIGNED_TO_PROCESS]->ProcessUnit-[:INCLUDES_OPERATION]->Operation-[:USES_TOOL]->Tool
+不需要限定关系类型时省略 relationship_types；按 Label 分类统计用 mode "label_counts"。
+也可以自己写 Cypher：
+
 MATCH (seed) WHERE id(seed) IN $seedIds MATCH (seed)-[r]-(nbr) RETURN seed,r,nbr LIMIT 200
 
 如果用户需要“相关所有节点”，你必须聚合输出：
@@ -266,6 +289,9 @@ embedding 字段缺失：改用 name/title/desc 文本检索
 输入结构：
 {propertys}
 
+已缓存的 Schema
+{schema_summary}
+
 历史记录
 {sub_agent_content}
 
@@ -275,7 +301,10 @@ embedding 字段缺失：改用 name/title/desc 文本检索
 
 
 class KnowledgeGraphAgent:
-    def __init__(self, task: str, propertys: dict, max_loop: int, model_name: str = "gpt-4.1-mini") -> None:
+    def __init__(self, task: str, propertys: dict, max_loop: int, model_name: str = "gpt-4.1-mini",
+                 concurrent_tools: bool = True, bot: Assistant = None, step_callback=None,
+                 history_token_budget: int = 6000, stream: bool = False, on_text=None,
+                 prefetch: bool = True) -> None:
 
         self.llm_cfg = {
             'model': os.environ['OPENAI_MODEL_NAME'],
@@ -285,15 +314,21 @@ class KnowledgeGraphAgent:
             #     'top_p': 0.8
             # }
         }
-        print(self.llm_cfg)
         self.task = task
         self.propertys = propertys
         self.max_rounds = max_loop
         self.round = 0
+        # 同一轮返回的多个工具调用互不依赖时并发执行
+        self.concurrent_tools = concurrent_tools
+        # step_callback(step, seconds)：每轮 LLM / 工具耗时回调
+        self.step_callback = step_callback
+        self.history_token_budget = history_token_budget
+        # 流式模式：步骤 JSON 一闭合就执行工具；on_text(field, delta) 接收模型的中间输出
+        self.stream = stream
+        self.on_text = on_text
+        # 工具结果里出现种子 __id__ 时，在模型思考期间预取下一跳扩展
+        self.prefetch = prefetch
 
-        self.tools = [
-            ExecuteCypherTool()
-        ]
         self.name = "KnowledgeGraphAgent"
         self.description = "根据用户输入的节点信息，自动生成 Cypher 查询语句并执行，返回查询结果。"
         self.parameters = [{
@@ -302,6 +337,18 @@ class KnowledgeGraphAgent:
             "description": "The query of user",
             "required": True
         }]
+        if bot is not None:
+            # 服务端复用常驻的 Assistant 与工具
+            self.bot = bot
+            self.tools = list(bot.function_map.values())
+            return
+
+        print(self.llm_cfg)
+        self.tools = [
+            ExecuteCypherTool(),
+            QueryCypherEmbeddingTool(),
+            ExpandNodesTool()
+        ]
         self.bot = Assistant(
             llm=self.llm_cfg,
             function_list=self.tools,
@@ -309,57 +356,104 @@ class KnowledgeGraphAgent:
             # description=self.description
         )
 
+    def _record_step(self, step: str, start: float) -> None:
+        if self.step_callback is not None:
+            self.step_callback(step, time.perf_counter() - start)
+
     async def run(self, loop=False):
         result_all = []
-        while True:
-            prompt = SYSTEM_PROMPT.format(
-                propertys=self.propertys,
-                sub_agent_content=result_all
-            )
-            messages = [
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": self.task}
-            ]
-
-            responses = self.bot.run_nonstream(messages)
-
-            content = responses[0]['content']
-            response_json = response2json(content)
-            tool_output = await self.run_tool(response_json['tool_name'], json.dumps(response_json['call_paras']))
-
-            result_item = {"agent_name": self.name,
-                           "reason": response_json['reason'],
-                           "result": tool_output
-                           }
-            result_all.append(result_item)
-            # 4. 判断是否结束
-            self.round += 1
-            if self.max_rounds and self.round >= self.max_rounds:
-                break
-
-            if not loop:
-                break
-
+        # LLM_CACHE_MODE=record 时按 data.json 格式保存整个会话，供回放
+        recorder = open_recorder(self.name)
+        # 提示词里的历史按 token 预算压缩，result_all 仍保留完整结果
+        history = HistoryManager(token_budget=self.history_token_budget)
+        schema_summary = await session_schema_summary(self.name, self.task, load_schema_summary)
+        # 向量只在服务端保存，提示词里传句柄
+        prompt_propertys = with_vector_handles(self.propertys)
+        prefetcher = None
+        expand_tool = self.bot.function_map.get("expand_nodes")
+        if self.prefetch and expand_tool is not None and get_llm_cache().mode != "replay":
+            prefetcher = NextHopPrefetcher(expand_tool)
+        try:
+            while True:
+                prompt = SYSTEM_PROMPT.format(
+                    propertys=prompt_propertys,
+                    schema_summary=schema_summary,
+                    sub_agent_content=history.render()
+                )
+                messages = [
+                    {"role": "system", "content": prompt},
+                    {"role": "user", "content": self.task}
+                ]
+
+                start = time.perf_counter()
+                if self.stream:
+                    turn = await stream_llm(self.bot, messages, on_text=self.on_text, recorder=recorder)
+                    self._record_step("llm_first_step", start)
+                    response_json = turn.step
+                    if response_json is None:
+                        responses = await turn.responses()
+                        response_json = response2json(responses[0]['content'], expect_keys=STEP_KEYS)
+                else:
+                    responses = await call_llm(self.bot, messages, recorder=recorder)
+                    self._record_step("llm", start)
+                    response_json = response2json(responses[0]['content'], expect_keys=STEP_KEYS)
+
+                calls = tool_calls_of(response_json)
+                tools_start = time.perf_counter()
+                tool_outputs = await run_tool_calls(self.bot.function_map, calls, concurrent=self.concurrent_tools)
+                self._record_step("tools", tools_start)
+                if prefetcher is not None:
+                    for tool_output in tool_outputs:
+                        prefetcher.observe(tool_output)
+                if self.stream:
+                    # 工具与模型的剩余输出并行；下一轮前等模型结束，保证会话记录完整
+                    await turn.responses()
+                    self._record_step("llm", start)
+
+                for call, tool_output in zip(calls, tool_outputs):
+                    if recorder is not None:
+                        recorder.add_tool_result(call.get('tool_name', ''), tool_output)
+                    result_item = {"agent_name": self.name,
+                                   "reason": call.get('reason', ''),
+                                   "result": tool_output
+                                   }
+                    result_all.append(result_item)
+                    history.add_step(call.get('reason', ''), call.get('tool_name', ''), call.get('call_paras', {}),
+                                     tool_output)
+                # 4. 判断是否结束
+                self.round += 1
+                if self.max_rounds and self.round >= self.max_rounds:
+                    break
+
+                if not loop:
+                    break
+        finally:
+            if prefetcher is not None:
+                print(f"Prefetch: {prefetcher.stats()}")
+                await prefetcher.close()
+
+        if recorder is not None:
+            print(f"Session recorded to {recorder.save()}")
         return result_all
 
     async def run_tool(
             self, tool_id: str, tool_input: dict, context: str | None = None
     ) -> str:
-        try:
-            tool = self.bot.function_map[tool_id]
-            tool_record = await tool.call(tool_input)
-            return tool_record
-        except Exception as e:
-            print(f"Failed to run tool {tool_id}")
-            print(traceback.format_exc())
-            return f"Tool execution failed: {e}"
+        return await run_tool(self.bot.function_map, tool_id, tool_input)
+
+
+async def run_agent(agent, loop=True):
+    try:
+        return await agent.run(loop=loop)
+    finally:
+        await close_async_drivers()
 
 
 def main(task, propertys, max_loop):
     agent = KnowledgeGraphAgent(task, propertys, max_loop=max_loop)
 
     try:
-        result = asyncio.run(agent.run(loop=True))
+        result = asyncio.run(run_agent(agent, loop=True))
     except Exception as e:
         import sys, traceback
         print("错误信息:", e)
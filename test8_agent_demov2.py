@@ -9,7 +9,13 @@ import asyncio
 from dotenv import load_dotenv
 from qwen_agent.agents import Assistant
 from tools.execute_cypher import ExecuteCypherTool, QueryCypherEmbeddingTool
+from tools.retrieve_chain import RetrieveSurfaceChainTool
+from utils.agent_runtime import STEP_KEYS, call_llm, run_tool, run_tool_calls, tool_calls_of
 from utils.jsonhelper import load_sub_agent_result, response2json, save_item_in_json
+from utils.llm_cache import open_recorder, session_schema_summary
+from utils.neo4j import close_async_drivers
+from utils.schema_snapshot import load_schema_summary
+from utils.vector_handles import with_vector_handles
 
 # from utils.memory import HybridMemory
 SYSTEM_PROMPT = '''
@@ -19,6 +25,10 @@ SYSTEM_PROMPT = '''
 但你不知道知识图谱的结构，所以需要先检索模式层，再根据输入的标签和嵌入向量检索，最相似的三个。
 最后沿着关系的方向，召回节点的邻接节点。
 Surface可以召回MachiningFeature，MachiningFeature到ProcessUnit，ProcessUnit到Operation，最后是Tool
+Surface 和 MachiningFeature 的 embedding 上已建有余弦向量索引 surface_embedding_idx、machiningfeature_embedding_idx，相似检索请用 db.index.vector.queryNodes
+从 Surface 一直召回到 Tool 时，优先调用 retrieve_surface_chain(embedding, k=3)，一次返回 Top3 Surface 及其 MachiningFeature、ProcessUnit、Operation、Tool 链路
+输入里的 embedding 是向量句柄（形如 vec_1a2b3c4d5e6f7a8b），调用工具时原样传句柄，例如 query_cypher_embedding 的 embedding 参数写 {"embedding": "vec_..."}，Cypher 里用 $embedding，不要展开成数值
+同一步有多个互不依赖的查询时，可输出 {"reason": "...", "tool_calls": [{"tool_name": "...", "call_paras": {...}}, ...]}，这些调用会并发执行
 
 严禁使用改变知识图谱属性和结构的指令
 你逐步执行流程，一次只能执行一步。
@@ -29,7 +39,8 @@ Surface可以召回MachiningFeature，MachiningFeature到ProcessUnit，ProcessUn
 
 
 class KnowledgeGraphAgent:
-    def __init__(self, task: str, propertys: dict, max_loop: int, model_name: str = "gpt-4.1-mini") -> None:
+    def __init__(self, task: str, propertys: dict, max_loop: int, model_name: str = "gpt-4.1-mini",
+                 concurrent_tools: bool = True) -> None:
 
         self.llm_cfg = {
             'model': os.environ['OPENAI_MODEL_NAME'],
@@ -44,10 +55,13 @@ class KnowledgeGraphAgent:
         self.propertys = propertys
         self.max_rounds = max_loop
         self.round = 0
+        # 同一轮返回的多个工具调用互不依赖时并发执行
+        self.concurrent_tools = concurrent_tools
 
         self.tools = [
             ExecuteCypherTool(),
-            QueryCypherEmbeddingTool()
+            QueryCypherEmbeddingTool(),
+            RetrieveSurfaceChainTool()
         ]
         self.name = "KnowledgeGraphAgent"
         self.description = "根据用户输入的节点信息，自动生成 Cypher 查询语句并执行，返回查询结果。"
@@ -66,25 +80,38 @@ class KnowledgeGraphAgent:
 
     async def run(self, loop=False):
         result_all = []
+        # LLM_CACHE_MODE=record 时按 data.json 格式保存整个会话，供回放
+        recorder = open_recorder(self.name)
+        schema_summary = await session_schema_summary(self.name, self.task, load_schema_summary)
+        # 向量只在服务端保存，提示词里传句柄
+        prompt_propertys = with_vector_handles(self.propertys)
+        system_prompt = SYSTEM_PROMPT
+        if schema_summary:
+            # 已缓存的模式层，省去检索 Schema 的一轮
+            system_prompt += f"\n已缓存的 Schema（无需再调用 db.schema.visualization / db.labels / db.indexes）：\n{schema_summary}\n"
         while True:
 
             messages = [
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": json.dumps(self.propertys, ensure_ascii=False)},
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": json.dumps(prompt_propertys, ensure_ascii=False)},
                 {"role": "user", "content": self.task}
             ]
 
-            responses = self.bot.run_nonstream(messages)
+            responses = await call_llm(self.bot, messages, recorder=recorder)
 
             content = responses[0]['content']
-            response_json = response2json(content)
-            tool_output = await self.run_tool(response_json['tool_name'], json.dumps(response_json['call_paras']))
-
-            result_item = {"agent_name": self.name,
-                           "reason": response_json['reason'],
-                           "result": tool_output
-                           }
-            result_all.append(result_item)
+            response_json = response2json(content, expect_keys=STEP_KEYS)
+            calls = tool_calls_of(response_json)
+            tool_outputs = await run_tool_calls(self.bot.function_map, calls, concurrent=self.concurrent_tools)
+
+            for call, tool_output in zip(calls, tool_outputs):
+                if recorder is not None:
+                    recorder.add_tool_result(call.get('tool_name', ''), tool_output)
+                result_item = {"agent_name": self.name,
+                               "reason": call.get('reason', ''),
+                               "result": tool_output
+                               }
+                result_all.append(result_item)
             # 4. 判断是否结束
             self.round += 1
             if self.max_rounds and self.round >= self.max_rounds:
@@ -93,26 +120,28 @@ class KnowledgeGraphAgent:
             if not loop:
                 break
 
+        if recorder is not None:
+            print(f"Session recorded to {recorder.save()}")
         return result_all
 
     async def run_tool(
             self, tool_id: str, tool_input: dict, context: str | None = None
     ) -> str:
-        try:
-            tool = self.bot.function_map[tool_id]
-            tool_record = await tool.call(tool_input)
-            return tool_record
-        except Exception as e:
-            print(f"Failed to run tool {tool_id}")
-            print(traceback.format_exc())
-            return f"Tool execution failed: {e}"
+        return await run_tool(self.bot.function_map, tool_id, tool_input)
+
+
+async def run_agent(agent, loop=True):
+    try:
+        return await agent.run(loop=loop)
+    finally:
+        await close_async_drivers()
 
 
 def main(task, propertys, max_loop):
     agent = KnowledgeGraphAgent(task, propertys, max_loop=max_loop)
 
     try:
-        result = asyncio.run(agent.run(loop=True))
+        result = asyncio.run(run_agent(agent, loop=True))
     except Exception as e:
         import sys, traceback
         print("错误信息:", e)
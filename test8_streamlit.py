@@ -13,6 +13,37 @@ with open("data.json",encoding='utf-8') as f:
 import streamlit as st
 
 st.set_page_config(layout="wide")
+
+
+def run_live(task, propertys, max_loop):
+    """Run the agent in streaming mode and show the model output as it arrives."""
+    import asyncio
+    from dotenv import load_dotenv
+    from test8_agent_demo import KnowledgeGraphAgent, run_agent
+
+    load_dotenv()
+    placeholders = {"reasoning_content": st.empty(), "content": st.empty()}
+    texts = {"reasoning_content": "", "content": ""}
+
+    def on_text(field, delta):
+        texts[field] += delta
+        placeholders[field].markdown(texts[field])
+
+    agent = KnowledgeGraphAgent(task, propertys, max_loop=max_loop, stream=True, on_text=on_text)
+    for item in asyncio.run(run_agent(agent, loop=True)):
+        st.write(item["reason"])
+        st.json(item["result"])
+
+
+with st.sidebar:
+    live_task = st.text_area("任务")
+    live_propertys = st.text_area("节点属性 (JSON)", "{}")
+    live_max_loop = st.number_input("最大轮数", min_value=1, value=10)
+    live = st.button("实时运行")
+if live and live_task:
+    run_live(live_task, json.loads(live_propertys), int(live_max_loop))
+    st.divider()
+
 left, right = st.columns(2)
 
 
@@ -0,0 +1,265 @@
+import argparse
+import json
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+
+from test4_file_context import _collect_file_info, _ensure_file_group, _upsert_file_variant
+from utils.bulk_writer import BulkWriter, DEFAULT_BATCH_SIZE
+from utils.hash import cached_file_hash
+from utils.manifest import INGEST_SOURCE, IngestManifest, PartRecord
+from utils.multi_graph import (
+    LOADER_VERSION,
+    build_multi_graph_rows,
+    delete_file_graph,
+    delete_multi_graph_rows,
+    write_multi_graph_rows,
+)
+from utils.graph_version import bump_graph_version
+from utils.neo4j import connect_neo4j, pool_metrics
+from utils.schema import ensure_schema
+
+
+@dataclass
+class PartSource:
+    stem: str
+    stp_path: Path
+    prt_path: Path
+    json_path: Path
+    pdf_path: Optional[Path] = None
+
+
+@dataclass
+class PreparedPart:
+    stem: str
+    record: PartRecord
+    file_infos: List[Dict[str, object]]
+    # None 表示与清单一致，跳过写入
+    rows: Optional[Dict[str, List[dict]]]
+
+    @property
+    def file_id(self) -> str:
+        return self.record.file_id
+
+
+@dataclass
+class PartFailure:
+    stem: str
+    stage: str
+    error: str
+
+
+@dataclass
+class IngestSummary:
+    parts_total: int = 0
+    parts_ok: int = 0
+    parts_skipped: int = 0
+    rows_written: int = 0
+    seconds: float = 0.0
+    failures: List[PartFailure] = field(default_factory=list)
+
+    def report(self) -> None:
+        rate = self.parts_ok / self.seconds if self.seconds else 0.0
+        row_rate = self.rows_written / self.seconds if self.seconds else 0.0
+        print(f"Ingested {self.parts_ok}/{self.parts_total} parts in {self.seconds:.1f}s "
+              f"({rate:.2f} parts/s, {self.rows_written} rows, {row_rate:.1f} rows/s)")
+        if self.parts_skipped:
+            print(f"Unchanged parts skipped: {self.parts_skipped}")
+        if self.failures:
+            print(f"Failed parts: {len(self.failures)}")
+            for failure in self.failures:
+                print(f"  {failure.stem} [{failure.stage}] {failure.error}")
+
+
+def find_part_sources(source_dir: Path, json_dir: Path) -> Iterator[PartSource]:
+    """Yield every stem that has a .stp, a .prt and a multi-graph .json."""
+    for stp_path in sorted(source_dir.glob("*.stp")):
+        stem = stp_path.stem
+        prt_path = source_dir / f"{stem}.prt"
+        json_path = json_dir / f"{stem}.json"
+        if not prt_path.exists() or not json_path.exists():
+            continue
+        pdf_path = source_dir / f"{stem}.pdf"
+        yield PartSource(
+            stem=stem,
+            stp_path=stp_path,
+            prt_path=prt_path,
+            json_path=json_path,
+            pdf_path=pdf_path if pdf_path.exists() else None,
+        )
+
+
+def _prepare_part(source: PartSource, manifest_path: Optional[str] = None, full: bool = False) -> PreparedPart:
+    """Hash the source files and turn the JSON payload into bulk rows (runs in a worker process).
+
+    Parts whose hashes and loader version match the manifest are returned without rows,
+    unless ``full`` is set.
+    """
+    file_infos = []
+    for path in (source.pdf_path, source.stp_path, source.prt_path):
+        if path is None:
+            continue
+        info = _collect_file_info(path)
+        if info is None:
+            raise OSError(f"Cannot read {path}")
+        file_infos.append(info)
+
+    hashes = {info["extension"]: info["hash"] for info in file_infos}
+    record = PartRecord(
+        stem=source.stem,
+        file_id=hashes[".stp"],
+        prt_file_id=hashes[".prt"],
+        json_hash=cached_file_hash(source.json_path),
+        loader_version=LOADER_VERSION,
+    )
+    if manifest_path and not full and IngestManifest(manifest_path).is_unchanged(record):
+        return PreparedPart(stem=source.stem, record=record, file_infos=file_infos, rows=None)
+
+    with open(source.json_path, "r", encoding="utf-8") as file:
+        para_dict = json.load(file)
+
+    return PreparedPart(
+        stem=source.stem,
+        record=record,
+        file_infos=file_infos,
+        rows=build_multi_graph_rows(record.file_id, para_dict),
+    )
+
+
+def _write_part(driver, part: PreparedPart, batch_size: int, manifest: Optional[IngestManifest] = None,
+                full: bool = False) -> int:
+    record = part.record
+    previous = manifest.get_part(part.stem) if manifest else None
+    with driver.session() as session:
+        session.execute_write(_ensure_file_group, part.stem)
+        for info in part.file_infos:
+            session.execute_write(_upsert_file_variant, part.stem, info)
+
+        writer = BulkWriter(session, batch_size=batch_size)
+        if not full and previous is not None and (previous.file_id, previous.prt_file_id, previous.loader_version) == \
+                (record.file_id, record.prt_file_id, record.loader_version):
+            # 只有 JSON 变化：按节点/关系差异增量写入
+            diff = manifest.diff(part.stem, part.rows)
+            delete_multi_graph_rows(writer, record.file_id, record.prt_file_id, diff.deletes)
+            write_multi_graph_rows(writer, record.file_id, record.prt_file_id, diff.inserts)
+            print(f"Part {part.stem}: +{diff.inserted} -{diff.deleted} rows ({diff.updated} nodes updated)")
+            written = diff.inserted + diff.deleted
+        else:
+            # 全量重载时连同当前 file_id 下已有的节点一起清掉，不与旧内容哈希节点并存
+            stale = {previous.file_id} if previous is not None else set()
+            if full:
+                stale.add(record.file_id)
+            for file_id in sorted(stale):
+                delete_file_graph(session, file_id)
+            written = sum(write_multi_graph_rows(writer, record.file_id, record.prt_file_id, part.rows).values())
+
+    if manifest:
+        manifest.record(record, part.rows)
+    return written
+
+
+def ingest_directory(
+    driver,
+    sources: List[PartSource],
+    parse_workers: int = 4,
+    write_workers: int = 2,
+    max_in_flight: int = 8,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    manifest: Optional[IngestManifest] = None,
+    full: bool = False,
+) -> IngestSummary:
+    """Parse parts in a process pool and write them through a bounded writer pool.
+
+    At most ``max_in_flight`` parts are parsed or waiting to be written at any
+    time, so a slow database throttles parsing instead of piling rows up in memory.
+    A failure only drops the part it belongs to. With a ``manifest``, unchanged
+    parts are skipped and parts whose JSON changed are written as a diff; ``full``
+    reloads every part from scratch but still records it in the manifest.
+    """
+    summary = IngestSummary(parts_total=len(sources))
+    start = time.perf_counter()
+    pending_sources = iter(sources)
+    parsing: Dict[object, PartSource] = {}
+    writing: Dict[object, PreparedPart] = {}
+
+    with ProcessPoolExecutor(max_workers=parse_workers) as parse_pool, \
+            ThreadPoolExecutor(max_workers=write_workers) as write_pool:
+        exhausted = False
+        while True:
+            while not exhausted and len(parsing) + len(writing) < max_in_flight:
+                source = next(pending_sources, None)
+                if source is None:
+                    exhausted = True
+                    break
+                manifest_path = manifest.path if manifest else None
+                parsing[parse_pool.submit(_prepare_part, source, manifest_path, full)] = source
+
+            if not parsing and not writing:
+                break
+
+            done, _ = wait(list(parsing) + list(writing), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in parsing:
+                    source = parsing.pop(future)
+                    try:
+                        part = future.result()
+                    except Exception as e:
+                        summary.failures.append(PartFailure(source.stem, "parse", repr(e)))
+                        continue
+                    if part.rows is None:
+                        summary.parts_skipped += 1
+                        continue
+                    writing[write_pool.submit(_write_part, driver, part, batch_size, manifest, full)] = part
+                else:
+                    part = writing.pop(future)
+                    try:
+                        summary.rows_written += future.result()
+                        summary.parts_ok += 1
+                        print(f"Ingested part {part.stem} ({part.file_id})")
+                    except Exception as e:
+                        traceback.print_exc()
+                        summary.failures.append(PartFailure(part.stem, "write", repr(e)))
+
+    summary.seconds = time.perf_counter() - start
+    return summary
+
+
+if __name__ == "__main__":
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Ingest every stp/prt/json part triple of a directory.")
+    parser.add_argument("--source-dir", default=r"E:\dataset\cam\251225test\process_graph")
+    parser.add_argument("--json-dir", default=r"E:\dataset\cam\251225test\mynet_multi_kgv2")
+    parser.add_argument("--parse-workers", type=int, default=4)
+    parser.add_argument("--write-workers", type=int, default=2)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--manifest", default=None, help="SQLite manifest path (default: INGEST_MANIFEST_PATH)")
+    parser.add_argument("--full", action="store_true", help="Reload every part, even unchanged ones")
+    args = parser.parse_args()
+
+    driver = connect_neo4j(init=False)
+    ensure_schema(driver)
+    part_sources = list(find_part_sources(Path(args.source_dir), Path(args.json_dir)))
+    print(f"Found {len(part_sources)} part triples")
+
+    result = ingest_directory(
+        driver,
+        part_sources,
+        parse_workers=args.parse_workers,
+        write_workers=args.write_workers,
+        max_in_flight=args.max_in_flight,
+        batch_size=args.batch_size,
+        manifest=IngestManifest(args.manifest),
+        full=args.full,
+    )
+    result.report()
+    if result.rows_written:
+        bump_graph_version(driver, source=INGEST_SOURCE)
+    print(f"Neo4j pool: {pool_metrics()}")
+    driver.close()
@@ -1,21 +1,219 @@
+import asyncio
+import hashlib
 import json
 import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
 
-from neo4j import GraphDatabase
 from qwen_agent.tools.base import register_tool, BaseTool
 
+from utils.cypher_guard import ResultBudget, aread_guarded, enforce_limit, read_guarded
+from utils.graph_version import aget_graph_version, get_graph_version
+from utils.neo4j import get_async_driver, get_driver
+from utils.vector_handles import resolve_vector_params
+
+CACHE_MAX_ENTRIES = int(os.environ.get("CYPHER_CACHE_MAX_ENTRIES", 1024))
+CACHE_MAX_BYTES = int(os.environ.get("CYPHER_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_TTL = float(os.environ.get("CYPHER_CACHE_TTL", 300))
+# 两次图谱版本检查之间的最短间隔（秒）
+CACHE_VERSION_CHECK = float(os.environ.get("CYPHER_CACHE_VERSION_CHECK", 5))
+
+
+def normalize_cypher(cypher: str) -> str:
+    return re.sub(r"\s+", " ", cypher.strip().rstrip(";")).strip()
+
+
+class QueryResultCache:
+    """LRU + TTL cache of tool results, bounded in entries and bytes.
+
+    Entries are stored as JSON text (which is also their size) and dropped as
+    soon as the graph version bumped by the loaders moves.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl: float = CACHE_TTL, version_check: float = CACHE_VERSION_CHECK) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.version_check = version_check
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+        self.graph_version: Optional[int] = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        # 预取写入、尚未被读到的键；以及正在预取的键 -> Future
+        self._prefetched: set = set()
+        self.pending: Dict[str, asyncio.Future] = {}
+        self.prefetch_puts = 0
+        self.prefetch_hits = 0
+        self.prefetch_wasted = 0
+
+    @staticmethod
+    def make_key(cypher: str, params: Optional[Dict[str, Any]], budget: ResultBudget) -> str:
+        payload = json.dumps(
+            [normalize_cypher(cypher), params or {}, budget.max_rows, budget.max_bytes,
+             list(budget.stripped_properties)],
+            sort_keys=True, ensure_ascii=False, default=str,
+        )
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+    def version_due(self) -> bool:
+        return time.time() - self._checked_at >= self.version_check
+
+    def set_graph_version(self, version: int) -> None:
+        with self._lock:
+            self._checked_at = time.time()
+            if self.graph_version is not None and version != self.graph_version:
+                self.invalidations += 1
+                self._entries.clear()
+                self._bytes = 0
+                self._prefetched.clear()
+            self.graph_version = version
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if expires_at < time.time():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if key in self._prefetched:
+                self._prefetched.discard(key)
+                self.prefetch_hits += 1
+        return json.loads(payload)
+
+    def contains(self, key: str) -> bool:
+        """Whether ``key`` holds a live entry, without touching the hit/miss counters or LRU order."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] >= time.time()
+
+    def put(self, key: str, value: Any, prefetched: bool = False) -> None:
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (payload, time.time() + self.ttl)
+            self._bytes += size
+            if prefetched:
+                self._prefetched.add(key)
+                self.prefetch_puts += 1
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        payload, _ = self._entries.pop(key)
+        self._bytes -= len(payload)
+        if key in self._prefetched:
+            self._prefetched.discard(key)
+            self.prefetch_wasted += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._prefetched.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "graph_version": self.graph_version,
+                "prefetch_puts": self.prefetch_puts,
+                "prefetch_hits": self.prefetch_hits,
+                "prefetch_wasted": self.prefetch_wasted,
+                "prefetch_hit_rate": self.prefetch_hits / self.prefetch_puts if self.prefetch_puts else 0.0,
+            }
+
+
+_query_cache: Optional[QueryResultCache] = None
+
+
+def get_query_cache() -> QueryResultCache:
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = QueryResultCache()
+    return _query_cache
+
+
+def cached_read(driver, cypher: str, params, budget: ResultBudget, cache: Optional[QueryResultCache]):
+    if cache is None:
+        with driver.session(fetch_size=budget.fetch_size) as session:
+            return read_guarded(session, cypher, params, budget)
+    if cache.version_due():
+        cache.set_graph_version(get_graph_version(driver))
+    key = cache.make_key(cypher, params, budget)
+    records = cache.get(key)
+    if records is None:
+        with driver.session(fetch_size=budget.fetch_size) as session:
+            records = read_guarded(session, cypher, params, budget)
+        cache.put(key, records)
+    return records
+
+
+async def acached_read(cypher: str, params, budget: ResultBudget, cache: Optional[QueryResultCache]):
+    driver = get_async_driver()
+    if cache is None:
+        async with driver.session(fetch_size=budget.fetch_size) as session:
+            return await aread_guarded(session, cypher, params, budget)
+    if cache.version_due():
+        cache.set_graph_version(await aget_graph_version(driver))
+    key = cache.make_key(cypher, params, budget)
+    pending = cache.pending.get(key)
+    if pending is not None and pending.get_loop() is asyncio.get_running_loop():
+        # 同一查询正在预取：等它写入缓存，不重复查询
+        await asyncio.wait({pending})
+    records = cache.get(key)
+    if records is None:
+        async with driver.session(fetch_size=budget.fetch_size) as session:
+            records = await aread_guarded(session, cypher, params, budget)
+        cache.put(key, records)
+    return records
+
 
 @register_tool('execute_cypher', allow_overwrite=True)
 class ExecuteCypherTool(BaseTool):
-    def __init__(self, timeout: int = 60 * 5) -> None:
-        neo4j_username = os.environ.get("NEO4J_USER", "neo4j")
-        neo4j_password = os.environ.get("NEO4J_PASSWORD")
-        self.driver = GraphDatabase.driver('neo4j://localhost:7687', auth=(neo4j_username, neo4j_password))
+    def __init__(self, timeout: int = 60 * 5, budget: ResultBudget = None, cache: QueryResultCache = None,
+                 use_cache: bool = True) -> None:
+        self.driver = get_driver()
+        self.budget = budget or ResultBudget()
+        self.cache = (cache or get_query_cache()) if use_cache else None
 
     name = "execute_cypher"
 
     description = """
-    Execute a Cypher query in Neo4j and return all records as a list of dicts.
+    Execute a Cypher query in Neo4j and return the records as a list of dicts.
+    Only read-only queries are accepted; writes, unbounded variable-length paths and
+    plans estimated above the row limit are rejected before they run.
+    At most 200 rows are returned and embedding vectors are left out; a trailing
+    {"__truncated__": true, ...} entry means the result was cut off.
     """
     parameters = [{
         "name": "cypher",
@@ -24,31 +222,42 @@ class ExecuteCypherTool(BaseTool):
         "required": True
     }]
 
-    # async \
     def call(self, params: str, **kwargs):
         cypher = json.loads(params)['cypher']
         results = self.execute(cypher)
         return results
 
+    async def acall(self, params: str, **kwargs):
+        cypher = json.loads(params)['cypher']
+        return await self.aexecute(cypher)
+
     def execute(self, cypher: str):
+        # 多取一行用于判断是否被截断
+        cypher = enforce_limit(cypher, self.budget.max_rows + 1)
+        print(f"cypher： {cypher}")
+        return cached_read(self.driver, cypher, None, self.budget, self.cache)
+
+    async def aexecute(self, cypher: str):
+        cypher = enforce_limit(cypher, self.budget.max_rows + 1)
         print(f"cypher： {cypher}")
-        with self.driver.session() as session:
-            result = session.run(cypher)
-            records = [record.data() for record in result]
-        return records
+        return await acached_read(cypher, None, self.budget, self.cache)
 
 
 @register_tool('query_cypher_embedding', allow_overwrite=True)
 class QueryCypherEmbeddingTool(BaseTool):
-    def __init__(self, timeout: int = 60 * 5) -> None:
-        neo4j_username = os.environ.get("NEO4J_USER", "neo4j")
-        neo4j_password = os.environ.get("NEO4J_PASSWORD")
-        self.driver = GraphDatabase.driver('neo4j://localhost:7687', auth=(neo4j_username, neo4j_password))
+    def __init__(self, timeout: int = 60 * 5, budget: ResultBudget = None, cache: QueryResultCache = None,
+                 use_cache: bool = True) -> None:
+        self.driver = get_driver()
+        self.budget = budget or ResultBudget()
+        self.cache = (cache or get_query_cache()) if use_cache else None
 
     name = "query_cypher_embedding"
 
     description = """
     Execute a Cypher query in Neo4j with embedding parameters and return records.
+    A parameter value may be a registered vector handle such as "vec_1a2b3c4d5e6f7a8b";
+    it is bound as the stored float32 vector. Results are capped like execute_cypher
+    and never include embedding vectors.
     """
     parameters = [{
         "name": "cypher",
@@ -58,7 +267,7 @@ class QueryCypherEmbeddingTool(BaseTool):
     }, {
         "name": "embedding",
         "type": "object",
-        "description": "Cypher parameters (dict), e.g. {'embedding': [...]}",
+        "description": "Cypher parameters (dict), e.g. {'embedding': 'vec_1a2b3c4d5e6f7a8b'} or {'embedding': [...]}",
         "required": False
     }]
 
@@ -66,10 +275,26 @@ class QueryCypherEmbeddingTool(BaseTool):
         payload = json.loads(params)
         cypher = payload["cypher"]
         cypher_params =  payload.get("embedding")  # 保持兼容
+        if isinstance(cypher_params, str):
+            # 直接传了句柄，按 $embedding 绑定
+            cypher_params = {"embedding": cypher_params}
         return self.execute(cypher, cypher_params)
 
+    async def acall(self, params: str, **kwargs):
+        payload = json.loads(params)
+        cypher_params = payload.get("embedding")
+        if isinstance(cypher_params, str):
+            cypher_params = {"embedding": cypher_params}
+        return await self.aexecute(payload["cypher"], cypher_params)
+
     def execute(self, cypher: str, cypher_params=None):
+        cypher = enforce_limit(cypher, self.budget.max_rows + 1)
+        print(f"cypher: {cypher}")
+        cypher_params = resolve_vector_params(cypher_params or {})
+        return cached_read(self.driver, cypher, cypher_params, self.budget, self.cache)
+
+    async def aexecute(self, cypher: str, cypher_params=None):
+        cypher = enforce_limit(cypher, self.budget.max_rows + 1)
         print(f"cypher: {cypher}")
-        with self.driver.session() as session:
-            result = session.run(cypher, cypher_params or {})
-            return [record.data() for record in result]
\ No newline at end of file
+        cypher_params = resolve_vector_params(cypher_params or {})
+        return await acached_read(cypher, cypher_params, self.budget, self.cache)
@@ -0,0 +1,167 @@
+import asyncio
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from qwen_agent.tools.base import register_tool, BaseTool
+
+from tools.execute_cypher import QueryResultCache, acached_read, cached_read, get_query_cache
+from utils.cypher_guard import ResultBudget, aread_guarded, enforce_limit
+from utils.neo4j import get_async_driver, get_driver
+from utils.retrieval import NEXT_HOPS, NODE_ID_PATTERN, expansion_queries, group_node_ids
+
+
+@register_tool('expand_nodes', allow_overwrite=True)
+class ExpandNodesTool(BaseTool):
+    def __init__(self, timeout: int = 60 * 5, budget: ResultBudget = None, cache: QueryResultCache = None,
+                 use_cache: bool = True) -> None:
+        self.driver = get_driver()
+        self.budget = budget or ResultBudget()
+        self.cache = (cache or get_query_cache()) if use_cache else None
+
+    name = "expand_nodes"
+
+    description = """
+    1-hop expansion of seed nodes given by their __id__ (e.g. MachiningFeature_455b0c2e9f1a3d7b).
+    mode "neighbors" returns {seed, relationship, labels, neighbor} for outgoing relationships,
+    optionally limited to relationship_types; mode "label_counts" counts the neighbours in both
+    directions by relationship type and labels. Results of recent seeds are usually prefetched.
+    """
+    parameters = [{
+        "name": "ids",
+        "type": "array",
+        "description": "__id__ values of the seed nodes",
+        "required": True
+    }, {
+        "name": "relationship_types",
+        "type": "array",
+        "description": "Relationship types to follow, e.g. [\"BELONGS_TO_FEATURE\"]; empty means all",
+        "required": False
+    }, {
+        "name": "mode",
+        "type": "string",
+        "description": "\"neighbors\" (default) or \"label_counts\"",
+        "required": False
+    }]
+
+    def plan(self, ids: Iterable[str], relationship_types: Iterable[str] = (),
+             mode: str = "neighbors") -> List[Tuple[str, Dict[str, Any]]]:
+        # 与 execute_cypher 一样多取一行判断截断；预取必须用同样的查询文本才能命中缓存
+        return [(enforce_limit(cypher, self.budget.max_rows + 1), params)
+                for cypher, params in expansion_queries(ids, relationship_types, mode)]
+
+    @staticmethod
+    def _arguments(params: str) -> Tuple[List[str], List[str], str]:
+        payload = json.loads(params)
+        ids = payload["ids"]
+        if isinstance(ids, str):
+            ids = [ids]
+        return ids, payload.get("relationship_types") or [], payload.get("mode") or "neighbors"
+
+    def call(self, params: str, **kwargs):
+        records = []
+        for cypher, cypher_params in self.plan(*self._arguments(params)):
+            records.extend(cached_read(self.driver, cypher, cypher_params, self.budget, self.cache))
+        return records
+
+    async def acall(self, params: str, **kwargs):
+        plans = self.plan(*self._arguments(params))
+        results = await asyncio.gather(*(acached_read(cypher, cypher_params, self.budget, self.cache)
+                                         for cypher, cypher_params in plans))
+        return [record for records in results for record in records]
+
+
+def _iter_node_ids(value: Any) -> Iterator[str]:
+    if isinstance(value, str):
+        if NODE_ID_PATTERN.match(value):
+            yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _iter_node_ids(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _iter_node_ids(item)
+
+
+class NextHopPrefetcher:
+    """Runs the likely next ``expand_nodes`` calls while the model is still thinking.
+
+    The seeds are the loader ``__id__`` values found in a tool result. For each
+    label it fetches the next-hop relationship of the processing chain, all
+    outgoing relationships and the neighbour label counts. Results land in the
+    tool's query cache, whose ``prefetch_*`` counters show how many were used.
+    """
+
+    def __init__(self, tool: ExpandNodesTool, max_seeds: int = 16, concurrency: int = 4) -> None:
+        self.tool = tool
+        self.cache = tool.cache
+        self.max_seeds = max_seeds
+        self.concurrency = concurrency
+        self.scheduled = 0
+        self.skipped = 0
+        self.failed = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    def seeds(self, result: Any) -> List[str]:
+        return list(dict.fromkeys(_iter_node_ids(result)))[:self.max_seeds]
+
+    def plan(self, ids: List[str]) -> List[Tuple[str, Dict[str, Any]]]:
+        plans = []
+        for label, label_ids in group_node_ids(ids).items():
+            if label in NEXT_HOPS:
+                plans.extend(self.tool.plan(label_ids, [NEXT_HOPS[label]]))
+            plans.extend(self.tool.plan(label_ids))
+            plans.extend(self.tool.plan(label_ids, mode="label_counts"))
+        return plans
+
+    def observe(self, result: Any) -> int:
+        """Schedule prefetches for the seeds in ``result``; returns how many queries were started."""
+        if self.cache is None:
+            return 0
+        started = 0
+        for cypher, params in self.plan(self.seeds(result)):
+            key = self.cache.make_key(cypher, params, self.tool.budget)
+            if key in self.cache.pending or self.cache.contains(key):
+                self.skipped += 1
+                continue
+            task = asyncio.get_running_loop().create_task(self._fetch(key, cypher, params))
+            self.cache.pending[key] = task
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            started += 1
+        self.scheduled += started
+        return started
+
+    async def _fetch(self, key: str, cypher: str, params: Dict[str, Any]) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        try:
+            async with self._slots:
+                budget = self.tool.budget
+                async with get_async_driver().session(fetch_size=budget.fetch_size) as session:
+                    records = await aread_guarded(session, cypher, params, budget)
+                self.cache.put(key, records, prefetched=True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            print(f"Prefetch failed: {e}")
+        finally:
+            self.cache.pending.pop(key, None)
+
+    async def close(self) -> None:
+        """Cancel prefetches that are still running (before the drivers are closed)."""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        cache_stats = self.cache.stats() if self.cache is not None else {}
+        return {
+            "scheduled": self.scheduled,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "running": len(self._tasks),
+            **{key: value for key, value in cache_stats.items() if key.startswith("prefetch_")},
+        }
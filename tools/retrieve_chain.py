@@ -0,0 +1,39 @@
+import json
+
+from qwen_agent.tools.base import register_tool, BaseTool
+
+from utils.neo4j import get_driver
+from utils.retrieval import aretrieve_surface_chain, retrieve_surface_chain
+from utils.vector_handles import resolve_vector_params
+
+
+@register_tool('retrieve_surface_chain', allow_overwrite=True)
+class RetrieveSurfaceChainTool(BaseTool):
+    def __init__(self, timeout: int = 60 * 5) -> None:
+        self.driver = get_driver()
+
+    name = "retrieve_surface_chain"
+
+    description = """
+    Find the Top-K Surface nodes most similar to an embedding and return, in one call,
+    their MachiningFeature -> ProcessUnit -> Operation -> Tool chains.
+    """
+    parameters = [{
+        "name": "embedding",
+        "type": "string",
+        "description": "Vector handle of the query embedding (e.g. vec_1a2b3c4d5e6f7a8b), or the embedding array itself",
+        "required": True
+    }, {
+        "name": "k",
+        "type": "integer",
+        "description": "Number of similar surfaces to return, default 3",
+        "required": False
+    }]
+
+    def call(self, params: str, **kwargs):
+        payload = json.loads(params)
+        return retrieve_surface_chain(resolve_vector_params(payload["embedding"]), k=int(payload.get("k", 3)), driver=self.driver)
+
+    async def acall(self, params: str, **kwargs):
+        payload = json.loads(params)
+        return await aretrieve_surface_chain(resolve_vector_params(payload["embedding"]), k=int(payload.get("k", 3)))
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from utils.jsonhelper import IncrementalObjectScanner
+from utils.llm_cache import SessionRecorder, get_llm_cache
+
+# qwen_agent 的 LLM 调用是同步的，放到独立线程池里，避免阻塞事件循环
+LLM_WORKERS = int(os.environ.get("AGENT_LLM_WORKERS", 16))
+
+_llm_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_llm_executor() -> ThreadPoolExecutor:
+    global _llm_executor
+    if _llm_executor is None:
+        _llm_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="agent-llm")
+    return _llm_executor
+
+
+# 模型一步输出的对象至少带其中一个键；用于跳过回显的工具结果
+STEP_KEYS = ("call_paras", "tool_calls")
+# 流式输出中转发给调用方的字段
+STREAM_FIELDS = ("reasoning_content", "content")
+
+_STREAM_END = object()
+
+
+async def call_llm(bot, messages: List[dict], recorder: SessionRecorder = None, **kwargs) -> List[dict]:
+    """Await ``bot.run_nonstream`` (through the LLM_CACHE_MODE response cache) without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    cache = get_llm_cache()
+    responses = await loop.run_in_executor(_get_llm_executor(), lambda: cache.run_nonstream(bot, messages, **kwargs))
+    if recorder is not None:
+        recorder.add_responses(responses)
+    return responses
+
+
+class StreamedTurn:
+    """One streamed model turn: the step object as soon as it has closed, the full responses later."""
+
+    def __init__(self, step: Any, step_seconds: Optional[float], rest: "asyncio.Future[List[dict]]") -> None:
+        # 流中第一个完整的步骤对象；模型没输出可用对象时为 None
+        self.step = step
+        self.step_seconds = step_seconds
+        self._rest = rest
+
+    async def responses(self) -> List[dict]:
+        """Wait for the model to finish and return its responses as ``call_llm`` would."""
+        return await self._rest
+
+
+async def stream_llm(bot, messages: List[dict], on_text: Callable[[str, str], None] = None,
+                     recorder: SessionRecorder = None, expect_keys=STEP_KEYS, **kwargs) -> StreamedTurn:
+    """Stream ``bot.run`` and return as soon as the first step object in the output has closed.
+
+    ``on_text(field, delta)`` receives the new ``reasoning_content`` / ``content``
+    text of every update. The rest of the response keeps streaming in the
+    background; await ``StreamedTurn.responses()`` before the next turn.
+    Responses go through the LLM_CACHE_MODE cache like ``call_llm``.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    cache = get_llm_cache()
+    key = cache.make_key(bot, messages, **kwargs) if cache.mode != "off" else None
+    cached = cache.lookup(key) if key is not None else None
+
+    updates: asyncio.Queue = asyncio.Queue()
+    if cached is not None:
+        updates.put_nowait([message.model_dump() for message in cached])
+        updates.put_nowait(_STREAM_END)
+    else:
+        def produce() -> None:
+            try:
+                for responses in bot.run(messages, **kwargs):
+                    loop.call_soon_threadsafe(updates.put_nowait, responses)
+            except BaseException as e:
+                loop.call_soon_threadsafe(updates.put_nowait, e)
+            finally:
+                loop.call_soon_threadsafe(updates.put_nowait, _STREAM_END)
+
+        loop.run_in_executor(_get_llm_executor(), produce)
+
+    scanner = IncrementalObjectScanner(expect_keys)
+    first_step = loop.create_future()
+
+    async def consume() -> List[dict]:
+        responses: List[dict] = []
+        sent = dict.fromkeys(STREAM_FIELDS, 0)
+        while True:
+            update = await updates.get()
+            if update is _STREAM_END:
+                break
+            if isinstance(update, BaseException):
+                raise update
+            responses = update
+            message = responses[0] if responses else {}
+            for name in STREAM_FIELDS:
+                text = message.get(name) or ""
+                if isinstance(text, str) and len(text) > sent[name]:
+                    if on_text is not None:
+                        on_text(name, text[sent[name]:])
+                    sent[name] = len(text)
+            if not first_step.done() and scanner.feed(message.get("content") or "") is not None:
+                first_step.set_result(time.perf_counter() - started)
+        if key is not None and cached is None:
+            cache.put(key, messages, responses)
+        if recorder is not None:
+            recorder.add_responses(responses)
+        return responses
+
+    rest = asyncio.ensure_future(consume())
+    await asyncio.wait({first_step, rest}, return_when=asyncio.FIRST_COMPLETED)
+    if first_step.done():
+        return StreamedTurn(scanner.value, first_step.result(), rest)
+    responses = rest.result()
+    content = (responses[0].get("content") or "") if responses else ""
+    return StreamedTurn(scanner.finish(content), None, rest)
+
+
+def tool_calls_of(response_json: Any) -> List[Dict[str, Any]]:
+    """Normalize one model turn into a list of ``{reason, tool_name, call_paras}`` calls.
+
+    A turn is either a single call, a list of calls, or ``{"reason", "tool_calls": [...]}``.
+    """
+    if isinstance(response_json, list):
+        return [dict(call) for call in response_json]
+    calls = response_json.get("tool_calls")
+    if not isinstance(calls, list):
+        return [response_json]
+    reason = response_json.get("reason", "")
+    return [{"reason": reason, **call} for call in calls]
+
+
+async def run_tool(function_map: Dict[str, Any], tool_name: str, params: str) -> Any:
+    """Run one tool, preferring its async ``acall``; sync tools run in a worker thread."""
+    try:
+        cache = get_llm_cache()
+        if cache.mode == "replay":
+            return cache.get_tool_result(cache.tool_key(tool_name, params))
+        tool = function_map[tool_name]
+        acall = getattr(tool, "acall", None)
+        if acall is not None:
+            result = await acall(params)
+        else:
+            result = await asyncio.to_thread(tool.call, params)
+        if cache.mode == "record":
+            cache.put_tool_result(cache.tool_key(tool_name, params), tool_name, params, result)
+        return result
+    except Exception as e:
+        print(f"Failed to run tool {tool_name}")
+        print(traceback.format_exc())
+        return f"Tool execution failed: {e}"
+
+
+async def run_tool_calls(function_map: Dict[str, Any], calls: List[Dict[str, Any]],
+                         concurrent: bool = True) -> List[Any]:
+    """Run the calls of one model turn, concurrently when they are independent."""
+    jobs = [run_tool(function_map, call.get("tool_name"), json.dumps(call.get("call_paras", {})))
+            for call in calls]
+    if concurrent:
+        return list(await asyncio.gather(*jobs))
+    return [await job for job in jobs]
+
+
+class LatencyRecorder:
+    """Keeps the most recent latency samples per step and reports count/mean/p50/p95/p99 (ms)."""
+
+    def __init__(self, window: int = 10000) -> None:
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+
+    def record(self, step: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(step)
+            if samples is None:
+                samples = self._samples[step] = deque(maxlen=self.window)
+            samples.append(seconds)
+            self._counts[step] = self._counts.get(step, 0) + 1
+
+    @staticmethod
+    def _percentile(ordered: List[float], q: float) -> float:
+        # nearest-rank
+        return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            snapshot = {step: (sorted(samples), self._counts[step]) for step, samples in self._samples.items()}
+        report = {}
+        for step, (ordered, count) in snapshot.items():
+            if not ordered:
+                continue
+            report[step] = {
+                "count": count,
+                "mean_ms": sum(ordered) / len(ordered) * 1000,
+                "p50_ms": self._percentile(ordered, 50) * 1000,
+                "p95_ms": self._percentile(ordered, 95) * 1000,
+                "p99_ms": self._percentile(ordered, 99) * 1000,
+            }
+        return report
@@ -0,0 +1,92 @@
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def chunked(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    if size <= 0:
+        raise ValueError("Batch size must be positive.")
+    batch: List[dict] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _run_unwind(tx, cypher: str, rows: List[dict], params: dict) -> None:
+    tx.run(cypher, rows=rows, **params).consume()
+
+
+def _run_unwind_returning(tx, cypher: str, rows: List[dict], params: dict) -> List[dict]:
+    return [record.data() for record in tx.run(cypher, rows=rows, **params)]
+
+
+@dataclass
+class StageStats:
+    rows: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        if not self.seconds:
+            return 0.0
+        return self.rows / self.seconds
+
+
+class BulkWriter:
+    """Write parameter rows with ``UNWIND $rows`` in chunked transactions.
+
+    Every statement handed to :meth:`write` must start with ``UNWIND $rows AS row``;
+    extra keyword arguments are passed through as shared query parameters.
+    """
+
+    def __init__(self, session, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive.")
+        self.session = session
+        self.batch_size = batch_size
+        self.stats: Dict[str, StageStats] = {}
+
+    def write(self, stage: str, cypher: str, rows: Iterable[dict], **params) -> int:
+        stats = self.stats.setdefault(stage, StageStats())
+        written = 0
+        for batch in chunked(rows, self.batch_size):
+            start = time.perf_counter()
+            self.session.execute_write(_run_unwind, cypher, batch, params)
+            stats.seconds += time.perf_counter() - start
+            stats.rows += len(batch)
+            stats.batches += 1
+            written += len(batch)
+        return written
+
+    def write_returning(self, stage: str, cypher: str, rows: Iterable[dict], **params) -> List[dict]:
+        """Like :meth:`write`, but collect the records every batch returns."""
+        stats = self.stats.setdefault(stage, StageStats())
+        records: List[dict] = []
+        for batch in chunked(rows, self.batch_size):
+            start = time.perf_counter()
+            records.extend(self.session.execute_write(_run_unwind_returning, cypher, batch, params))
+            stats.seconds += time.perf_counter() - start
+            stats.rows += len(batch)
+            stats.batches += 1
+        return records
+
+    def report(self) -> None:
+        total_rows = 0
+        total_seconds = 0.0
+        for stage, stats in self.stats.items():
+            total_rows += stats.rows
+            total_seconds += stats.seconds
+            print(
+                f"{stage:<24} {stats.rows:>8} rows  {stats.batches:>4} tx  "
+                f"{stats.seconds:8.3f}s  {stats.rows_per_sec:10.1f} rows/s"
+            )
+        if total_seconds:
+            print(f"{'total':<24} {total_rows:>8} rows  {total_seconds:8.3f}s  "
+                  f"{total_rows / total_seconds:10.1f} rows/s")
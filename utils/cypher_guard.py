@@ -0,0 +1,211 @@
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from neo4j import unit_of_work
+
+# 智能体查询的默认结果预算，可用环境变量覆盖
+DEFAULT_MAX_ROWS = int(os.environ.get("CYPHER_MAX_ROWS", 200))
+DEFAULT_MAX_BYTES = int(os.environ.get("CYPHER_MAX_BYTES", 256 * 1024))
+DEFAULT_FETCH_SIZE = int(os.environ.get("CYPHER_FETCH_SIZE", 100))
+# 单条查询的服务端超时（秒）与 EXPLAIN 估算行数上限
+DEFAULT_QUERY_TIMEOUT = float(os.environ.get("CYPHER_TIMEOUT", 30))
+DEFAULT_MAX_ESTIMATED_ROWS = int(os.environ.get("CYPHER_MAX_ESTIMATED_ROWS", 10_000_000))
+# 默认不返回的属性（64 维向量会撑爆提示词）
+STRIPPED_PROPERTIES = ("embedding",)
+
+# 计划中出现即视为写操作（operatorType 去掉 @neo4j 等后缀后按前缀匹配）
+WRITE_OPERATOR_PREFIXES = (
+    "Create", "Merge", "Delete", "DetachDelete", "Set", "Remove", "Foreach",
+    "LoadCSV", "TransactionForeach", "TransactionApply",
+)
+
+_RETURN_RE = re.compile(r"\bRETURN\b", re.I)
+_TAIL_LIMIT_RE = re.compile(r"\bLIMIT\s+(\d+)\s*$", re.I)
+# 字符串/反引号标识符原样保留，只匹配它们之外的 // 行注释和 /* */ 块注释
+_COMMENT_RE = re.compile(
+    r"'(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\"|`[^`]*`|(//[^\n]*|/\*.*?\*/)", re.S
+)
+
+
+def _strip_comments(cypher: str) -> str:
+    return _COMMENT_RE.sub(lambda match: " " if match.group(1) else match.group(), cypher)
+
+
+@dataclass
+class ResultBudget:
+    max_rows: int = DEFAULT_MAX_ROWS
+    max_bytes: int = DEFAULT_MAX_BYTES
+    fetch_size: int = DEFAULT_FETCH_SIZE
+    stripped_properties: Tuple[str, ...] = STRIPPED_PROPERTIES
+    timeout: float = DEFAULT_QUERY_TIMEOUT
+    max_estimated_rows: int = DEFAULT_MAX_ESTIMATED_ROWS
+
+
+class QueryRejected(ValueError):
+    """Raised when an agent query is not read-only or its plan looks too expensive."""
+
+
+@dataclass
+class PlanCheck:
+    query_type: str
+    operators: List[str] = field(default_factory=list)
+    max_estimated_rows: float = 0.0
+    reasons: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.reasons
+
+
+def enforce_limit(cypher: str, limit: int) -> str:
+    """Append ``LIMIT limit`` to a query ending in RETURN, or lower a larger literal LIMIT.
+
+    Queries without a final RETURN (procedure calls, SHOW, subquery-only) and
+    UNION queries are left alone; the row budget still applies to them.
+    Comments are removed first, so a trailing ``// ...`` cannot swallow the LIMIT.
+    """
+    stripped = _strip_comments(cypher).strip().rstrip(";").rstrip()
+    returns = list(_RETURN_RE.finditer(stripped))
+    if not returns or re.search(r"\bUNION\b", stripped, re.I):
+        return stripped
+    tail = stripped[returns[-1].start():]
+    if "}" in tail:
+        return stripped
+    match = _TAIL_LIMIT_RE.search(stripped)
+    if match:
+        if int(match.group(1)) > limit:
+            return f"{stripped[:match.start()]}LIMIT {limit}"
+        return stripped
+    if re.search(r"\bLIMIT\b", tail, re.I):
+        # LIMIT $param 等无法静态判断，交给行预算
+        return stripped
+    return f"{stripped} LIMIT {limit}"
+
+
+def strip_properties(value: Any, keys: Tuple[str, ...] = STRIPPED_PROPERTIES) -> Any:
+    if isinstance(value, dict):
+        return {key: strip_properties(item, keys) for key, item in value.items() if key not in keys}
+    if isinstance(value, list):
+        return [strip_properties(item, keys) for item in value]
+    return value
+
+
+class ResultCollector:
+    """Accumulates projected records until the row or byte budget is exhausted."""
+
+    def __init__(self, budget: ResultBudget) -> None:
+        self.budget = budget
+        self.rows: List[Dict[str, Any]] = []
+        self.bytes = 0
+        self.truncated: Optional[str] = None
+
+    def add(self, data: Dict[str, Any]) -> bool:
+        """Add one record; returns False once the caller should stop reading."""
+        if len(self.rows) >= self.budget.max_rows:
+            self.truncated = "row_limit"
+            return False
+        row = strip_properties(data, self.budget.stripped_properties)
+        size = len(json.dumps(row, ensure_ascii=False, default=str))
+        if self.rows and self.bytes + size > self.budget.max_bytes:
+            self.truncated = "byte_budget"
+            return False
+        self.rows.append(row)
+        self.bytes += size
+        return True
+
+    def result(self) -> List[Dict[str, Any]]:
+        if self.truncated is None:
+            return self.rows
+        marker = {
+            "__truncated__": True,
+            "reason": self.truncated,
+            "returned_rows": len(self.rows),
+            "hint": "Result was cut off; add WHERE filters, a smaller LIMIT or return fewer properties.",
+        }
+        return self.rows + [marker]
+
+
+def collect_records(result, budget: ResultBudget) -> List[Dict[str, Any]]:
+    """Read a neo4j result lazily, stopping at the budget; unread records are discarded."""
+    collector = ResultCollector(budget)
+    for record in result:
+        if not collector.add(record.data()):
+            break
+    return collector.result()
+
+
+async def acollect_records(result, budget: ResultBudget) -> List[Dict[str, Any]]:
+    collector = ResultCollector(budget)
+    async for record in result:
+        if not collector.add(record.data()):
+            break
+    return collector.result()
+
+
+_UNBOUNDED_VAR_LENGTH = re.compile(r"\*(\d*)(\.\.)?\]")
+
+
+def _is_unbounded(expression: str) -> bool:
+    for match in _UNBOUNDED_VAR_LENGTH.finditer(expression):
+        if not match.group(1) or match.group(2):
+            return True
+    return False
+
+
+def check_plan(summary, budget: ResultBudget) -> PlanCheck:
+    """Inspect an EXPLAIN summary: read-only query type, no write operators, bounded estimates and paths."""
+    check = PlanCheck(query_type=summary.query_type or "")
+    if check.query_type != "r":
+        check.reasons.append(f"query type {check.query_type!r} is not read-only")
+
+    stack = [summary.plan] if summary.plan else []
+    while stack:
+        plan = stack.pop()
+        operator = plan.get("operatorType", "").split("@")[0]
+        arguments = plan.get("args") or plan.get("arguments") or {}
+        check.operators.append(operator)
+        if operator.startswith(WRITE_OPERATOR_PREFIXES):
+            check.reasons.append(f"write operator {operator}")
+        estimated = float(arguments.get("EstimatedRows", 0) or 0)
+        check.max_estimated_rows = max(check.max_estimated_rows, estimated)
+        if estimated > budget.max_estimated_rows:
+            check.reasons.append(f"{operator} is estimated at {estimated:.0f} rows")
+        if operator.startswith("VarLengthExpand"):
+            expression = f"{arguments.get('Details', '')} {arguments.get('ExpandExpression', '')}"
+            if _is_unbounded(expression):
+                check.reasons.append(f"{operator} has an unbounded variable-length path")
+        stack.extend(plan.get("children", []))
+    return check
+
+
+def _rejected(cypher: str, check: PlanCheck) -> QueryRejected:
+    return QueryRejected(f"Query rejected ({'; '.join(check.reasons)}). Rewrite it as a bounded read-only query: {cypher}")
+
+
+def read_guarded(session, cypher: str, params: Optional[Dict[str, Any]], budget: ResultBudget) -> List[Dict[str, Any]]:
+    """Run ``cypher`` in a managed read transaction after an EXPLAIN check, with a server-side timeout."""
+
+    @unit_of_work(timeout=budget.timeout)
+    def work(tx):
+        check = check_plan(tx.run(f"EXPLAIN {cypher}", params or {}).consume(), budget)
+        if not check.ok:
+            raise _rejected(cypher, check)
+        return collect_records(tx.run(cypher, params or {}), budget)
+
+    return session.execute_read(work)
+
+
+async def aread_guarded(session, cypher: str, params: Optional[Dict[str, Any]],
+                        budget: ResultBudget) -> List[Dict[str, Any]]:
+    @unit_of_work(timeout=budget.timeout)
+    async def work(tx):
+        explained = await tx.run(f"EXPLAIN {cypher}", params or {})
+        check = check_plan(await explained.consume(), budget)
+        if not check.ok:
+            raise _rejected(cypher, check)
+        return await acollect_records(await tx.run(cypher, params or {}), budget)
+
+    return await session.execute_read(work)
@@ -0,0 +1,416 @@
+import json
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.graph_version import get_graph_version_source
+from utils.manifest import INGEST_SOURCE
+from utils.multi_graph import NODE_STAGE_LABELS, build_multi_graph_rows
+
+# 入库行里的关系：stage -> (起点字段, 关系类型, 终点字段)
+EDGE_STAGES = {
+    "curve_surface": ("curve_id", "BOUNDARY_OF", "surface_id"),
+    "feature_adjacent": ("src_id", "ADJACENT_MFEATURE", "tar_id"),
+    "surface_feature": ("surface_id", "BELONGS_TO_FEATURE", "feature_id"),
+    "process_adjacent": ("left_id", "ADJACENT_PROCESS", "right_id"),
+    "feature_process": ("feature_id", "ASSIGNED_TO_PROCESS", "process_id"),
+    "process_operation": ("process_id", "INCLUDES_OPERATION", "operation_name"),
+}
+DIRECTIONS = ("out", "in", "both")
+# 镜像里不保留的大属性
+DROPPED_PROPERTIES = ("embedding",)
+
+SNAPSHOT_NODE_QUERY = """
+MATCH (n)
+WHERE NOT n:__Meta__ AND ($file_ids IS NULL OR n.__fileId__ IN $file_ids)
+RETURN coalesce(n.__id__, elementId(n)) AS key, labels(n)[0] AS label, n.__fileId__ AS file_id,
+       CASE WHEN $with_properties THEN n {.*} ELSE {} END AS props
+"""
+SNAPSHOT_EDGE_QUERY = """
+MATCH (a)-[r]->(b)
+WHERE NOT a:__Meta__ AND ($file_ids IS NULL OR a.__fileId__ IN $file_ids)
+RETURN coalesce(a.__id__, elementId(a)) AS src, a.__fileId__ AS file_id, type(r) AS type,
+       coalesce(b.__id__, elementId(b)) AS dst, labels(b)[0] AS dst_label, b.__fileId__ AS dst_file_id
+"""
+
+
+def operation_key(prt_file_id: str, operation_name: str) -> str:
+    """Placeholder key of an Operation only known by name from the ingestion rows.
+
+    Neo4j keys Operations by ``Operation_<hash>`` of their properties, which the
+    rows do not carry; rows resolve to that node when the mirror already has it.
+    """
+    return f"Operation@{prt_file_id}/{operation_name}"
+
+
+@dataclass
+class _CSR:
+    indptr: np.ndarray
+    indices: np.ndarray
+    types: np.ndarray
+
+
+def _csr(keys: np.ndarray, values: np.ndarray, types: np.ndarray, size: int) -> _CSR:
+    order = np.argsort(keys, kind="stable")
+    indptr = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=size), out=indptr[1:])
+    return _CSR(indptr, values[order], types[order])
+
+
+class GraphMirror:
+    """Read-only in-process copy of the knowledge graph in CSR form.
+
+    Nodes are keyed by ``__id__`` (``elementId`` when missing). Edges are kept per
+    ``__fileId__`` of their start node, so one part can be refreshed without
+    touching the rest; the out/in CSR arrays are rebuilt lazily on the next query.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._keys: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._label_codes: List[int] = []
+        self._files: List[Optional[str]] = []
+        self.properties: List[Dict[str, Any]] = []
+        self.label_names: List[str] = []
+        self._label_index: Dict[str, int] = {}
+        self.type_names: List[str] = []
+        self._type_index: Dict[str, int] = {}
+        self._file_edges: Dict[Optional[str], Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+        self._file_nodes: Dict[Optional[str], set] = {}
+        # (__fileId__, Name) -> 从 Neo4j 读到的 Operation 节点
+        self._operations: Dict[Tuple[Optional[str], str], int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._labels = np.zeros(0, dtype=np.int32)
+        self._out: Optional[_CSR] = None
+        self._in: Optional[_CSR] = None
+        self.graph_version: Optional[int] = None
+        self.synced_at: Optional[str] = None
+
+    # ------------------------------------------------------------------ 写入
+
+    def _code(self, names: List[str], index: Dict[str, int], name: str) -> int:
+        code = index.get(name)
+        if code is None:
+            code = index[name] = len(names)
+            names.append(name)
+        return code
+
+    def _node(self, key: str, label: Optional[str], file_id: Optional[str],
+              props: Optional[Dict[str, Any]] = None) -> int:
+        position = self._index.get(key)
+        label_code = self._code(self.label_names, self._label_index, label or "") if label or position is None else 0
+        if position is None:
+            position = self._index[key] = len(self._keys)
+            self._keys.append(key)
+            self._label_codes.append(label_code)
+            self._files.append(file_id)
+            self.properties.append({})
+        elif label:
+            self._label_codes[position] = label_code
+        if props is not None:
+            self.properties[position] = {
+                name: value for name, value in props.items()
+                if name not in DROPPED_PROPERTIES and value is not None
+            }
+        return position
+
+    def _replace_file(self, file_id: Optional[str], owned: set,
+                      edges: List[Tuple[int, int, int]]) -> None:
+        """Swap in the nodes and edges of one file; its nodes that disappeared are hidden."""
+        self._file_nodes.setdefault(file_id, set())
+        gone = self._file_nodes[file_id] - owned
+        self._file_nodes[file_id] = owned
+        if edges:
+            src, dst, types = (np.asarray(column, dtype=np.int32) for column in zip(*edges))
+        else:
+            src = dst = types = np.zeros(0, dtype=np.int32)
+        self._file_edges[file_id] = (src, dst, types)
+
+        alive = np.zeros(len(self._keys), dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        alive[len(self._alive):] = True
+        alive[list(owned)] = True
+        if gone:
+            alive[list(gone)] = False
+        self._alive = alive
+        self._out = self._in = None
+
+    def _operation(self, prt_file_id: str, name: str, owned: set) -> int:
+        position = self._operations.get((prt_file_id, name))
+        if position is not None and self._alive[position]:
+            return position
+        # 库里还没有这道工序：建一个归属本零件的占位节点，零件重载时随之隐藏
+        position = self._node(operation_key(prt_file_id, name), "Operation", prt_file_id,
+                              {"Name": name, "__fileId__": prt_file_id})
+        owned.add(position)
+        return position
+
+    def load_rows(self, file_id: str, rows: Dict[str, List[dict]], prt_file_id: str = None) -> None:
+        """Load (or replace) one part from ``build_multi_graph_rows`` output.
+
+        ``prt_file_id`` is required when the rows link processes to operations.
+        """
+        if rows.get("process_operation") and not prt_file_id:
+            raise ValueError(f"prt_file_id is required to load the process operations of {file_id}.")
+        with self._lock:
+            owned = set()
+            for stage, label in NODE_STAGE_LABELS.items():
+                for row in rows.get(stage, []):
+                    owned.add(self._node(row["identifier"], label, file_id, row.get("props")))
+            edges = []
+            for stage, (src_field, rel_type, dst_field) in EDGE_STAGES.items():
+                type_code = self._code(self.type_names, self._type_index, rel_type)
+                for row in rows.get(stage, []):
+                    src = self._node(row[src_field], None, file_id)
+                    if stage == "process_operation":
+                        dst = self._operation(prt_file_id, row[dst_field], owned)
+                    else:
+                        dst = self._node(row[dst_field], None, file_id)
+                    edges.append((src, dst, type_code))
+            self._replace_file(file_id, owned, edges)
+
+    def load_json(self, json_path, file_id: str, prt_file_id: str = None) -> None:
+        """Load one multi-graph ingestion JSON file without going through Neo4j."""
+        with open(json_path, "r", encoding="utf-8") as f:
+            para_dict = json.load(f)
+        self.load_rows(file_id, build_multi_graph_rows(file_id, para_dict), prt_file_id)
+
+    def load_neo4j(self, driver, file_ids: Optional[Sequence[str]] = None,
+                   with_properties: bool = True, fetch_size: int = 10000) -> None:
+        """Snapshot the graph (or only the nodes and outgoing edges of ``file_ids``) from Neo4j."""
+        params = {"file_ids": list(file_ids) if file_ids is not None else None, "with_properties": with_properties}
+        with driver.session(fetch_size=fetch_size) as session:
+            nodes = [(record["key"], record["label"], record["file_id"], record["props"])
+                     for record in session.run(SNAPSHOT_NODE_QUERY, params)]
+            edges = [(record["src"], record["file_id"], record["type"], record["dst"], record["dst_label"],
+                      record["dst_file_id"]) for record in session.run(SNAPSHOT_EDGE_QUERY, params)]
+
+        # 读完再一次性替换，查询不会看到半截快照
+        with self._lock:
+            owned: Dict[Optional[str], set] = {file_id: set() for file_id in file_ids or ()}
+            for key, label, file_id, props in nodes:
+                position = self._node(key, label, file_id, props)
+                owned.setdefault(file_id, set()).add(position)
+                if label == "Operation" and props.get("Name") is not None:
+                    self._operations[(file_id, props["Name"])] = position
+            file_edges: Dict[Optional[str], List[Tuple[int, int, int]]] = {file_id: [] for file_id in owned}
+            for src_key, file_id, rel_type, dst_key, dst_label, dst_file_id in edges:
+                src = self._node(src_key, None, file_id)
+                dst = self._node(dst_key, dst_label, dst_file_id)
+                type_code = self._code(self.type_names, self._type_index, rel_type)
+                file_edges.setdefault(file_id, []).append((src, dst, type_code))
+            if file_ids is None:
+                # 全量快照：快照里没有的文件整体移除
+                for file_id in set(self._file_edges) - set(file_edges):
+                    self._replace_file(file_id, set(), [])
+            for file_id, rows in file_edges.items():
+                self._replace_file(file_id, owned.get(file_id, set()), rows)
+
+    def sync(self, driver, manifest=None) -> List[Optional[str]]:
+        """Refresh from Neo4j when the graph version moved.
+
+        With an ``IngestManifest``, only the parts recorded since the last sync are
+        reloaded, provided the single version bump since then came from the
+        ingestion that writes the manifest. Any other change (embeddings, type
+        nodes, indexes, several bumps) reloads the whole graph. Returns the
+        refreshed file ids, including those of replaced parts that were dropped
+        (``[None]`` for a full reload).
+        """
+        version, source = get_graph_version_source(driver)
+        if self.graph_version is not None and version == self.graph_version:
+            return []
+        now = datetime.now(timezone.utc).isoformat()
+        refreshed = []
+        if manifest is not None and self.synced_at is not None and \
+                version == self.graph_version + 1 and source == INGEST_SOURCE:
+            refreshed = sorted({part.file_id for part in manifest.changed_since(self.synced_at)})
+        if refreshed:
+            # STP 变化的零件换了 file_id，旧 file_id 的节点在库里已删除，镜像里也要移除
+            dropped = [file_id for file_id in manifest.replaced_since(self.synced_at) if file_id not in refreshed]
+            self.load_neo4j(driver, refreshed)
+            with self._lock:
+                for file_id in dropped:
+                    if file_id in self._file_nodes:
+                        self._replace_file(file_id, set(), [])
+            refreshed = sorted(refreshed + dropped)
+        else:
+            self.load_neo4j(driver)
+            refreshed = [None]
+        self.graph_version = version
+        self.synced_at = now
+        return refreshed
+
+    # ------------------------------------------------------------------ 查询
+
+    def _build(self) -> Tuple[_CSR, _CSR]:
+        with self._lock:
+            if self._out is None:
+                size = len(self._keys)
+                parts = list(self._file_edges.values())
+                if parts:
+                    src, dst, types = (np.concatenate(column) for column in zip(*parts))
+                else:
+                    src = dst = types = np.zeros(0, dtype=np.int32)
+                self._labels = np.asarray(self._label_codes, dtype=np.int32)
+                self._out = _csr(src, dst, types, size)
+                self._in = _csr(dst, src, types, size)
+            return self._out, self._in
+
+    def _positions(self, keys: Iterable[str]) -> np.ndarray:
+        positions = np.asarray([self._index[key] for key in keys if key in self._index], dtype=np.int64)
+        return positions[self._alive[positions]]
+
+    def _mask(self, names: Optional[Iterable[str]], index: Dict[str, int], size: int) -> Optional[np.ndarray]:
+        if names is None:
+            return None
+        mask = np.zeros(max(size, 1), dtype=bool)
+        for name in names:
+            if name in index:
+                mask[index[name]] = True
+        return mask
+
+    def _expand(self, frontier: np.ndarray, direction: str,
+                type_mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """All ``(frontier row, neighbour)`` pairs one hop away, as two parallel arrays."""
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction {direction!r}, expected one of {DIRECTIONS}.")
+        out_csr, in_csr = self._build()
+        csrs = {"out": (out_csr,), "in": (in_csr,), "both": (out_csr, in_csr)}[direction]
+        rows, neighbours = [], []
+        for csr in csrs:
+            starts = csr.indptr[frontier]
+            lengths = csr.indptr[frontier + 1] - starts
+            total = int(lengths.sum())
+            if not total:
+                continue
+            # 把每个起点的 [start, end) 区间拼成一个下标数组
+            offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+            row = np.repeat(np.arange(len(frontier)), lengths)
+            found = csr.indices[offsets]
+            if type_mask is not None:
+                keep = type_mask[csr.types[offsets]]
+                row, found = row[keep], found[keep]
+            rows.append(row)
+            neighbours.append(found)
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)
+        rows, neighbours = np.concatenate(rows), np.concatenate(neighbours)
+        keep = self._alive[neighbours]
+        return rows[keep], neighbours[keep]
+
+    def _node_filter(self, labels: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+        label_mask = self._mask(labels, self._label_index, len(self.label_names))
+        return None if label_mask is None else label_mask[self._labels]
+
+    def label_of(self, key: str) -> Optional[str]:
+        position = self._index.get(key)
+        return None if position is None else self.label_names[self._label_codes[position]]
+
+    def node(self, key: str) -> Optional[Dict[str, Any]]:
+        position = self._index.get(key)
+        if position is None or not self._alive[position]:
+            return None
+        return {"__id__": key, "label": self.label_of(key), **self.properties[position]}
+
+    def nodes(self, label: str = None, file_id: str = None) -> List[str]:
+        """Keys of the live nodes, optionally of one label and/or one ``__fileId__``."""
+        self._build()
+        mask = self._alive.copy()
+        if label is not None:
+            mask &= self._labels == self._label_index.get(label, -1)
+        if file_id is not None:
+            mask &= np.fromiter((value == file_id for value in self._files), dtype=bool, count=len(self._files))
+        return [self._keys[position] for position in np.flatnonzero(mask)]
+
+    def neighbors(self, key: str, relationship_types: Iterable[str] = None, direction: str = "out",
+                  labels: Iterable[str] = None) -> List[str]:
+        return [node for node, hops in self.k_hop([key], 1, relationship_types, direction, labels).items() if hops]
+
+    def k_hop(self, seeds: Iterable[str], k: int, relationship_types: Iterable[str] = None,
+              direction: str = "out", labels: Iterable[str] = None) -> Dict[str, int]:
+        """Nodes within ``k`` hops of the seeds with their hop distance (seeds at 0).
+
+        ``labels`` restricts the nodes that may be visited, so a walk never
+        passes through other labels.
+        """
+        self._build()
+        type_mask = self._mask(relationship_types, self._type_index, len(self.type_names))
+        node_mask = self._node_filter(labels)
+        distance = np.full(len(self._keys), -1, dtype=np.int32)
+        frontier = self._positions(seeds)
+        distance[frontier] = 0
+        for hop in range(1, k + 1):
+            if not len(frontier):
+                break
+            _, found = self._expand(frontier, direction, type_mask)
+            found = found[distance[found] < 0]
+            if node_mask is not None:
+                found = found[node_mask[found]]
+            frontier = np.unique(found)
+            distance[frontier] = hop
+        reached = np.flatnonzero(distance >= 0)
+        return {self._keys[position]: int(distance[position]) for position in reached}
+
+    def shortest_path(self, source: str, target: str, relationship_types: Iterable[str] = None,
+                      direction: str = "both", max_hops: int = 8,
+                      labels: Iterable[str] = None) -> Optional[List[str]]:
+        """Breadth-first shortest path as a list of keys, or None within ``max_hops``."""
+        if source not in self._index or target not in self._index:
+            return None
+        self._build()
+        type_mask = self._mask(relationship_types, self._type_index, len(self.type_names))
+        node_mask = self._node_filter(labels)
+        start, goal = self._index[source], self._index[target]
+        parent = np.full(len(self._keys), -1, dtype=np.int64)
+        parent[start] = start
+        frontier = np.asarray([start], dtype=np.int64)
+        for _ in range(max_hops):
+            if parent[goal] >= 0 or not len(frontier):
+                break
+            rows, found = self._expand(frontier, direction, type_mask)
+            keep = parent[found] < 0
+            if node_mask is not None:
+                keep &= node_mask[found] | (found == goal)
+            rows, found = rows[keep], found[keep]
+            found, first = np.unique(found, return_index=True)
+            parent[found] = frontier[rows[first]]
+            frontier = found
+        if parent[goal] < 0:
+            return None
+        path = [goal]
+        while path[-1] != start:
+            path.append(int(parent[path[-1]]))
+        return [self._keys[position] for position in reversed(path)]
+
+    def paths(self, seeds: Iterable[str], relationship_types: Sequence[str], direction: str = "out",
+              limit: int = 10000) -> List[List[str]]:
+        """Every path from the seeds that follows ``relationship_types`` hop by hop.
+
+        E.g. ``["BELONGS_TO_FEATURE", "ASSIGNED_TO_PROCESS", "INCLUDES_OPERATION", "USES_TOOL"]``
+        walks Surface -> MachiningFeature -> ProcessUnit -> Operation -> Tool;
+        at most ``limit`` paths are kept at every hop.
+        """
+        matrix = self._positions(seeds).reshape(-1, 1)
+        for rel_type in relationship_types:
+            if not len(matrix):
+                break
+            type_mask = self._mask([rel_type], self._type_index, len(self.type_names))
+            rows, found = self._expand(matrix[:, -1], direction, type_mask)
+            matrix = np.column_stack((matrix[rows], found))[:limit]
+        return [[self._keys[position] for position in row] for row in matrix]
+
+    def stats(self) -> Dict[str, Any]:
+        out_csr, _ = self._build()
+        return {
+            "nodes": int(self._alive.sum()),
+            "slots": len(self._keys),
+            "edges": int(len(out_csr.indices)),
+            "files": len(self._file_edges),
+            "labels": len(self.label_names),
+            "relationship_types": len(self.type_names),
+            "graph_version": self.graph_version,
+        }
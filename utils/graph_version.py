@@ -0,0 +1,49 @@
+from typing import Optional, Tuple
+
+# 单个元数据节点记录图谱版本；任何加载脚本写入后递增，缓存据此失效
+META_LABEL = "__Meta__"
+META_KEY = "graph"
+
+BUMP_QUERY = f"""
+MERGE (m:{META_LABEL} {{key: $key}})
+SET m.version = coalesce(m.version, 0) + 1,
+    m.updatedAt = datetime(),
+    m.updatedBy = $source
+RETURN m.version AS version
+"""
+
+VERSION_QUERY = f"""
+OPTIONAL MATCH (m:{META_LABEL} {{key: $key}})
+RETURN coalesce(m.version, 0) AS version
+"""
+
+SOURCE_QUERY = f"""
+OPTIONAL MATCH (m:{META_LABEL} {{key: $key}})
+RETURN coalesce(m.version, 0) AS version, m.updatedBy AS source
+"""
+
+
+def bump_graph_version(driver, source: str = "") -> int:
+    """Record that the graph (data or schema) changed; returns the new version."""
+    with driver.session() as session:
+        return session.run(BUMP_QUERY, key=META_KEY, source=source).single()["version"]
+
+
+def get_graph_version(driver) -> int:
+    with driver.session() as session:
+        record: Optional[dict] = session.run(VERSION_QUERY, key=META_KEY).single()
+    return int(record["version"]) if record else 0
+
+
+def get_graph_version_source(driver) -> Tuple[int, Optional[str]]:
+    """The current version and the ``source`` of the bump that produced it."""
+    with driver.session() as session:
+        record = session.run(SOURCE_QUERY, key=META_KEY).single()
+    return (int(record["version"]), record["source"]) if record else (0, None)
+
+
+async def aget_graph_version(driver) -> int:
+    async with driver.session() as session:
+        result = await session.run(VERSION_QUERY, key=META_KEY)
+        record = await result.single()
+    return int(record["version"]) if record else 0
@@ -1,19 +1,204 @@
 import hashlib
 import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# 超过该大小的文件用 mmap 整体喂给 hashlib（释放 GIL，避免逐块拷贝）
+MMAP_THRESHOLD = 64 * 1024 * 1024
+DEFAULT_HASH_CACHE_PATH = "hash_cache.sqlite"
+# compat: 与 generate_object_hash_id 历史结果一致；fast: 二进制规范编码 + BLAKE2b
+HASH_MODES = ("compat", "fast")
+DEFAULT_HASH_MODE = os.environ.get("OBJECT_HASH_MODE", "compat")
+
 
 def file_hash(path, algo="sha256", chunk_size=1024 * 1024):
     h = hashlib.new(algo)
     with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(chunk_size), b""):
-            h.update(chunk)
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                h.update(mapped)
+        else:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                h.update(chunk)
     return h.hexdigest()[:16]
 
+
+def _stat_key(path: str) -> Tuple[int, int, int]:
+    stat_result = os.stat(path)
+    return stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino
+
+
+class HashCache:
+    """Persistent file hashes keyed by (path, size, mtime_ns, inode); unchanged files are never reread."""
+
+    def __init__(self, path: str = None, algo: str = "sha256") -> None:
+        self.path = path or os.environ.get("HASH_CACHE_PATH", DEFAULT_HASH_CACHE_PATH)
+        self.algo = algo
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    path TEXT NOT NULL,
+                    algo TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    digest TEXT NOT NULL,
+                    PRIMARY KEY (path, algo)
+                )
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, path: str) -> Optional[str]:
+        path = os.path.abspath(path)
+        size, mtime_ns, inode = _stat_key(path)
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT digest FROM file_hashes WHERE path = ? AND algo = ? AND size = ? AND mtime_ns = ? AND inode = ?",
+                (path, self.algo, size, mtime_ns, inode),
+            ).fetchone()
+        return row[0] if row else None
+
+    def hash(self, path: str) -> str:
+        path = os.path.abspath(path)
+        before = _stat_key(path)
+        digest = self.get(path)
+        if digest is not None:
+            return digest
+
+        digest = file_hash(path, algo=self.algo)
+        # 哈希期间文件被改写则不缓存
+        if _stat_key(path) == before:
+            with closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?)",
+                    (path, self.algo) + before + (digest,),
+                )
+        return digest
+
+
+_default_cache: Optional[HashCache] = None
+
+
+def cached_file_hash(path, cache: HashCache = None) -> str:
+    """``file_hash`` through the persistent cache (HASH_CACHE_PATH by default)."""
+    global _default_cache
+    if cache is None:
+        if _default_cache is None:
+            _default_cache = HashCache()
+        cache = _default_cache
+    return cache.hash(str(path))
+
+
+def hash_files(paths: Iterable, max_workers: int = 8, cache: HashCache = None) -> Dict[str, str]:
+    """Hash many files concurrently; hashlib releases the GIL while digesting."""
+    paths = [str(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        digests = pool.map(lambda path: cached_file_hash(path, cache), paths)
+        return dict(zip(paths, digests))
+
+
 def generate_unique_id( prefix: str, **kwargs) -> str:
     obj_hash= generate_object_hash_id(kwargs)
     return f"{prefix}_{obj_hash}"
 
 
 def generate_object_hash_id( **kwargs) -> str:
-    payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=True, default=str)
-    digest = hashlib.sha256(payload.encode('utf-8')).hexdigest()
-    return digest[:16]
\ No newline at end of file
+    return object_hash_id(kwargs, mode="compat")
+
+
+_pack_double = struct.Struct("<d").pack
+
+
+def _encode(value: Any, out: List[bytes]) -> None:
+    """Append a typed, length-prefixed binary encoding of ``value``; dict keys are sorted."""
+    value_type = type(value)
+    if value_type is str:
+        data = value.encode("utf-8")
+        out.append(b"s%d:" % len(data))
+        out.append(data)
+    elif value_type is float:
+        out.append(b"f")
+        out.append(_pack_double(value))
+    elif value_type is int:
+        out.append(b"i%d;" % value)
+    elif value_type is bool:
+        out.append(b"T" if value else b"F")
+    elif value is None:
+        out.append(b"N")
+    elif value_type is dict:
+        out.append(b"d%d:" % len(value))
+        for key in sorted(value, key=str):
+            _encode(str(key), out)
+            _encode(value[key], out)
+    elif value_type is list or value_type is tuple:
+        # 浮点向量（embedding 等）整体打包，不逐元素编码；
+        # 只有全部元素都是 float 才走这里，否则 array 会把 int/bool 静默转成 float
+        if value and all(type(item) is float for item in value):
+            packed = array("d", value)
+            if sys.byteorder != "little":
+                packed.byteswap()
+            out.append(b"v%d:" % len(packed))
+            out.append(packed.tobytes())
+            return
+        out.append(b"l%d:" % len(value))
+        for item in value:
+            _encode(item, out)
+    elif hasattr(value, "tobytes") and hasattr(value, "dtype"):
+        header = f"{value.dtype.str}{getattr(value, 'shape', '')}".encode("ascii")
+        out.append(b"a%d:" % len(header))
+        out.append(header)
+        out.append(value.tobytes())
+    else:
+        _encode(str(value), out)
+
+
+class ObjectHasher:
+    """Canonical hash of property dicts.
+
+    ``compat`` reproduces the historical ``json.dumps(sort_keys=True)`` + SHA-256 IDs
+    with a reused encoder; ``fast`` feeds a binary encoding to BLAKE2b. Both return
+    16 hex characters, but the two modes never produce the same ID for an object.
+    """
+
+    def __init__(self, mode: str = None, digest_size: int = 8) -> None:
+        self.mode = mode or DEFAULT_HASH_MODE
+        if self.mode not in HASH_MODES:
+            raise ValueError(f"Unknown hash mode {self.mode!r}, expected one of {HASH_MODES}.")
+        self.digest_size = digest_size
+        self._encoder = json.JSONEncoder(sort_keys=True, ensure_ascii=True, default=str)
+
+    def hash(self, obj: dict) -> str:
+        if self.mode == "compat":
+            payload = self._encoder.encode(obj)
+            return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+        out: List[bytes] = []
+        _encode(obj, out)
+        return hashlib.blake2b(b"".join(out), digest_size=self.digest_size).hexdigest()
+
+
+_hashers: Dict[str, ObjectHasher] = {}
+
+
+def get_hasher(mode: str = None) -> ObjectHasher:
+    mode = mode or DEFAULT_HASH_MODE
+    hasher = _hashers.get(mode)
+    if hasher is None:
+        hasher = _hashers[mode] = ObjectHasher(mode)
+    return hasher
+
+
+def object_hash_id(obj: dict, mode: str = None) -> str:
+    """Hash a property dict with the OBJECT_HASH_MODE engine (``compat`` by default)."""
+    return get_hasher(mode).hash(obj)
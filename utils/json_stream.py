@@ -0,0 +1,129 @@
+import json
+from json.decoder import scanstring
+from typing import Any, Iterable, Iterator, Tuple
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+# multi-graph JSON 中体积最大、需要逐条读取的段
+STREAM_SECTIONS = ("face_dict", "edge_dict")
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+# 数字后面若紧跟这些字符，说明小数/指数部分还在下一块里
+_NUMBER_TAIL = ".eE+-0123456789"
+
+
+class _Reader:
+    """A minimal pull tokenizer over a text file that only keeps the unread tail in memory."""
+
+    def __init__(self, file, chunk_size: int) -> None:
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, min_size: int = 0) -> bool:
+        if self.eof:
+            return False
+        if self.pos:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+        chunk = self.file.read(max(self.chunk_size, min_size))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf += chunk
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found!r} in JSON stream.")
+        self.pos += 1
+
+    def read_string(self) -> str:
+        self.expect('"')
+        while True:
+            try:
+                value, end = scanstring(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            self.pos = end
+            return value
+
+    def read_value(self) -> Any:
+        self.peek()
+        grow = self.chunk_size
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # 值被缓冲区截断：按倍数扩大读取量，避免反复从头解析
+                if not self._fill(grow):
+                    raise
+                grow *= 2
+                continue
+            # 数字可能在缓冲区末尾被截断（如 "0." 只解出 0），补读后重新解析
+            truncated = end == len(self.buf) or (
+                isinstance(value, (int, float)) and self.buf[end] in _NUMBER_TAIL)
+            if truncated and self._fill(grow):
+                continue
+            self.pos = end
+            return value
+
+    def members(self, close: str) -> Iterator[None]:
+        """Iterate an object/array whose opening bracket was consumed; yields before each member."""
+        if self.peek() == close:
+            self.pos += 1
+            return
+        while True:
+            yield None
+            separator = self.peek()
+            self.pos += 1
+            if separator == close:
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or {close!r} but found {separator!r} in JSON stream.")
+
+
+def iter_sections(path, stream_sections: Iterable[str] = STREAM_SECTIONS,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[str, Any, Any]]:
+    """Walk the top-level object of a JSON file without loading it whole.
+
+    Members of ``stream_sections`` are yielded one entry at a time as
+    ``(section, key, value)`` (list entries use their position as key);
+    every other section is decoded whole and yielded as ``(section, None, value)``.
+    """
+    stream_sections = set(stream_sections)
+    with open(path, "r", encoding="utf-8") as file:
+        reader = _Reader(file, chunk_size)
+        reader.expect("{")
+        for _ in reader.members("}"):
+            section = reader.read_string()
+            reader.expect(":")
+            opener = reader.peek()
+            if section not in stream_sections or opener not in ("{", "["):
+                yield section, None, reader.read_value()
+                continue
+
+            reader.pos += 1
+            if opener == "{":
+                for _ in reader.members("}"):
+                    key = reader.read_string()
+                    reader.expect(":")
+                    yield section, key, reader.read_value()
+            else:
+                for index, _ in enumerate(reader.members("]")):
+                    yield section, index, reader.read_value()
+
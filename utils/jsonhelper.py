@@ -2,83 +2,522 @@
 
 
 import ast
+import atexit
 import json
 import os
 import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
-def load_sub_agent_result():
-    QUERY_CACHE_PATH = os.environ["QUERY_CACHE_PATH"]
-    result_path = os.path.join(QUERY_CACHE_PATH, "step_result.json")
-    if not os.path.exists(result_path):
-        return []
-    with open(result_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        return data
 
+STEP_STORE_BACKENDS = ("jsonl", "sqlite")
+# 每追加多少条做一次 fsync（0 表示只在 close 时）
+STEP_STORE_FSYNC_EVERY = int(os.environ.get("STEP_STORE_FSYNC_EVERY", 16))
+
+
+@contextmanager
+def _locked(file):
+    """Exclusive advisory lock on an open file (fcntl on POSIX, msvcrt on Windows)."""
+    if fcntl is not None:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    else:
+        file.seek(0)
+        msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _reverse_lines(file, block_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Yield the lines of a binary file from last to first without reading it whole."""
+    file.seek(0, os.SEEK_END)
+    position = file.tell()
+    remainder = b""
+    while position > 0:
+        read_size = min(block_size, position)
+        position -= read_size
+        file.seek(position)
+        block = file.read(read_size) + remainder
+        lines = block.split(b"\n")
+        remainder = lines.pop(0)
+        for line in reversed(lines):
+            if line.strip():
+                yield line
+    if remainder.strip():
+        yield remainder
+
+
+class StepResultStore:
+    """Append-only store of agent step results under QUERY_CACHE_PATH.
+
+    ``jsonl`` appends one line per item under a file lock and fsyncs every
+    ``fsync_every`` items; ``sqlite`` inserts into a WAL-mode table. Both make a
+    save O(1) no matter how long the session is.
+    """
+
+    def __init__(self, path: str = None, backend: str = None, fsync_every: int = STEP_STORE_FSYNC_EVERY) -> None:
+        self.dir = path or os.environ["QUERY_CACHE_PATH"]
+        self.backend = backend or os.environ.get("STEP_STORE_BACKEND", "jsonl")
+        if self.backend not in STEP_STORE_BACKENDS:
+            raise ValueError(f"Unknown step store backend {self.backend!r}, expected one of {STEP_STORE_BACKENDS}.")
+        self.fsync_every = fsync_every
+        self.legacy_path = os.path.join(self.dir, "step_result.json")
+        self.jsonl_path = os.path.join(self.dir, "step_result.jsonl")
+        self.sqlite_path = os.path.join(self.dir, "step_result.sqlite")
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        self._conn = None
+
+    def _sqlite(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.sqlite_path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS steps ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, agent_name TEXT, item TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS steps_agent ON steps (agent_name, id)")
+        return self._conn
+
+    def append(self, item) -> None:
+        line = json.dumps(item, ensure_ascii=False, default=str)
+        with self._lock:
+            if self.backend == "sqlite":
+                conn = self._sqlite()
+                with conn:
+                    conn.execute("INSERT INTO steps (agent_name, item) VALUES (?, ?)",
+                                 (item.get("agent_name") if isinstance(item, dict) else None, line))
+                return
+            if self._file is None:
+                self._file = open(self.jsonl_path, "ab")
+            with _locked(self._file):
+                self._file.seek(0, os.SEEK_END)
+                self._file.write(line.encode("utf-8") + b"\n")
+                self._file.flush()
+            self._unsynced += 1
+            if self.fsync_every and self._unsynced >= self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+                self._unsynced = 0
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _legacy_items(self) -> Iterator:
+        # 旧版 step_result.json（整体 JSON 数组）中的记录
+        if os.path.exists(self.legacy_path):
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                yield from json.load(f)
+
+    def iter_items(self, tail: int = None, agent_name: str = None) -> Iterator:
+        """Stream stored items oldest first; ``tail`` keeps only the last N, ``agent_name`` filters."""
+
+        def wanted(item) -> bool:
+            return agent_name is None or (isinstance(item, dict) and item.get("agent_name") == agent_name)
+
+        if self.backend == "sqlite":
+            conn = self._sqlite()
+            where, params = ("WHERE agent_name = ?", [agent_name]) if agent_name is not None else ("", [])
+            if tail is None:
+                yield from (item for item in self._legacy_items() if wanted(item))
+                for (line,) in conn.execute(f"SELECT item FROM steps {where} ORDER BY id", params):
+                    yield json.loads(line)
+                return
+            rows = conn.execute(f"SELECT item FROM steps {where} ORDER BY id DESC LIMIT ?", params + [tail])
+            found = [json.loads(line) for (line,) in rows]
+        elif tail is None:
+            for item in self._legacy_items():
+                if wanted(item):
+                    yield item
+            if os.path.exists(self.jsonl_path):
+                with open(self.jsonl_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            item = json.loads(line)
+                            if wanted(item):
+                                yield item
+            return
+        else:
+            # tail-N：从文件末尾倒着读，够数即停
+            found = []
+            if os.path.exists(self.jsonl_path):
+                with open(self.jsonl_path, "rb") as f:
+                    for line in _reverse_lines(f):
+                        item = json.loads(line)
+                        if wanted(item):
+                            found.append(item)
+                            if len(found) >= tail:
+                                break
+
+        # 两种后端都一样：新记录不够 tail 条时，用旧版 step_result.json 的末尾补齐
+        missing = tail - len(found)
+        if missing > 0:
+            legacy = [item for item in self._legacy_items() if wanted(item)]
+            found.extend(reversed(legacy[-missing:]))
+        yield from reversed(found)
+
+
+_stores: Dict[str, StepResultStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_step_store() -> StepResultStore:
+    path = os.environ["QUERY_CACHE_PATH"]
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = StepResultStore(path)
+        return store
+
+
+@atexit.register
+def _close_step_stores() -> None:
+    for store in list(_stores.values()):
+        store.close()
+
+
+def load_sub_agent_result(tail: int = None, agent_name: str = None) -> Iterator:
+    """Stream saved step results (oldest first), optionally only the last ``tail`` or one agent's."""
+    return get_step_store().iter_items(tail=tail, agent_name=agent_name)
 
 
 def save_item_in_json(item):
     try:
-        QUERY_CACHE_PATH = os.environ["QUERY_CACHE_PATH"]
-        result_path = os.path.join(QUERY_CACHE_PATH, "step_result.json")
-        if not os.path.exists(result_path):
-            with open(result_path, "w", encoding="utf-8") as f:
-                json.dump([], f, ensure_ascii=False, indent=4)
-        # 读取现有 JSON
-        with open(result_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        data.append(item)
-        # 写回文件
-        with open(result_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        get_step_store().append(item)
         return True
     except Exception as e:
         print("中间结果存储错误")
         print(e)
 
-def response2json(response):
+
+_BRACKET_TOKENS = {"{": re.compile(r"[{}\"']"), "[": re.compile(r"[\[\]\"']")}
+_STRING_END = {'"': re.compile(r'["\\]'), "'": re.compile(r"['\\]")}
+_STRINGS = {'"': re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S), "'": re.compile(r"'[^'\\]*(?:\\.[^'\\]*)*'", re.S)}
+_tolerant_decoder = json.JSONDecoder(strict=False)
+_OPENERS = re.compile(r"[{\[]")
+# 字符串原样保留，只改写字符串之外的尾逗号 / 裸 JSON 字面量，避免误改内容
+_TRAILING_COMMAS = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|,(?=\s*[}\]])', re.S)
+_JSON_LITERALS = re.compile(
+    r'"[^"\\]*(?:\\.[^"\\]*)*"|\'[^\'\\]*(?:\\.[^\'\\]*)*\'|\b(?:null|true|false)\b', re.S
+)
+_PYTHON_LITERALS = {"null": "None", "true": "True", "false": "False"}
+# 先做便宜的检查，确实需要时才用带回调的 sub 改写；大多数候选两者都不需要
+_HAS_TRAILING_COMMA = re.compile(r",\s*[}\]]")
+# 最多尝试的无法解析的候选位置（正文里可能先出现无关的括号）
+MAX_OBJECT_CANDIDATES = 16
+
+
+def _balanced(text: str, start: int):
+    """Return ``(text, end)`` of the balanced ``{...}`` or ``[...]`` starting at ``start``, or None.
+
+    Strings (double or single quoted) are skipped whole and only the opening
+    bracket type is counted. An object that opens with ``{{`` comes from the
+    prompt template's escaped braces: every run of n braces then counts as
+    ceil(n / 2).
+    """
+    opener = text[start]
+    tokens = _BRACKET_TOKENS[opener]
+    doubled = opener == "{" and text.startswith("{{", start)
+    pieces = []
+    piece_start = start
+    depth = 0
+    pos = start
+    length = len(text)
+    while True:
+        match = tokens.search(text, pos)
+        if match is None:
+            return None
+        char = match.group()
+        index = match.start()
+        if char == '"' or char == "'":
+            string = _STRINGS[char].match(text, index)
+            if string is None:
+                return None
+            pos = string.end()
+            continue
+
+        end = index + 1
+        while end < length and text[end] == char:
+            end += 1
+        count = (end - index + 1) // 2 if doubled else end - index
+        if doubled:
+            pieces.append(text[piece_start:index])
+            piece_start = end
+        if char == opener:
+            depth += count
+            if doubled:
+                pieces.append(char * count)
+        else:
+            closing = min(count, depth)
+            depth -= closing
+            if doubled:
+                pieces.append(char * closing)
+            if depth == 0:
+                end = index + closing
+                return ("".join(pieces) if doubled else text[start:end]), end
+        pos = end
+
+
+def _drop_comma(match) -> str:
+    token = match.group()
+    return "" if token == "," else token
+
+
+def _python_literal(match) -> str:
+    token = match.group()
+    return _PYTHON_LITERALS.get(token, token)
+
+
+def _parse_candidate(candidate: str):
+    try:
+        return _tolerant_decoder.decode(candidate)
+    except json.JSONDecodeError:
+        pass
+    # 模板示例里的尾逗号
+    if _HAS_TRAILING_COMMA.search(candidate):
+        try:
+            return _tolerant_decoder.decode(_TRAILING_COMMAS.sub(_drop_comma, candidate))
+        except json.JSONDecodeError:
+            pass
+    # Python 字面量（单引号、None/True/False）
+    if "null" in candidate or "true" in candidate or "false" in candidate:
+        candidate = _JSON_LITERALS.sub(_python_literal, candidate)
+    try:
+        return ast.literal_eval(candidate)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def _usable(parsed):
+    """Keep objects and lists of objects; a ``[1]`` or ``[DOC 3]`` in the prose is not a step."""
+    if isinstance(parsed, dict):
+        return parsed
+    if isinstance(parsed, list) and parsed and all(isinstance(item, dict) for item in parsed):
+        return parsed
+    return None
+
+
+def _has_keys(value, expect_keys) -> bool:
+    if isinstance(value, list):
+        return all(_has_keys(item, expect_keys) for item in value)
+    return not expect_keys or any(key in value for key in expect_keys)
+
+
+def response2json(response, expect_keys: Iterable[str] = ()):
+    """Extract the first JSON object (or list of objects) from a model response in one scan.
+
+    Handles markdown fences, surrounding prose, the prompt template's ``{{ }}``
+    and Python literals. With ``expect_keys``, objects that have none of these
+    keys (e.g. echoed tool results) are skipped, falling back to the first object.
+    """
     if isinstance(response, (dict, list)):
         return response
 
     if not isinstance(response, str):
         response = str(response)
 
-    # 统一处理常见的非法拼写或大小写
-    normalized = (
-        response.replace("None", "null")
-        .replace("True", "true")
-        .replace("False", "false")
-        .replace("{{", "{")
-        .replace("}}", "}")
-    )
-
-    match = re.search(r"```json(.*?)```", normalized, re.S)
-    if match:
-        json_str = match.group(1).strip()
-        response_json = json.loads(json_str)
-    else:
-        print("未返回markdown")
+    stripped = response.strip()
+    if stripped.startswith('"'):
+        # 整段被再编码成了 JSON 字符串：先解开，免得把里面转义过的括号逐个当候选
         try:
-            response_json = json.loads(normalized)
+            value = _tolerant_decoder.decode(stripped)
         except json.JSONDecodeError:
-            print("不是直接输出json")
+            value = None
+        if isinstance(value, str) and _OPENERS.search(value):
             try:
-                # ast.literal_eval 无法识别双重括号等复杂结构，尝试宽松解析
-                response_json = ast.literal_eval(normalized)
-            except (ValueError, SyntaxError, MemoryError):
-                # 一些模型会返回以双括号包裹的 JSON 或带多余引号的内容
-                trimmed = normalized.strip()
-                if trimmed.startswith("{{") and trimmed.endswith("}}"):
-                    trimmed = trimmed[1:-1]
-                if trimmed.startswith('"') and trimmed.endswith('"'):
-                    trimmed = trimmed[1:-1]
-
-                trimmed = trimmed.replace('\'"', '"')
-                try:
-                    response_json = json.loads(trimmed)
-                except Exception as final_err:
-                    raise ValueError("无法解析响应为 JSON") from final_err
-    return response_json
+                return response2json(value, expect_keys)
+            except ValueError:
+                pass
+
+    first = None
+    failures = 0
+    match = _OPENERS.search(response)
+    while match is not None and failures < MAX_OBJECT_CANDIDATES:
+        start = match.start()
+        # 合法 JSON 直接从原串解码，不复制；否则再做括号配对和宽松解析
+        try:
+            parsed, end = _tolerant_decoder.raw_decode(response, start)
+            found = (None, end)
+        except json.JSONDecodeError:
+            found = _balanced(response, start)
+            parsed = _parse_candidate(found[0]) if found is not None else None
+        parsed = _usable(parsed)
+        if parsed is None:
+            failures += 1
+            match = _OPENERS.search(response, start + 1)
+            continue
+        if _has_keys(parsed, expect_keys):
+            return parsed
+        if first is None:
+            first = parsed
+        match = _OPENERS.search(response, found[1])
+
+    # 没有带 expect_keys 的对象：整体可能是其他 JSON 值，或被再编码了一次的 JSON 字符串
+    # （其中转义过的内层 {} 会被当成 first，所以先试整体解码）
+    try:
+        value = _tolerant_decoder.decode(stripped)
+    except json.JSONDecodeError as final_err:
+        if first is not None:
+            return first
+        raise ValueError("无法解析响应为 JSON") from final_err
+    if isinstance(value, str) and _OPENERS.search(value):
+        try:
+            inner = response2json(value, expect_keys)
+        except ValueError:
+            inner = None
+        if inner is not None and (first is None or _has_keys(inner, expect_keys)):
+            return inner
+    return first if first is not None else value
+
+
+class IncrementalObjectScanner:
+    """Finds the first JSON step object of a response while the response is still streaming.
+
+    ``feed`` takes the accumulated text and resumes the bracket scan where the
+    previous call stopped, so each character is scanned once. Candidates are
+    accepted with the same rules as ``response2json``.
+    """
+
+    def __init__(self, expect_keys: Iterable[str] = ()) -> None:
+        self.expect_keys = tuple(expect_keys)
+        self.text = ""
+        self.value = None
+        # 对象闭合处的下标，None 表示还没有找到
+        self.end = None
+        self._pos = 0
+        self._start = None
+        self._opener = "{"
+        self._doubled = False
+        self._depth = 0
+        self._quote = None
+        self._failures = 0
+        self._complete = False
+
+    def feed(self, text: str):
+        """Feed the response text so far; returns the parsed object once it has closed, else None."""
+        if self.end is None:
+            if not text.startswith(self.text):
+                self.__init__(self.expect_keys)
+            self.text = text
+            self._scan()
+        return self.value if self.end is not None else None
+
+    def finish(self, text: str = None):
+        """The stream has ended: scan the rest and return the object, if any."""
+        self._complete = True
+        self.feed(self.text if text is None else text)
+        # 没闭合的候选（如截断的回显）作废，从它后面继续找
+        while self.end is None and self._start is not None and self._failures < MAX_OBJECT_CANDIDATES:
+            self._failures += 1
+            self._pos = self._start + 1
+            self._start = None
+            self._quote = None
+            self._scan()
+        return self.value if self.end is not None else None
+
+    def _scan(self) -> None:
+        text = self.text
+        length = len(text)
+        while self._pos < length and self.end is None and self._failures < MAX_OBJECT_CANDIDATES:
+            if self._start is None:
+                match = _OPENERS.search(text, self._pos)
+                if match is None:
+                    self._pos = length
+                    return
+                start = match.start()
+                if start + 1 == length and not self._complete:
+                    # 还不知道是不是模板的 {{
+                    self._pos = start
+                    return
+                self._start = start
+                self._opener = text[start]
+                self._doubled = self._opener == "{" and text.startswith("{{", start)
+                self._depth = 0
+                self._quote = None
+                self._pos = start
+                continue
+
+            if self._quote is not None:
+                match = _STRING_END[self._quote].search(text, self._pos)
+                if match is None:
+                    self._pos = length
+                    return
+                if match.group() == "\\":
+                    if match.start() + 1 == length:
+                        self._pos = match.start()
+                        return
+                    self._pos = match.start() + 2
+                    continue
+                self._quote = None
+                self._pos = match.start() + 1
+                continue
 
+            match = _BRACKET_TOKENS[self._opener].search(text, self._pos)
+            if match is None:
+                self._pos = length
+                return
+            char = match.group()
+            index = match.start()
+            if char == '"' or char == "'":
+                self._quote = char
+                self._pos = index + 1
+                continue
+            end = index + 1
+            while end < length and text[end] == char:
+                end += 1
+            if self._doubled and end == length and not self._complete:
+                # 花括号串可能还没输出完
+                self._pos = index
+                return
+            count = (end - index + 1) // 2 if self._doubled else end - index
+            if char == self._opener:
+                self._depth += count
+                self._pos = end
+                continue
+            closing = min(count, self._depth)
+            self._depth -= closing
+            if self._depth:
+                self._pos = end
+                continue
+            self._close(index + closing)
 
+    def _close(self, end: int) -> None:
+        start = self._start
+        self._start = None
+        if self._doubled:
+            found = _balanced(self.text, start)
+            candidate = found[0] if found is not None else None
+        else:
+            candidate = self.text[start:end]
+        parsed = _usable(_parse_candidate(candidate)) if candidate is not None else None
+        if parsed is None:
+            self._failures += 1
+            self._pos = start + 1
+        elif _has_keys(parsed, self.expect_keys):
+            self.value = parsed
+            self.end = end
+        else:
+            self._pos = end
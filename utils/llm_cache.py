@@ -0,0 +1,215 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from qwen_agent.llm.schema import Message
+
+# off: 直连模型；cache: 命中则复用，未命中调用并写入；record: 总是调用模型并写入缓存与会话记录；
+# replay: 只读缓存，未命中报错（回归测试/基准用）
+LLM_CACHE_MODES = ("off", "cache", "record", "replay")
+DEFAULT_LLM_CACHE_DIR = ".llm_cache"
+DEFAULT_LLM_RECORD_DIR = "llm_records"
+
+
+class LLMCacheMiss(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+def _to_dict(message: Any) -> Dict[str, Any]:
+    if hasattr(message, "model_dump"):
+        return message.model_dump(exclude_none=True)
+    return {key: value for key, value in dict(message).items() if value is not None}
+
+
+class LLMResponseCache:
+    """Content-addressed on-disk cache of ``run_nonstream`` responses.
+
+    The key hashes the model name, generation config, tool names, call kwargs
+    and the full message list, so any prompt change is a miss.
+    """
+
+    def __init__(self, path: str = None, mode: str = None) -> None:
+        self.path = path or os.environ.get("LLM_CACHE_DIR", DEFAULT_LLM_CACHE_DIR)
+        self.mode = mode or os.environ.get("LLM_CACHE_MODE", "off")
+        if self.mode not in LLM_CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode {self.mode!r}, expected one of {LLM_CACHE_MODES}.")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(bot, messages: List[Any], **kwargs) -> str:
+        llm = getattr(bot, "llm", None)
+        payload = json.dumps(
+            {
+                "model": getattr(llm, "model", ""),
+                "generate_cfg": getattr(llm, "generate_cfg", {}),
+                "functions": sorted(getattr(bot, "function_map", {})),
+                "kwargs": kwargs,
+                "messages": [_to_dict(message) for message in messages],
+            },
+            sort_keys=True, ensure_ascii=False, default=str,
+        )
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+    def _file(self, key: str) -> str:
+        shard = key.rsplit("_", 1)[-1][:2]
+        return os.path.join(self.path, shard, f"{key}.json")
+
+    def get(self, key: str) -> Optional[List[Message]]:
+        file_path = self._file(key)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        return [Message(**message) for message in entry["responses"]]
+
+    def put(self, key: str, messages: List[Any], responses: List[Any]) -> None:
+        file_path = self._file(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        entry = {
+            "created_at": datetime.now().isoformat(),
+            "messages": [_to_dict(message) for message in messages],
+            "responses": [_to_dict(response) for response in responses],
+        }
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, file_path)
+
+    def lookup(self, key: str) -> Optional[List[Message]]:
+        """Cached responses in cache/replay mode (counted as hit or miss); None means call the model."""
+        if self.mode not in ("cache", "replay"):
+            return None
+        responses = self.get(key)
+        with self._lock:
+            if responses is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if responses is None and self.mode == "replay":
+            raise LLMCacheMiss(f"No recorded LLM response for request {key}")
+        return responses
+
+    def run_nonstream(self, bot, messages: List[Any], **kwargs) -> List[Any]:
+        if self.mode == "off":
+            return bot.run_nonstream(messages, **kwargs)
+        key = self.make_key(bot, messages, **kwargs)
+        responses = self.lookup(key)
+        if responses is not None:
+            return responses
+        responses = bot.run_nonstream(messages, **kwargs)
+        self.put(key, messages, responses)
+        return responses
+
+    # record/replay 模式下工具结果也落盘，回放时不访问 Neo4j
+    @staticmethod
+    def tool_key(tool_name: str, params: str) -> str:
+        payload = json.dumps({"tool": tool_name, "params": params}, sort_keys=True, ensure_ascii=False)
+        return "tool_" + hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+    def get_tool_result(self, key: str) -> Any:
+        file_path = self._file(key)
+        if not os.path.exists(file_path):
+            raise LLMCacheMiss(f"No recorded tool result for request {key}")
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)["result"]
+
+    def put_tool_result(self, key: str, tool_name: str, params: str, result: Any) -> None:
+        file_path = self._file(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"tool": tool_name, "params": params, "result": result}, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, file_path)
+
+    # 提示词里的 Schema 摘要读自数据库；record 时随会话落盘，replay 时原样复用，请求键才不会变
+    @staticmethod
+    def schema_key(agent_name: str, task: str) -> str:
+        payload = json.dumps({"schema": agent_name, "task": task}, sort_keys=True, ensure_ascii=False)
+        return "schema_" + hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+    def get_schema_summary(self, key: str) -> Optional[str]:
+        file_path = self._file(key)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "r", encoding="utf-8") as f:
+            return json.load(f)["summary"]
+
+    def put_schema_summary(self, key: str, agent_name: str, task: str, summary: str) -> None:
+        file_path = self._file(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"agent": agent_name, "task": task, "summary": summary}, f, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "mode": self.mode,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class SessionRecorder:
+    """Collects the model responses and tool results of one agent session in the ``data.json`` layout."""
+
+    def __init__(self, name: str, path: str = None) -> None:
+        self.path = path or os.environ.get("LLM_RECORD_DIR", DEFAULT_LLM_RECORD_DIR)
+        self.name = name
+        self.messages: List[Dict[str, Any]] = []
+
+    def add_responses(self, responses: List[Any]) -> None:
+        self.messages.extend(_to_dict(response) for response in responses)
+
+    def add_tool_result(self, tool_name: str, result: Any) -> None:
+        content = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, indent=4, default=str)
+        self.messages.append({"role": "function", "content": content, "name": tool_name, "extra": {}})
+
+    def save(self) -> str:
+        os.makedirs(self.path, exist_ok=True)
+        file_path = os.path.join(self.path, f"{self.name}_{datetime.now():%Y%m%d_%H%M%S_%f}.json")
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.messages, f, ensure_ascii=False, indent=4, default=str)
+        return file_path
+
+
+_llm_cache: Optional[LLMResponseCache] = None
+
+
+def get_llm_cache() -> LLMResponseCache:
+    global _llm_cache
+    if _llm_cache is None:
+        _llm_cache = LLMResponseCache()
+    return _llm_cache
+
+
+async def session_schema_summary(agent_name: str, task: str, load: Callable[[], Awaitable[str]]) -> str:
+    """Schema summary for the agent prompt: saved with the session in record mode, reused in replay mode."""
+    cache = get_llm_cache()
+    if cache.mode not in ("record", "replay"):
+        return await load()
+    key = cache.schema_key(agent_name, task)
+    if cache.mode == "replay":
+        summary = cache.get_schema_summary(key)
+        if summary is not None:
+            return summary
+        print(f"No recorded schema summary for {agent_name}, using the live one; replay may miss.")
+        return await load()
+    summary = await load()
+    cache.put_schema_summary(key, agent_name, task, summary)
+    return summary
+
+
+def open_recorder(name: str) -> Optional[SessionRecorder]:
+    """A recorder when LLM_CACHE_MODE is ``record``, otherwise None."""
+    if get_llm_cache().mode != "record":
+        return None
+    return SessionRecorder(name)
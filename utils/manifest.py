@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from utils.multi_graph import NODE_STAGE_LABELS
+
+DEFAULT_MANIFEST_PATH = "ingest_manifest.sqlite"
+# 写入 manifest 的入库脚本递增图版本时使用的 source；其它来源的变更 manifest 无法说明
+INGEST_SOURCE = "test9_ingest_dir"
+
+
+@dataclass
+class PartRecord:
+    stem: str
+    file_id: str
+    prt_file_id: str
+    json_hash: str
+    loader_version: str
+    updated_at: str = ""
+
+
+@dataclass
+class GraphDiff:
+    inserts: Dict[str, List[dict]] = field(default_factory=dict)
+    deletes: Dict[str, List[dict]] = field(default_factory=dict)
+    updated: int = 0
+
+    @property
+    def inserted(self) -> int:
+        return sum(len(rows) for rows in self.inserts.values())
+
+    @property
+    def deleted(self) -> int:
+        return sum(len(rows) for rows in self.deletes.values())
+
+
+def _row_key(stage: str, row: dict) -> Tuple[str, Optional[str]]:
+    """Manifest key of a row: node identifier plus its __index__, or the whole relationship row."""
+    if stage in NODE_STAGE_LABELS:
+        return row["identifier"], str(row["props"]["__index__"])
+    return json.dumps(row, sort_keys=True, ensure_ascii=False), None
+
+
+def _key_row(stage: str, key: str) -> dict:
+    if stage in NODE_STAGE_LABELS:
+        return {"identifier": key}
+    return json.loads(key)
+
+
+class IngestManifest:
+    """SQLite sidecar recording, per part, the hashes it was loaded from and the rows it wrote."""
+
+    def __init__(self, path: str = None) -> None:
+        self.path = path or os.environ.get("INGEST_MANIFEST_PATH", DEFAULT_MANIFEST_PATH)
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS parts (
+                    stem TEXT PRIMARY KEY,
+                    file_id TEXT NOT NULL,
+                    prt_file_id TEXT NOT NULL,
+                    json_hash TEXT NOT NULL,
+                    loader_version TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS part_rows (
+                    stem TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    row_key TEXT NOT NULL,
+                    item_index TEXT,
+                    PRIMARY KEY (stem, stage, row_key)
+                );
+                -- 零件换了 file_id（STP 变化）时，旧 file_id 的节点已被整体删除
+                CREATE TABLE IF NOT EXISTS replaced_files (
+                    file_id TEXT NOT NULL,
+                    stem TEXT NOT NULL,
+                    replaced_at TEXT NOT NULL
+                );
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get_part(self, stem: str) -> Optional[PartRecord]:
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT stem, file_id, prt_file_id, json_hash, loader_version, updated_at FROM parts WHERE stem = ?",
+                (stem,),
+            ).fetchone()
+        return PartRecord(*row) if row else None
+
+    def changed_since(self, timestamp: str) -> List[PartRecord]:
+        """Parts recorded after ``timestamp`` (ISO 8601, UTC)."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT stem, file_id, prt_file_id, json_hash, loader_version, updated_at FROM parts "
+                "WHERE updated_at > ? ORDER BY updated_at",
+                (timestamp,),
+            ).fetchall()
+        return [PartRecord(*row) for row in rows]
+
+    def replaced_since(self, timestamp: str) -> List[str]:
+        """``file_id`` values that parts recorded after ``timestamp`` left behind."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT file_id FROM replaced_files WHERE replaced_at > ?", (timestamp,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def is_unchanged(self, record: PartRecord) -> bool:
+        previous = self.get_part(record.stem)
+        return previous is not None and (
+            previous.file_id, previous.prt_file_id, previous.json_hash, previous.loader_version
+        ) == (record.file_id, record.prt_file_id, record.json_hash, record.loader_version)
+
+    def diff(self, stem: str, rows: Dict[str, List[dict]]) -> GraphDiff:
+        """Compare freshly built rows with the rows recorded for ``stem``.
+
+        Node identifiers are content hashes, so a changed node shows up as a
+        delete plus an insert with the same ``__index__``; those are counted as updates.
+        """
+        previous: Dict[str, Dict[str, Optional[str]]] = {}
+        with closing(self._connect()) as conn:
+            for stage, row_key, item_index in conn.execute(
+                "SELECT stage, row_key, item_index FROM part_rows WHERE stem = ?", (stem,)
+            ):
+                previous.setdefault(stage, {})[row_key] = item_index
+
+        result = GraphDiff()
+        for stage, stage_rows in rows.items():
+            old_keys = previous.get(stage, {})
+            current: Dict[str, Optional[str]] = {}
+            inserted_indexes = set()
+            for row in stage_rows:
+                key, item_index = _row_key(stage, row)
+                current[key] = item_index
+                if key not in old_keys:
+                    result.inserts.setdefault(stage, []).append(row)
+                    inserted_indexes.add(item_index)
+            for key, item_index in old_keys.items():
+                if key in current:
+                    continue
+                result.deletes.setdefault(stage, []).append(_key_row(stage, key))
+                if item_index is not None and item_index in inserted_indexes:
+                    result.updated += 1
+        return result
+
+    def record(self, record: PartRecord, rows: Dict[str, List[dict]]) -> None:
+        record.updated_at = datetime.now(timezone.utc).isoformat()
+        with closing(self._connect()) as conn, conn:
+            previous = conn.execute("SELECT file_id FROM parts WHERE stem = ?", (record.stem,)).fetchone()
+            if previous is not None and previous[0] != record.file_id:
+                conn.execute("INSERT INTO replaced_files VALUES (?, ?, ?)",
+                             (previous[0], record.stem, record.updated_at))
+            conn.execute(
+                "INSERT OR REPLACE INTO parts VALUES (?, ?, ?, ?, ?, ?)",
+                (record.stem, record.file_id, record.prt_file_id, record.json_hash,
+                 record.loader_version, record.updated_at),
+            )
+            conn.execute("DELETE FROM part_rows WHERE stem = ?", (record.stem,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO part_rows VALUES (?, ?, ?, ?)",
+                (
+                    (record.stem, stage) + _row_key(stage, row)
+                    for stage, stage_rows in rows.items()
+                    for row in stage_rows
+                ),
+            )
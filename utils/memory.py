@@ -0,0 +1,210 @@
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# 节点身份字段，按优先级查找
+NODE_ID_KEYS = ("__id__", "identifier", "__hash__", "elementId")
+# 不进入提示词的大字段
+DROP_KEYS = ("embedding",)
+SCHEMA_QUERY = re.compile(
+    r"db\.schema|db\.labels|db\.relationshipTypes|db\.propertyKeys|db\.indexes|SHOW\s+(INDEXES|CONSTRAINTS)",
+    re.I,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count without a tokenizer: one per CJK/non-ASCII char, one per four ASCII chars."""
+    non_ascii = sum(1 for char in text if ord(char) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def node_identity(value: Any) -> Optional[str]:
+    if isinstance(value, dict):
+        for key in NODE_ID_KEYS:
+            if value.get(key):
+                return str(value[key])
+    return None
+
+
+@dataclass
+class HistoryStep:
+    index: int
+    reason: str
+    tool_name: str
+    call_paras: Dict[str, Any]
+    result: Any
+
+
+@dataclass
+class HistoryManager:
+    """Bounded view of the agent's step history for the prompt.
+
+    The latest steps are shown with truncated, de-duplicated results while they
+    fit ``token_budget``; older steps are folded into ``schema_summary``,
+    ``top3_seeds`` and ``expanded_nodes`` and only keep a one-line reason.
+    """
+
+    token_budget: int = 6000
+    max_records: int = 10
+    max_string: int = 200
+    max_list: int = 16
+    steps: List[HistoryStep] = field(default_factory=list)
+    schema_summary: Dict[str, Any] = field(default_factory=dict)
+    top3_seeds: List[Dict[str, Any]] = field(default_factory=list)
+    expanded_nodes: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # 节点首次出现的步骤号，用于去重
+    _node_first_step: Dict[str, int] = field(default_factory=dict)
+
+    def add_step(self, reason: str, tool_name: str, call_paras: Dict[str, Any], result: Any) -> None:
+        step = HistoryStep(len(self.steps) + 1, reason, tool_name, call_paras or {}, result)
+        self.steps.append(step)
+        self._update_caches(step)
+
+    def _compact(self, value: Any, step_index: int = 0, depth: int = 0) -> Any:
+        """Drop embeddings, shorten long strings/lists and replace nodes seen in earlier steps by a reference."""
+        if isinstance(value, dict):
+            identity = node_identity(value)
+            if identity is not None and depth > 0 and self._node_first_step.get(identity, step_index) < step_index:
+                return f"@{identity}"
+            return {
+                key: self._compact(item, step_index, depth + 1)
+                for key, item in value.items()
+                if key not in DROP_KEYS
+            }
+        if isinstance(value, list):
+            items = [self._compact(item, step_index, depth + 1) for item in value[:self.max_list]]
+            if len(value) > self.max_list:
+                items.append(f"...(+{len(value) - self.max_list})")
+            return items
+        if isinstance(value, str) and len(value) > self.max_string:
+            return value[:self.max_string] + "..."
+        return value
+
+    def compact_result(self, result: Any, step_index: int = 0) -> Any:
+        if not isinstance(result, list):
+            return self._compact(result, step_index)
+        records = [self._compact(record, step_index) for record in result[:self.max_records]]
+        if len(result) > self.max_records:
+            records.append({"__truncated__": len(result) - self.max_records, "__total__": len(result)})
+        return records
+
+    def _update_caches(self, step: HistoryStep) -> None:
+        cypher = str(step.call_paras.get("cypher", ""))
+        records = step.result if isinstance(step.result, list) else []
+
+        if SCHEMA_QUERY.search(cypher):
+            for record in records:
+                if not isinstance(record, dict):
+                    continue
+                for key, value in record.items():
+                    if key == "nodes" and isinstance(value, list):
+                        self.schema_summary.setdefault("labels", [])
+                        for node in value:
+                            name = node.get("name") if isinstance(node, dict) else node
+                            if name and name not in self.schema_summary["labels"]:
+                                self.schema_summary["labels"].append(name)
+                    elif key == "relationships" and isinstance(value, list):
+                        relationships = self.schema_summary.setdefault("relationships", [])
+                        for relationship in value:
+                            if isinstance(relationship, (list, tuple)) and len(relationship) == 3:
+                                start, rel_type, end = relationship
+                                entry = f"({_label_of(start)})-[:{_label_of(rel_type)}]->({_label_of(end)})"
+                            else:
+                                entry = _label_of(relationship)
+                            if entry not in relationships:
+                                relationships.append(entry)
+                    else:
+                        values = self.schema_summary.setdefault(key, [])
+                        for item in value if isinstance(value, list) else [value]:
+                            item = self._compact(item)
+                            if item not in values:
+                                values.append(item)
+
+        scored = [record for record in records if isinstance(record, dict) and "score" in record]
+        if scored:
+            seeds = [self._compact(record) for record in scored]
+            seeds.sort(key=lambda record: record.get("score") or 0, reverse=True)
+            self.top3_seeds = seeds[:3]
+
+        for record in records:
+            for node in _iter_nodes(record):
+                identity = node_identity(node)
+                self._node_first_step.setdefault(identity, step.index)
+                if identity not in self.expanded_nodes:
+                    self.expanded_nodes[identity] = {
+                        key: self._compact(item, depth=1)
+                        for key, item in node.items()
+                        if key not in DROP_KEYS and not isinstance(item, (dict, list))
+                    }
+
+    def render(self) -> str:
+        """Prompt text for the history, kept within ``token_budget`` tokens."""
+        caches = {}
+        if self.schema_summary:
+            caches["schema_summary"] = self.schema_summary
+        if self.top3_seeds:
+            caches["top3_seeds"] = self.top3_seeds
+        if self.expanded_nodes:
+            # 已召回节点最多占预算的三分之一，优先保留最新的
+            nodes: Dict[str, Dict[str, Any]] = {}
+            nodes_used = 0
+            for identity in reversed(list(self.expanded_nodes)):
+                cost = estimate_tokens(_dumps({identity: self.expanded_nodes[identity]}))
+                if nodes_used + cost > self.token_budget // 3:
+                    break
+                nodes[identity] = self.expanded_nodes[identity]
+                nodes_used += cost
+            caches["expanded_nodes"] = dict(reversed(list(nodes.items())))
+            if len(nodes) < len(self.expanded_nodes):
+                caches["expanded_nodes_omitted"] = len(self.expanded_nodes) - len(nodes)
+        header = _dumps(caches) if caches else ""
+        used = estimate_tokens(header)
+
+        # 从最近一步往前，放得下就保留完整（压缩后的）结果，否则只留一句 reason
+        lines: List[str] = []
+        full = True
+        for step in reversed(self.steps):
+            if full:
+                line = _dumps({
+                    "step": step.index,
+                    "reason": step.reason,
+                    "tool": step.tool_name,
+                    "call_paras": self._compact(step.call_paras),
+                    "result": self.compact_result(step.result, step.index),
+                })
+                if used + estimate_tokens(line) <= self.token_budget:
+                    lines.append(line)
+                    used += estimate_tokens(line)
+                    continue
+                full = False
+            line = f"Step{step.index}: {step.reason[:self.max_string]}"
+            cost = estimate_tokens(line)
+            if used + cost > self.token_budget:
+                lines.append(f"...({step.index} earlier steps omitted)")
+                break
+            lines.append(line)
+            used += cost
+        lines.reverse()
+        return "\n".join([header] + lines if header else lines)
+
+
+def _label_of(value: Any) -> str:
+    if isinstance(value, dict):
+        return str(value.get("name") or value.get("type") or node_identity(value) or "")
+    return str(value)
+
+
+def _iter_nodes(value: Any):
+    if isinstance(value, dict):
+        if node_identity(value) is not None:
+            yield value
+        for item in value.values():
+            yield from _iter_nodes(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _iter_nodes(item)
@@ -0,0 +1,412 @@
+from typing import Dict, List, Tuple
+
+from utils.bulk_writer import BulkWriter
+from utils.hash import DEFAULT_HASH_MODE, object_hash_id
+from utils.json_stream import DEFAULT_CHUNK_SIZE, iter_sections
+
+
+# 行结构、写入语义或哈希模式变化时递增，已入库的零件会整体重载
+LOADER_VERSION = "multi_graph/1" if DEFAULT_HASH_MODE == "compat" else f"multi_graph/1+{DEFAULT_HASH_MODE}"
+
+NODE_STAGE_LABELS = {
+    "faces": "Surface",
+    "curves": "Curve",
+    "features": "MachiningFeature",
+    "processes": "ProcessUnit",
+}
+
+FACE_QUERY = """
+UNWIND $rows AS row
+MATCH (f:File {Hash: $file_id})
+MERGE (st:SurfaceType {name: row.type_name, index: row.type_idx})
+MERGE (s:Surface {__id__: row.identifier, __fileId__: $file_id})
+SET s += row.props
+MERGE (f)-[:HAS_SURFACE]->(s)
+MERGE (s)-[:OF_SURFACE_TYPE]->(st)
+"""
+
+CURVE_QUERY = """
+UNWIND $rows AS row
+MATCH (f:File {Hash: $file_id})
+MERGE (ct:CurveType {name: row.type_name, index: row.type_idx})
+MERGE (c:Curve {__id__: row.identifier, __fileId__: $file_id})
+SET c += row.props
+MERGE (f)-[:HAS_CURVE]->(c)
+MERGE (c)-[:OF_CURVE_TYPE]->(ct)
+"""
+
+CURVE_SURFACE_QUERY = """
+UNWIND $rows AS row
+MATCH (curve:Curve {__id__: row.curve_id, __fileId__: $file_id})
+MATCH (surface:Surface {__id__: row.surface_id, __fileId__: $file_id})
+MERGE (curve)-[:BOUNDARY_OF]->(surface)
+"""
+
+FEATURE_QUERY = """
+UNWIND $rows AS row
+MERGE (mft:MachiningFeatureType {name: row.type_name})
+MERGE (mf:MachiningFeature {__id__: row.identifier, __fileId__: $file_id})
+SET mf += row.props
+MERGE (mf)-[:OF_FEATURE_TYPE]->(mft)
+"""
+
+FEATURE_ADJACENT_QUERY = """
+UNWIND $rows AS row
+MATCH (src_fe:MachiningFeature {__id__: row.src_id, __fileId__: $file_id})
+MATCH (tar_fe:MachiningFeature {__id__: row.tar_id, __fileId__: $file_id})
+MERGE (src_fe)-[:ADJACENT_MFEATURE]->(tar_fe)
+"""
+
+SURFACE_FEATURE_QUERY = """
+UNWIND $rows AS row
+MATCH (surface:Surface {__id__: row.surface_id, __fileId__: $file_id})
+MATCH (feature:MachiningFeature {__id__: row.feature_id, __fileId__: $file_id})
+MERGE (surface)-[:BELONGS_TO_FEATURE]->(feature)
+"""
+
+PROCESS_QUERY = """
+UNWIND $rows AS row
+MERGE (pt:ProcessUnitType {name: row.type_name})
+MERGE (p:ProcessUnit {__id__: row.identifier, __fileId__: $file_id})
+SET p += row.props
+MERGE (p)-[:OF_PROCESS_UNIT_TYPE]->(pt)
+"""
+
+PROCESS_ADJACENT_QUERY = """
+UNWIND $rows AS row
+MATCH (lhs:ProcessUnit {__id__: row.left_id, __fileId__: $file_id})
+MATCH (rhs:ProcessUnit {__id__: row.right_id, __fileId__: $file_id})
+MERGE (lhs)-[:ADJACENT_PROCESS]->(rhs)
+"""
+
+FEATURE_PROCESS_QUERY = """
+UNWIND $rows AS row
+MATCH (feature:MachiningFeature {__id__: row.feature_id, __fileId__: $file_id})
+MATCH (process:ProcessUnit {__id__: row.process_id, __fileId__: $file_id})
+MERGE (feature)-[:ASSIGNED_TO_PROCESS]->(process)
+"""
+
+PROCESS_OPERATION_QUERY = """
+UNWIND $rows AS row
+MATCH (process:ProcessUnit {__fileId__: $file_id, __id__: row.process_id})
+MATCH (operation:Operation {__fileId__: $prt_file_id, Name: row.operation_name})
+MERGE (process)-[:INCLUDES_OPERATION]->(operation)
+"""
+
+
+def face_row(file_id: str, face_index: str, face_payload: dict) -> dict:
+    props = dict(face_payload)
+    props["__fileId__"] = file_id
+    props["__index__"] = face_index
+    hash_value = object_hash_id(props)
+    props["__hash__"] = hash_value
+    return {
+        "identifier": f"Surface_{hash_value}",
+        "type_idx": props.get("face_type"),
+        "type_name": props.get("face_type_name"),
+        "props": props,
+    }
+
+
+def curve_row(file_id: str, curve_key: str, curve_payload: dict) -> dict:
+    props = dict(curve_payload)
+    props["__fileId__"] = file_id
+    props["__index__"] = curve_key
+    hash_value = object_hash_id(props)
+    props["__hash__"] = hash_value
+    return {
+        "identifier": f"Curve_{hash_value}",
+        "type_idx": props.get("curve_type"),
+        "type_name": props.get("curve_type_name"),
+        "props": props,
+    }
+
+
+def feature_row(file_id: str, feature: dict, feature_index) -> dict:
+    props = dict(feature)
+    props.pop("index", None)
+    props["__fileId__"] = file_id
+    props["__index__"] = feature_index
+    hash_value = object_hash_id(props)
+    props["__hash__"] = hash_value
+    return {
+        "identifier": f"MachiningFeature_{hash_value}",
+        "type_name": props.get("featureType"),
+        "props": props,
+    }
+
+
+def process_row(file_id: str, process: dict) -> Tuple[dict, int]:
+    props = dict(process)
+    p_indx = props.pop("index", 0)
+    props["__index__"] = p_indx
+    props["__fileId__"] = file_id
+    hash_value = object_hash_id(props)
+    props["__hash__"] = hash_value
+    row = {
+        "identifier": f"ProcessUnit_{hash_value}",
+        "type_name": props["typeName"],
+        "props": props,
+    }
+    return row, p_indx
+
+
+def _lookup_surface(surface_ids: Dict[str, str], surface_key):
+    surface_id = surface_ids.get(str(surface_key))
+    if surface_id is None:
+        surface_id = surface_ids.get(surface_key)
+    return surface_id
+
+
+def _curve_surface_rows(curve_id: str, linked_surfaces, surface_ids: Dict[str, str]) -> List[dict]:
+    rows: List[dict] = []
+    if isinstance(linked_surfaces, list):
+        for surface_index in linked_surfaces:
+            surface_id = _lookup_surface(surface_ids, surface_index)
+            if surface_id:
+                rows.append({"curve_id": curve_id, "surface_id": surface_id})
+    return rows
+
+
+def _topology_rows(file_id: str, para_dict: dict, surface_ids: Dict[str, str]) -> Dict[str, List[dict]]:
+    """Rows for features, processes and every link that hangs off them."""
+    rows: Dict[str, List[dict]] = {}
+
+    mf_idx_map: Dict[int, str] = {}
+    feature_rows = rows.setdefault("features", [])
+    for fe_id, feature in enumerate(para_dict.get("features", [])):
+        row = feature_row(file_id, feature, fe_id)
+        feature_rows.append(row)
+        mf_idx_map[fe_id] = row["identifier"]
+
+    feature_adjacent_rows = rows.setdefault("feature_adjacent", [])
+    for src_feature, tar_fe in para_dict.get("feature_index", []):
+        if src_feature == tar_fe:
+            continue
+        src_id = mf_idx_map.get(src_feature)
+        tar_id = mf_idx_map.get(tar_fe)
+        if src_id and tar_id:
+            feature_adjacent_rows.append({"src_id": src_id, "tar_id": tar_id})
+
+    surface_feature_rows = rows.setdefault("surface_feature", [])
+    for surface_key, feature_idx in para_dict.get("face_feature_map", {}).items():
+        feature_id = mf_idx_map.get(feature_idx)
+        surface_id = surface_ids.get(surface_key)
+        if surface_id is None:
+            surface_id = surface_ids.get(int(surface_key))
+        if surface_id and feature_id:
+            surface_feature_rows.append({"surface_id": surface_id, "feature_id": feature_id})
+
+    process_index_map: Dict[int, str] = {}
+    process_operation_map: Dict[str, List[str]] = {}
+    process_rows = rows.setdefault("processes", [])
+    for process in para_dict.get("processes", []):
+        row, p_index = process_row(file_id, process)
+        process_rows.append(row)
+        process_index_map[p_index] = row["identifier"]
+        process_operation_map[row["identifier"]] = process.get("operationNames", [])
+
+    process_adjacent_rows = rows.setdefault("process_adjacent", [])
+    for left_idx, right_idx in para_dict.get("process_index", []):
+        left_id = process_index_map.get(left_idx)
+        right_id = process_index_map.get(right_idx)
+        if left_id and right_id and left_id != right_id:
+            process_adjacent_rows.append({"left_id": left_id, "right_id": right_id})
+
+    feature_process_rows = rows.setdefault("feature_process", [])
+    for fe_id, proc_idx in para_dict.get("feature_process", {}).items():
+        try:
+            feature_index = int(fe_id)
+            process_index_value = int(proc_idx)
+        except (TypeError, ValueError):
+            continue
+        feature_id = mf_idx_map.get(feature_index)
+        process_id = process_index_map.get(process_index_value)
+        if feature_id and process_id:
+            feature_process_rows.append({"feature_id": feature_id, "process_id": process_id})
+
+    process_operation_rows = rows.setdefault("process_operation", [])
+    for process_id, operation_names in process_operation_map.items():
+        for operation_name in operation_names:
+            operation_name = operation_name.strip()
+            if not operation_name:
+                continue
+            process_operation_rows.append({"process_id": process_id, "operation_name": operation_name})
+
+    return rows
+
+
+def build_multi_graph_rows(file_id: str, para_dict: dict) -> Dict[str, List[dict]]:
+    """Group the multi-graph payload into one row list per node/relationship kind."""
+    rows: Dict[str, List[dict]] = {}
+
+    surface_ids: Dict[str, str] = {}
+    face_rows = rows.setdefault("faces", [])
+    for face_key, face_payload in para_dict["face_dict"].items():
+        row = face_row(file_id, face_key, face_payload)
+        face_rows.append(row)
+        surface_ids[face_key] = row["identifier"]
+
+    curve_rows = rows.setdefault("curves", [])
+    curve_surface_rows = rows.setdefault("curve_surface", [])
+    for curve_key, curve_payload in para_dict.get("edge_dict", {}).items():
+        row = curve_row(file_id, curve_key, curve_payload)
+        curve_rows.append(row)
+        curve_surface_rows.extend(
+            _curve_surface_rows(row["identifier"], curve_payload.get("edge_idx", []), surface_ids)
+        )
+
+    rows.update(_topology_rows(file_id, para_dict, surface_ids))
+    return rows
+
+
+# 写入顺序：先节点后关系，保证 MATCH 能找到两端节点
+STAGE_QUERIES = (
+    ("faces", FACE_QUERY),
+    ("curves", CURVE_QUERY),
+    ("curve_surface", CURVE_SURFACE_QUERY),
+    ("features", FEATURE_QUERY),
+    ("feature_adjacent", FEATURE_ADJACENT_QUERY),
+    ("surface_feature", SURFACE_FEATURE_QUERY),
+    ("processes", PROCESS_QUERY),
+    ("process_adjacent", PROCESS_ADJACENT_QUERY),
+    ("feature_process", FEATURE_PROCESS_QUERY),
+    ("process_operation", PROCESS_OPERATION_QUERY),
+)
+
+
+EDGE_DELETE_QUERIES = {
+    "curve_surface": """
+        UNWIND $rows AS row
+        MATCH (:Curve {__id__: row.curve_id, __fileId__: $file_id})
+              -[r:BOUNDARY_OF]->(:Surface {__id__: row.surface_id, __fileId__: $file_id})
+        DELETE r
+        """,
+    "feature_adjacent": """
+        UNWIND $rows AS row
+        MATCH (:MachiningFeature {__id__: row.src_id, __fileId__: $file_id})
+              -[r:ADJACENT_MFEATURE]->(:MachiningFeature {__id__: row.tar_id, __fileId__: $file_id})
+        DELETE r
+        """,
+    "surface_feature": """
+        UNWIND $rows AS row
+        MATCH (:Surface {__id__: row.surface_id, __fileId__: $file_id})
+              -[r:BELONGS_TO_FEATURE]->(:MachiningFeature {__id__: row.feature_id, __fileId__: $file_id})
+        DELETE r
+        """,
+    "process_adjacent": """
+        UNWIND $rows AS row
+        MATCH (:ProcessUnit {__id__: row.left_id, __fileId__: $file_id})
+              -[r:ADJACENT_PROCESS]->(:ProcessUnit {__id__: row.right_id, __fileId__: $file_id})
+        DELETE r
+        """,
+    "feature_process": """
+        UNWIND $rows AS row
+        MATCH (:MachiningFeature {__id__: row.feature_id, __fileId__: $file_id})
+              -[r:ASSIGNED_TO_PROCESS]->(:ProcessUnit {__id__: row.process_id, __fileId__: $file_id})
+        DELETE r
+        """,
+    "process_operation": """
+        UNWIND $rows AS row
+        MATCH (:ProcessUnit {__id__: row.process_id, __fileId__: $file_id})
+              -[r:INCLUDES_OPERATION]->(:Operation {__fileId__: $prt_file_id, Name: row.operation_name})
+        DELETE r
+        """,
+}
+
+
+def _node_delete_query(label: str) -> str:
+    return f"""
+        UNWIND $rows AS row
+        MATCH (n:{label} {{__id__: row.identifier, __fileId__: $file_id}})
+        DETACH DELETE n
+        """
+
+
+def delete_multi_graph_rows(writer: BulkWriter, file_id: str, prt_file_id: str, rows: Dict[str, List[dict]]) -> Dict[str, int]:
+    """Delete the given relationship rows, then the given node rows (``{"identifier": ...}``)."""
+    deleted: Dict[str, int] = {}
+    for stage, cypher in EDGE_DELETE_QUERIES.items():
+        if rows.get(stage):
+            deleted[stage] = writer.write(f"delete_{stage}", cypher, rows[stage], file_id=file_id, prt_file_id=prt_file_id)
+    for stage, label in NODE_STAGE_LABELS.items():
+        if rows.get(stage):
+            deleted[stage] = writer.write(f"delete_{stage}", _node_delete_query(label), rows[stage], file_id=file_id)
+    return deleted
+
+
+def delete_file_graph(session, file_id: str) -> None:
+    """Remove every multi-graph node written for ``file_id`` (type nodes are shared and kept)."""
+    for label in NODE_STAGE_LABELS.values():
+        session.run(
+            f"""
+            MATCH (n:{label} {{__fileId__: $file_id}})
+            CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF 10000 ROWS
+            """,
+            file_id=file_id,
+        ).consume()
+
+
+def write_multi_graph_rows(writer: BulkWriter, file_id: str, prt_file_id: str, rows: Dict[str, List[dict]]) -> Dict[str, int]:
+    written: Dict[str, int] = {}
+    for stage, cypher in STAGE_QUERIES:
+        written[stage] = writer.write(stage, cypher, rows.get(stage, []), file_id=file_id, prt_file_id=prt_file_id)
+    return written
+
+
+def write_multi_graph_stream(writer: BulkWriter, file_id: str, prt_file_id: str, json_path,
+                             chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, int]:
+    """Load a multi-graph JSON file without parsing it whole.
+
+    Faces and curves are read entry by entry and flushed every ``writer.batch_size``
+    rows; only their identifiers and the small topology sections are kept until
+    the links are written at the end.
+    """
+    queries = dict(STAGE_QUERIES)
+    written = dict.fromkeys(queries, 0)
+    params = {"file_id": file_id, "prt_file_id": prt_file_id}
+    batches: Dict[str, List[dict]] = {"faces": [], "curves": []}
+    surface_ids: Dict[str, str] = {}
+    curve_links: List[Tuple[str, list]] = []
+    small_sections: dict = {}
+
+    def flush(stage: str) -> None:
+        written[stage] += writer.write(stage, queries[stage], batches[stage], **params)
+        batches[stage] = []
+
+    for section, key, value in iter_sections(json_path, chunk_size=chunk_size):
+        if section == "face_dict" and key is not None:
+            row = face_row(file_id, key, value)
+            surface_ids[key] = row["identifier"]
+            batches["faces"].append(row)
+            if len(batches["faces"]) >= writer.batch_size:
+                flush("faces")
+        elif section == "edge_dict" and key is not None:
+            row = curve_row(file_id, key, value)
+            curve_links.append((row["identifier"], value.get("edge_idx", [])))
+            batches["curves"].append(row)
+            if len(batches["curves"]) >= writer.batch_size:
+                flush("curves")
+        else:
+            small_sections[section] = value
+    flush("faces")
+    flush("curves")
+
+    # 曲线可能先于面出现，边界关系放到所有面写完后再解析
+    link_rows = [
+        link
+        for curve_id, linked_surfaces in curve_links
+        for link in _curve_surface_rows(curve_id, linked_surfaces, surface_ids)
+    ]
+    written["curve_surface"] += writer.write("curve_surface", queries["curve_surface"], link_rows, **params)
+
+    topology = _topology_rows(file_id, small_sections, surface_ids)
+    for stage, cypher in STAGE_QUERIES:
+        if stage in topology:
+            written[stage] += writer.write(stage, cypher, topology[stage], **params)
+    return written
+
+
+def write_multi_graph(writer: BulkWriter, file_id: str, prt_file_id: str, para_dict: dict) -> Dict[str, int]:
+    rows = build_multi_graph_rows(file_id, para_dict)
+    return write_multi_graph_rows(writer, file_id, prt_file_id, rows)
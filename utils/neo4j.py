@@ -1,18 +1,149 @@
-
+import asyncio
+import atexit
 import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
 
-from neo4j import GraphDatabase
+from neo4j import AsyncGraphDatabase, GraphDatabase
 
 
-def connect_neo4j(init=False):
+class PooledDriver:
+    """A shared neo4j driver that counts the sessions borrowed from its connection pool."""
+
+    def __init__(self, name: str, driver, max_pool_size: int) -> None:
+        self.name = name
+        self.driver = driver
+        self.max_pool_size = max_pool_size
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._sessions_opened = 0
+        self._hold_seconds = 0.0
+
+    @contextmanager
+    def session(self, **kwargs):
+        with self._lock:
+            self._in_use += 1
+            self._sessions_opened += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        start = time.perf_counter()
+        session = self.driver.session(**kwargs)
+        try:
+            yield session
+        finally:
+            session.close()
+            with self._lock:
+                self._in_use -= 1
+                self._hold_seconds += time.perf_counter() - start
+
+    def metrics(self) -> Dict[str, float]:
+        with self._lock:
+            opened = self._sessions_opened
+            return {
+                "max_pool_size": self.max_pool_size,
+                # 统计的是借出的 session 数，不是驱动连接池里实际占用的连接数
+                "sessions_in_use": self._in_use,
+                "sessions_peak": self._peak_in_use,
+                "sessions_opened": opened,
+                "avg_session_seconds": self._hold_seconds / opened if opened else 0.0,
+            }
+
+    def close(self) -> None:
+        with _REGISTRY_LOCK:
+            if _DRIVERS.get(self.name) is self:
+                del _DRIVERS[self.name]
+        self.driver.close()
+
+    def __getattr__(self, item):
+        return getattr(self.driver, item)
+
+
+_DRIVERS: Dict[str, PooledDriver] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _driver_settings(config: dict) -> Tuple[str, tuple, int, dict]:
     neo4j_username = os.environ.get("NEO4J_USER", "neo4j")
     neo4j_password = os.environ.get("NEO4J_PASSWORD")
     neo4j_host = os.environ.get("NEO4J_HOST", "localhost")
-    print(f"{neo4j_host}  {neo4j_username}  {neo4j_password}")
+    uri = config.pop("uri", f"neo4j://{neo4j_host}:7687")
+    auth = config.pop("auth", (neo4j_username, neo4j_password))
+    max_pool_size = int(config.pop("max_connection_pool_size", os.environ.get("NEO4J_MAX_POOL_SIZE", 50)))
+    config.setdefault("connection_acquisition_timeout",
+                      float(os.environ.get("NEO4J_ACQUISITION_TIMEOUT", 60)))
+    config.setdefault("liveness_check_timeout", float(os.environ.get("NEO4J_LIVENESS_CHECK", 30)))
+    return uri, auth, max_pool_size, config
+
+
+def get_driver(name: str = "default", **config) -> PooledDriver:
+    """Return the process-wide driver registered under ``name``, creating it on first use.
+
+    Pool settings come from ``config`` or the NEO4J_* environment variables:
+    NEO4J_MAX_POOL_SIZE, NEO4J_ACQUISITION_TIMEOUT and NEO4J_LIVENESS_CHECK (seconds).
+    """
+    with _REGISTRY_LOCK:
+        pooled = _DRIVERS.get(name)
+        if pooled is not None:
+            return pooled
+
+        uri, auth, max_pool_size, config = _driver_settings(config)
+        # 注意，这里的用户名为neo4j全局用户名，而非DBMS或者database的名称
+        driver = GraphDatabase.driver(uri, auth=auth, max_connection_pool_size=max_pool_size, **config)
+        pooled = PooledDriver(name, driver, max_pool_size)
+        _DRIVERS[name] = pooled
+        return pooled
+
+
+# 异步 driver 绑定创建它的事件循环，按 (name, loop) 缓存
+_ASYNC_DRIVERS: Dict[Tuple[str, int], object] = {}
+
+
+def get_async_driver(name: str = "default", **config):
+    """Async counterpart of ``get_driver`` for the running event loop; call it from a coroutine."""
+    key = (name, id(asyncio.get_running_loop()))
+    with _REGISTRY_LOCK:
+        driver = _ASYNC_DRIVERS.get(key)
+        if driver is None:
+            uri, auth, max_pool_size, config = _driver_settings(config)
+            driver = AsyncGraphDatabase.driver(uri, auth=auth, max_connection_pool_size=max_pool_size, **config)
+            _ASYNC_DRIVERS[key] = driver
+        return driver
+
+
+async def close_async_drivers() -> None:
+    """Close the async drivers of the running event loop; call before the loop shuts down."""
+    loop_id = id(asyncio.get_running_loop())
+    with _REGISTRY_LOCK:
+        keys = [key for key in _ASYNC_DRIVERS if key[1] == loop_id]
+        drivers = [_ASYNC_DRIVERS.pop(key) for key in keys]
+    for driver in drivers:
+        await driver.close()
+
+
+def pool_metrics() -> Dict[str, Dict[str, float]]:
+    with _REGISTRY_LOCK:
+        drivers = list(_DRIVERS.values())
+    return {pooled.name: pooled.metrics() for pooled in drivers}
+
+
+def close_all() -> None:
+    with _REGISTRY_LOCK:
+        drivers = list(_DRIVERS.values())
+    for pooled in drivers:
+        pooled.close()
+
+
+atexit.register(close_all)
+
+
+def connect_neo4j(init=False):
+    neo4j_username = os.environ.get("NEO4J_USER", "neo4j")
+    neo4j_host = os.environ.get("NEO4J_HOST", "localhost")
+    print(f"{neo4j_host}  {neo4j_username}")
 
-    # 注意，这里的用户名为neo4j全局用户名，而非DBMS或者database的名称
-    driver = GraphDatabase.driver(f'neo4j://{neo4j_host}:7687',
-                    auth=(neo4j_username, neo4j_password))
+    driver = get_driver()
     if init == True:
         with driver.session() as session:
             session.run("MATCH (n) DETACH DELETE n")
@@ -43,5 +174,3 @@ if __name__ == "__main__":
     driver.close()
     '''
     pass
-
-
@@ -0,0 +1,117 @@
+import re
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from utils.neo4j import get_async_driver, get_driver
+from utils.vector_index import EMBEDDING_PROPERTY, VECTOR_INDEXES
+
+
+# 向量 Top-K 种子 + Surface→MachiningFeature→ProcessUnit→Operation→Tool 多跳扩展，一次往返
+SURFACE_CHAIN_QUERY = """
+CALL db.index.vector.queryNodes($index_name, $k, $vector) YIELD node AS surface, score
+OPTIONAL MATCH (surface)-[:BELONGS_TO_FEATURE]->(feature:MachiningFeature)
+OPTIONAL MATCH (feature)-[:ASSIGNED_TO_PROCESS]->(process:ProcessUnit)
+OPTIONAL MATCH (process)-[:INCLUDES_OPERATION]->(operation:Operation)
+OPTIONAL MATCH (operation)-[:USES_TOOL]->(tool:Tool)
+WITH surface, score, feature, process, operation, collect(DISTINCT tool {.*}) AS tools
+WITH surface, score, feature, process,
+     collect(CASE WHEN operation IS NULL THEN NULL ELSE operation {.*, tools: tools} END) AS operations
+WITH surface, score, feature,
+     collect(CASE WHEN process IS NULL THEN NULL ELSE process {.*, operations: operations} END) AS processes
+WITH surface, score,
+     collect(CASE WHEN feature IS NULL THEN NULL ELSE feature {.*, processes: processes} END) AS features
+RETURN surface {.*} AS surface, score, features
+ORDER BY score DESC
+"""
+
+
+# Surface→MachiningFeature→ProcessUnit→Operation→Tool 链上每类节点的下一跳关系
+NEXT_HOPS = {
+    "Surface": "BELONGS_TO_FEATURE",
+    "MachiningFeature": "ASSIGNED_TO_PROCESS",
+    "ProcessUnit": "INCLUDES_OPERATION",
+    "Operation": "USES_TOOL",
+}
+# 加载器生成的 __id__ 形如 MachiningFeature_455b0c2e9f1a3d7b，前缀即标签
+NODE_ID_PATTERN = re.compile(r"^([A-Za-z][A-Za-z0-9]*)_[0-9a-f]{16}$")
+EXPANSION_MODES = ("neighbors", "label_counts")
+
+# 按 __id__ 定位种子做一跳扩展；查询文本只随标签变化，参数排序后可直接命中查询缓存
+NEIGHBOR_QUERY = """
+MATCH (seed:`{label}`) WHERE seed.__id__ IN $ids
+MATCH (seed)-[r]->(neighbor)
+WHERE size($relationship_types) = 0 OR type(r) IN $relationship_types
+RETURN seed.__id__ AS seed, type(r) AS relationship, labels(neighbor) AS labels, neighbor {{.*}} AS neighbor
+ORDER BY seed, relationship
+"""
+NEIGHBOR_LABEL_COUNT_QUERY = """
+MATCH (seed:`{label}`) WHERE seed.__id__ IN $ids
+MATCH (seed)-[r]-(neighbor)
+WHERE size($relationship_types) = 0 OR type(r) IN $relationship_types
+RETURN type(r) AS relationship, labels(neighbor) AS labels, count(DISTINCT neighbor) AS count
+ORDER BY count DESC
+"""
+
+
+def group_node_ids(ids: Iterable[str]) -> Dict[str, List[str]]:
+    """Group loader ``__id__`` values by the label in their prefix; other values are ignored."""
+    groups: Dict[str, List[str]] = {}
+    for node_id in ids:
+        match = NODE_ID_PATTERN.match(str(node_id))
+        if match:
+            groups.setdefault(match.group(1), []).append(str(node_id))
+    return {label: sorted(set(values)) for label, values in groups.items()}
+
+
+def expansion_queries(ids: Iterable[str], relationship_types: Iterable[str] = (),
+                      mode: str = "neighbors") -> List[Tuple[str, Dict[str, Any]]]:
+    """``(cypher, params)`` per label for a 1-hop expansion of the given ``__id__`` seeds.
+
+    ``neighbors`` follows outgoing relationships, ``label_counts`` counts the
+    neighbours in both directions by relationship type and labels.
+    """
+    if mode not in EXPANSION_MODES:
+        raise ValueError(f"Unknown expansion mode {mode!r}, expected one of {EXPANSION_MODES}.")
+    template = NEIGHBOR_QUERY if mode == "neighbors" else NEIGHBOR_LABEL_COUNT_QUERY
+    types = sorted(set(relationship_types or ()))
+    return [
+        (template.format(label=label), {"ids": label_ids, "relationship_types": types})
+        for label, label_ids in sorted(group_node_ids(ids).items())
+    ]
+
+
+def _strip_embeddings(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _strip_embeddings(item) for key, item in value.items() if key != EMBEDDING_PROPERTY}
+    if isinstance(value, list):
+        return [_strip_embeddings(item) for item in value]
+    return value
+
+
+def retrieve_surface_chain(vector: Sequence[float], k: int = 3, driver=None) -> List[Dict[str, Any]]:
+    """Find the ``k`` most similar surfaces and expand each one down to its tools.
+
+    Every entry holds ``surface``, ``score`` and nested ``features`` ->
+    ``processes`` -> ``operations`` -> ``tools``; embeddings are left out.
+    """
+    driver = driver or get_driver()
+    with driver.session() as session:
+        result = session.run(
+            SURFACE_CHAIN_QUERY,
+            index_name=VECTOR_INDEXES["Surface"],
+            k=k,
+            vector=[float(value) for value in vector],
+        )
+        return [_strip_embeddings(record.data()) for record in result]
+
+
+async def aretrieve_surface_chain(vector: Sequence[float], k: int = 3, driver=None) -> List[Dict[str, Any]]:
+    """``retrieve_surface_chain`` on the async driver."""
+    driver = driver or get_async_driver()
+    async with driver.session() as session:
+        result = await session.run(
+            SURFACE_CHAIN_QUERY,
+            index_name=VECTOR_INDEXES["Surface"],
+            k=k,
+            vector=[float(value) for value in vector],
+        )
+        return [_strip_embeddings(record) for record in await result.data()]
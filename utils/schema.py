@@ -0,0 +1,169 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Tuple
+
+from neo4j.exceptions import Neo4jError
+
+
+@dataclass(frozen=True)
+class SchemaKey:
+    """A property lookup used by the loaders; backed by a constraint (unique) or a range index."""
+    label: str
+    properties: Tuple[str, ...]
+    unique: bool = False
+
+    @property
+    def name(self) -> str:
+        raw = "_".join((self.label,) + self.properties + ("uniq" if self.unique else "idx",))
+        return re.sub(r"_+", "_", re.sub(r"\W", "_", raw)).strip("_").lower()
+
+    def _pattern(self) -> str:
+        return f"(n:`{self.label}`)"
+
+    def _property_list(self) -> str:
+        return ", ".join(f"n.`{prop}`" for prop in self.properties)
+
+    def create_statement(self) -> str:
+        if self.unique:
+            return (f"CREATE CONSTRAINT {self.name} IF NOT EXISTS "
+                    f"FOR {self._pattern()} REQUIRE ({self._property_list()}) IS UNIQUE")
+        return f"CREATE INDEX {self.name} IF NOT EXISTS FOR {self._pattern()} ON ({self._property_list()})"
+
+    def probe_statement(self) -> str:
+        match_props = ", ".join(f"`{prop}`: $p{idx}" for idx, prop in enumerate(self.properties))
+        return f"EXPLAIN MATCH (n:`{self.label}` {{{match_props}}}) RETURN n"
+
+    def probe_params(self) -> Dict[str, str]:
+        return {f"p{idx}": "" for idx in range(len(self.properties))}
+
+
+# 每个 loader 的 MERGE / MATCH 键
+LOADER_KEYS: Dict[str, Tuple[SchemaKey, ...]] = {
+    "file_context": (
+        SchemaKey("File", ("Hash",), unique=True),
+        SchemaKey("FileGroup", ("Name",), unique=True),
+    ),
+    "part": (
+        SchemaKey("Part", ("PartId",), unique=True),
+        SchemaKey("Part", ("Hash",)),
+    ),
+    "multi_graph": (
+        SchemaKey("Surface", ("__id__", "__fileId__"), unique=True),
+        SchemaKey("Surface", ("__fileId__", "__index__")),
+        SchemaKey("SurfaceType", ("name", "index"), unique=True),
+        SchemaKey("Curve", ("__id__", "__fileId__"), unique=True),
+        SchemaKey("CurveType", ("name", "index"), unique=True),
+        SchemaKey("MachiningFeature", ("__id__", "__fileId__"), unique=True),
+        SchemaKey("MachiningFeature", ("__fileId__", "__index__")),
+        SchemaKey("MachiningFeatureType", ("name",), unique=True),
+        SchemaKey("ProcessUnit", ("__id__", "__fileId__"), unique=True),
+        SchemaKey("ProcessUnitType", ("name",), unique=True),
+    ),
+    "process_kg": (
+        SchemaKey("Operation", ("__id__", "__fileId__"), unique=True),
+        SchemaKey("Operation", ("__fileId__", "Tag")),
+        SchemaKey("Operation", ("__fileId__", "Name")),
+        SchemaKey("OperationType", ("name",), unique=True),
+        SchemaKey("Tool", ("__id__", "__fileId__"), unique=True),
+        SchemaKey("Tool", ("__fileId__", "Tag")),
+        SchemaKey("ToolType", ("name",), unique=True),
+        SchemaKey("SubToolType", ("name",), unique=True),
+        SchemaKey("Geometry", ("__id__", "__fileId__"), unique=True),
+        SchemaKey("Geometry", ("__fileId__", "Tag")),
+        SchemaKey("GeometryType", ("name",), unique=True),
+    ),
+    "graph_version": (
+        SchemaKey("__Meta__", ("key",), unique=True),
+    ),
+    "legacy": (
+        SchemaKey("Surface", ("Id",), unique=True),
+        SchemaKey("Curve", ("Id",), unique=True),
+        SchemaKey("MachiningFeature", ("Id",), unique=True),
+        SchemaKey("Process", ("Id",), unique=True),
+        SchemaKey("Process", ("PartId", "ProcessIndex")),
+        SchemaKey("__Operation__", ("Id",), unique=True),
+        SchemaKey("__Operation__", ("PartId", "Tag")),
+        SchemaKey("__Tool__", ("Id",), unique=True),
+        SchemaKey("__Tool__", ("PartId", "Tag")),
+        SchemaKey("FeatureGeometry", ("Id",), unique=True),
+        SchemaKey("FeatureGeometry", ("PartId", "Tag")),
+        SchemaKey("OrientGeometry", ("Id",), unique=True),
+        SchemaKey("OrientGeometry", ("PartId", "Tag")),
+    ),
+}
+
+INDEX_SEEK_OPERATORS = (
+    "NodeIndexSeek",
+    "NodeUniqueIndexSeek",
+    "MultiNodeIndexSeek",
+    "AssertingMultiNodeIndexSeek",
+    "NodeIndexSeekByRange",
+    "NodeUniqueIndexSeekByRange",
+)
+
+
+def all_schema_keys(loaders: Iterable[str] = None) -> List[SchemaKey]:
+    names = list(loaders) if loaders is not None else list(LOADER_KEYS)
+    keys: List[SchemaKey] = []
+    for name in names:
+        for key in LOADER_KEYS[name]:
+            if key not in keys:
+                keys.append(key)
+    return keys
+
+
+def ensure_schema(driver, loaders: Iterable[str] = None) -> Dict[str, str]:
+    """Create the constraints and indexes behind every loader key; safe to run repeatedly."""
+    status: Dict[str, str] = {}
+    with driver.session() as session:
+        for key in all_schema_keys(loaders):
+            try:
+                session.run(key.create_statement()).consume()
+                status[key.name] = "ok"
+            except Neo4jError as e:
+                # 已有重复数据时唯一约束会失败，不影响其他键
+                status[key.name] = f"failed: {e.code}"
+                print(f"Create {key.name} failed: {e.message}")
+        session.run("CALL db.awaitIndexes(300)").consume()
+    return status
+
+
+def _plan_operators(plan) -> List[str]:
+    if not plan:
+        return []
+    operator = plan.get("operatorType", "").split("@")[0]
+    operators = [operator]
+    for child in plan.get("children", []):
+        operators.extend(_plan_operators(child))
+    return operators
+
+
+def verify_schema(driver, loaders: Iterable[str] = None) -> Dict[str, List[str]]:
+    """EXPLAIN every loader lookup and return the ones whose plan does not use an index seek."""
+    unbacked: Dict[str, List[str]] = {}
+    names = list(loaders) if loaders is not None else list(LOADER_KEYS)
+    with driver.session() as session:
+        for name in names:
+            for key in LOADER_KEYS[name]:
+                summary = session.run(key.probe_statement(), key.probe_params()).consume()
+                operators = _plan_operators(summary.plan)
+                if not any(op in INDEX_SEEK_OPERATORS for op in operators):
+                    unbacked.setdefault(name, []).append(f"{key.label}{list(key.properties)}: {operators}")
+    return unbacked
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from utils.neo4j import connect_neo4j
+
+    load_dotenv()
+    driver = connect_neo4j(init=False)
+    for key_name, key_status in ensure_schema(driver).items():
+        print(f"{key_name}: {key_status}")
+    missing = verify_schema(driver)
+    if missing:
+        for loader_name, lookups in missing.items():
+            print(f"[{loader_name}] lookups without index: {lookups}")
+    else:
+        print("All loader lookups are backed by an index.")
+    driver.close()
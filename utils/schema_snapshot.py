@@ -0,0 +1,186 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from utils.graph_version import META_LABEL, get_graph_version
+from utils.neo4j import get_driver
+
+DEFAULT_SNAPSHOT_PATH = "schema_snapshot.json"
+# 两次图谱版本检查之间的最短间隔（秒）
+VERSION_CHECK_INTERVAL = 30.0
+PROPERTY_SAMPLE_SIZE = 50
+# 摘要里不展示的大字段
+HIDDEN_PROPERTIES = ("embedding",)
+
+
+@dataclass
+class SchemaSnapshot:
+    graph_version: int
+    labels: List[str] = field(default_factory=list)
+    relationship_types: List[str] = field(default_factory=list)
+    property_keys: List[str] = field(default_factory=list)
+    patterns: List[str] = field(default_factory=list)
+    indexes: List[Dict[str, Any]] = field(default_factory=list)
+    label_properties: Dict[str, List[str]] = field(default_factory=dict)
+    fetched_at: float = 0.0
+
+    def summary(self) -> str:
+        """Compact text for the agent prompt: labels with sampled properties, relationship patterns, indexes."""
+        # 不写 graph_version：版本号每次入库都变，会让提示词和 LLM 缓存键跟着变
+        lines = ["labels:"]
+        for label in self.labels:
+            properties = [key for key in self.label_properties.get(label, []) if key not in HIDDEN_PROPERTIES]
+            lines.append(f"  {label}({', '.join(properties)})")
+        lines.append("relationships:")
+        lines.extend(f"  {pattern}" for pattern in self.patterns)
+        lines.append("indexes:")
+        for index in self.indexes:
+            lines.append(
+                f"  {index['name']} {index['type']} on {','.join(index['labels'] or [])}"
+                f"({','.join(index['properties'] or [])})"
+            )
+        return "\n".join(lines)
+
+
+def fetch_schema_snapshot(driver, sample_size: int = PROPERTY_SAMPLE_SIZE) -> SchemaSnapshot:
+    """Read labels, relationship types, property keys, relationship patterns, indexes and per-label property samples."""
+    with driver.session() as session:
+        version = session.run(
+            f"OPTIONAL MATCH (m:{META_LABEL} {{key: 'graph'}}) RETURN coalesce(m.version, 0) AS version"
+        ).single()["version"]
+        labels = [label for label in session.run("CALL db.labels() YIELD label RETURN label").value()
+                  if label != META_LABEL]
+        relationship_types = session.run(
+            "CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType"
+        ).value()
+        property_keys = session.run("CALL db.propertyKeys() YIELD propertyKey RETURN propertyKey").value()
+        patterns = []
+        record = session.run("CALL db.schema.visualization() YIELD relationships RETURN relationships").single()
+        for relationship in record["relationships"] if record else []:
+            start, end = relationship.nodes
+            start_label = next(iter(start.labels), "")
+            end_label = next(iter(end.labels), "")
+            pattern = f"({start_label})-[:{relationship.type}]->({end_label})"
+            if META_LABEL not in (start_label, end_label) and pattern not in patterns:
+                patterns.append(pattern)
+        indexes = [
+            record.data()
+            for record in session.run(
+                "SHOW INDEXES YIELD name, type, entityType, labelsOrTypes, properties, state "
+                "RETURN name, type, entityType, labelsOrTypes AS labels, properties, state"
+            )
+            if META_LABEL not in (record["labelsOrTypes"] or [])
+        ]
+        label_properties = {}
+        for label in labels:
+            label_properties[label] = session.run(
+                f"""
+                MATCH (n:`{label}`) WITH n LIMIT $sample_size
+                UNWIND keys(n) AS key
+                RETURN DISTINCT key ORDER BY key
+                """,
+                sample_size=sample_size,
+            ).value()
+    return SchemaSnapshot(
+        graph_version=int(version),
+        labels=sorted(labels),
+        relationship_types=sorted(relationship_types),
+        property_keys=sorted(property_keys),
+        patterns=sorted(patterns),
+        indexes=indexes,
+        label_properties=label_properties,
+        fetched_at=time.time(),
+    )
+
+
+class SchemaSnapshotCache:
+    """Schema snapshot kept in memory and on disk, refetched only when the graph version moves.
+
+    The version is checked at most every ``check_interval`` seconds, so a
+    prompt build normally costs no database round trip at all.
+    """
+
+    def __init__(self, path: str = None, check_interval: float = VERSION_CHECK_INTERVAL, driver=None) -> None:
+        self.path = path or os.environ.get("SCHEMA_SNAPSHOT_PATH", DEFAULT_SNAPSHOT_PATH)
+        self.check_interval = check_interval
+        self.driver = driver
+        self._lock = threading.Lock()
+        self._snapshot: Optional[SchemaSnapshot] = None
+        self._checked_at = 0.0
+
+    def _load(self) -> Optional[SchemaSnapshot]:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return SchemaSnapshot(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def _save(self, snapshot: SchemaSnapshot) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(snapshot), f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, self.path)
+
+    def invalidate(self) -> None:
+        """Force a version check on the next ``get`` (e.g. after an ingestion event in this process)."""
+        with self._lock:
+            self._checked_at = 0.0
+
+    def get(self) -> SchemaSnapshot:
+        with self._lock:
+            now = time.time()
+            if self._snapshot is not None and now - self._checked_at < self.check_interval:
+                return self._snapshot
+            driver = self.driver or get_driver()
+            snapshot = self._snapshot or self._load()
+            try:
+                version = get_graph_version(driver)
+            except Exception as e:
+                # 数据库不可达（如离线回放）时沿用已有快照
+                if snapshot is None:
+                    raise
+                print(f"Graph version check failed, using cached schema snapshot: {e}")
+                self._snapshot = snapshot
+                self._checked_at = now
+                return snapshot
+            if snapshot is None or snapshot.graph_version != version:
+                snapshot = fetch_schema_snapshot(driver)
+                self._save(snapshot)
+            self._snapshot = snapshot
+            self._checked_at = now
+            return snapshot
+
+    def summary(self) -> str:
+        return self.get().summary()
+
+
+_default_cache: Optional[SchemaSnapshotCache] = None
+
+
+def get_schema_cache() -> SchemaSnapshotCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = SchemaSnapshotCache()
+    return _default_cache
+
+
+async def load_schema_summary() -> str:
+    """Cached schema summary for the agent prompt; empty when it cannot be read, so the agent falls back to Step1."""
+    try:
+        return await asyncio.to_thread(get_schema_cache().summary)
+    except Exception as e:
+        print(f"Schema snapshot unavailable: {e}")
+        return ""
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    print(get_schema_cache().summary())
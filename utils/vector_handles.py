@@ -0,0 +1,82 @@
+import hashlib
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+
+# 查询向量登记在服务端，提示词与工具参数里只传短句柄
+HANDLE_PREFIX = "vec_"
+HANDLE_PATTERN = re.compile(r"^vec_[0-9a-f]{16}$")
+MAX_HANDLES = int(os.environ.get("VECTOR_HANDLE_MAX", 4096))
+
+
+class VectorRegistry:
+    """Content-addressed float32 vectors referenced by short handles such as ``vec_1a2b3c4d5e6f7a8b``."""
+
+    def __init__(self, max_handles: int = MAX_HANDLES) -> None:
+        self.max_handles = max_handles
+        self._lock = threading.Lock()
+        self._vectors: "OrderedDict[str, array]" = OrderedDict()
+
+    def register(self, vector: Sequence[float]) -> str:
+        buffer = vector if isinstance(vector, array) and vector.typecode == "f" else array("f", vector)
+        handle = HANDLE_PREFIX + hashlib.blake2b(buffer.tobytes(), digest_size=8).hexdigest()
+        with self._lock:
+            self._vectors[handle] = buffer
+            self._vectors.move_to_end(handle)
+            while len(self._vectors) > self.max_handles:
+                self._vectors.popitem(last=False)
+        return handle
+
+    def get(self, handle: str) -> Optional[array]:
+        with self._lock:
+            buffer = self._vectors.get(handle)
+            if buffer is not None:
+                self._vectors.move_to_end(handle)
+            return buffer
+
+    def resolve(self, handle: str) -> list:
+        buffer = self.get(handle)
+        if buffer is None:
+            raise ValueError(f"Unknown vector handle {handle!r}; it may have expired, register the vector again.")
+        return buffer.tolist()
+
+    def resolve_params(self, value: Any) -> Any:
+        """Replace every handle string inside Cypher parameters by its float list."""
+        if isinstance(value, str) and HANDLE_PATTERN.match(value):
+            return self.resolve(value)
+        if isinstance(value, dict):
+            return {key: self.resolve_params(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.resolve_params(item) for item in value]
+        return value
+
+
+_registry: Optional[VectorRegistry] = None
+
+
+def get_vector_registry() -> VectorRegistry:
+    global _registry
+    if _registry is None:
+        _registry = VectorRegistry()
+    return _registry
+
+
+def register_vector(vector: Sequence[float]) -> str:
+    return get_vector_registry().register(vector)
+
+
+def resolve_vector_params(value: Any) -> Any:
+    return get_vector_registry().resolve_params(value)
+
+
+def with_vector_handles(propertys: dict, keys: Sequence[str] = ("embedding",)) -> dict:
+    """Copy of ``propertys`` whose vector fields are registered and replaced by their handles."""
+    compact = dict(propertys)
+    for key in keys:
+        vector = compact.get(key)
+        if isinstance(vector, (list, tuple, array)) and vector:
+            compact[key] = register_vector(vector)
+    return compact
@@ -0,0 +1,151 @@
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from utils.graph_version import bump_graph_version
+from utils.neo4j import get_driver
+
+
+# label -> 向量索引名
+VECTOR_INDEXES: Dict[str, str] = {
+    "Surface": "surface_embedding_idx",
+    "MachiningFeature": "machiningfeature_embedding_idx",
+}
+
+EMBEDDING_PROPERTY = "embedding"
+SIMILARITY_FUNCTION = "cosine"
+# 带过滤条件时多取候选，再在图内过滤；剩下的不够 k 个就按倍数扩大候选集，直到索引取尽或到上限
+FILTER_OVERFETCH = 10
+MAX_FILTER_CANDIDATES = 100000
+
+
+@dataclass
+class VectorHit:
+    node_id: str
+    label: str
+    score: float
+    properties: Dict[str, Any] = field(default_factory=dict)
+
+
+def _index_name(label: str) -> str:
+    try:
+        return VECTOR_INDEXES[label]
+    except KeyError:
+        raise ValueError(f"No vector index declared for label {label!r}.") from None
+
+
+def _existing_dimensions(session, index_name: str) -> Optional[int]:
+    record = session.run(
+        """
+        SHOW VECTOR INDEXES YIELD name, options
+        WHERE name = $index_name
+        RETURN options.indexConfig['vector.dimensions'] AS dimensions
+        """,
+        index_name=index_name,
+    ).single()
+    if record is None:
+        return None
+    return int(record["dimensions"])
+
+
+def detect_embedding_dim(driver, label: str) -> Optional[int]:
+    """Read the dimension test7 stored in ``embeddingDim`` for ``label``."""
+    with driver.session() as session:
+        record = session.run(
+            f"MATCH (n:`{label}`) WHERE n.embeddingDim IS NOT NULL RETURN n.embeddingDim AS dim LIMIT 1"
+        ).single()
+    return int(record["dim"]) if record else None
+
+
+def ensure_vector_index(driver, label: str, dimensions: Optional[int] = None) -> Optional[str]:
+    """Create the vector index for ``label``, or rebuild it when the embedding dimension changed."""
+    index_name = _index_name(label)
+    if dimensions is None:
+        dimensions = detect_embedding_dim(driver, label)
+    if not dimensions:
+        print(f"Skip vector index {index_name}: no {label} embeddings found.")
+        return None
+
+    with driver.session() as session:
+        existing = _existing_dimensions(session, index_name)
+        if existing == dimensions:
+            return index_name
+        if existing is not None:
+            print(f"Rebuild vector index {index_name}: dimensions {existing} -> {dimensions}")
+            session.run(f"DROP INDEX {index_name} IF EXISTS").consume()
+        session.run(
+            f"""
+            CREATE VECTOR INDEX {index_name} IF NOT EXISTS
+            FOR (n:`{label}`) ON n.{EMBEDDING_PROPERTY}
+            OPTIONS {{indexConfig: {{
+                `vector.dimensions`: $dimensions,
+                `vector.similarity_function`: $similarity
+            }}}}
+            """,
+            dimensions=dimensions,
+            similarity=SIMILARITY_FUNCTION,
+        ).consume()
+        session.run("CALL db.awaitIndex($index_name, 300)", index_name=index_name).consume()
+    bump_graph_version(driver, source=f"vector_index:{index_name}")
+    return index_name
+
+
+def ensure_vector_indexes(driver, dimensions: Optional[int] = None) -> Dict[str, Optional[str]]:
+    return {label: ensure_vector_index(driver, label, dimensions) for label in VECTOR_INDEXES}
+
+
+def top_k(
+    label: str,
+    vector: Sequence[float],
+    k: int = 3,
+    filters: Optional[Dict[str, Any]] = None,
+    driver=None,
+) -> List[VectorHit]:
+    """Return the ``k`` nodes of ``label`` closest to ``vector``, optionally filtered by property equality.
+
+    With ``filters`` the candidate set grows by ``FILTER_OVERFETCH`` until ``k``
+    hits pass the filter or the index has no more nodes. Fewer than ``k`` hits
+    then means there are no more matching nodes; hitting
+    ``MAX_FILTER_CANDIDATES`` first is reported.
+    """
+    if k <= 0:
+        return []
+    driver = driver or get_driver()
+    filters = filters or {}
+    candidates = k * FILTER_OVERFETCH if filters else k
+    vector = [float(value) for value in vector]
+    with driver.session() as session:
+        while True:
+            record = session.run(
+                """
+                CALL db.index.vector.queryNodes($index_name, $candidates, $vector)
+                YIELD node, score
+                WITH collect({node: node, score: score}) AS found
+                RETURN size(found) AS fetched,
+                       [hit IN found WHERE all(key IN keys($filters) WHERE hit.node[key] = $filters[key])][..$k] AS hits
+                """,
+                index_name=_index_name(label),
+                candidates=candidates,
+                vector=vector,
+                filters=filters,
+                k=k,
+            ).single()
+            found = record["hits"]
+            if len(found) >= k or record["fetched"] < candidates:
+                break
+            if candidates >= MAX_FILTER_CANDIDATES:
+                print(f"top_k({label}): only {len(found)}/{k} hits match {filters} "
+                      f"among the nearest {candidates} nodes.")
+                break
+            candidates = min(candidates * FILTER_OVERFETCH, MAX_FILTER_CANDIDATES)
+
+    hits = []
+    for hit in found:
+        properties = dict(hit["node"])
+        properties.pop(EMBEDDING_PROPERTY, None)
+        hits.append(VectorHit(
+            node_id=properties.get("__id__"),
+            label=label,
+            score=float(hit["score"]),
+            properties=properties,
+        ))
+    return hits